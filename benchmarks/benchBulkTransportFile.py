@@ -0,0 +1,99 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares staging one SDP file onto every receiver of a multiviewer using
+# the standard bulk endpoint, which carries a copy of the file per receiver,
+# with the bulk transport_file extension, which carries it once, and then
+# with a file that is already staged, which is skipped. Requests go
+# through the Flask test client so JSON decoding and schema validation are
+# included. Run from the repository root:
+#
+#     python benchmarks/benchBulkTransportFile.py
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+
+__location__ = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(__location__, ".."))
+
+from nmosconnection.api import ConnectionManagementAPI  # noqa: E402
+from nmosconnection.rtpReceiver import RtpReceiver  # noqa: E402
+from nmosconnection.sdpManager import SdpManager  # noqa: E402
+
+RECEIVERS = 64
+REQUESTS = 50
+SCHEMA_PATH = os.path.join(__location__, "..", "share", "ipp-connectionmanagement", "schemas") + "/"
+ROOT = "/x-nmos/connection/v1.0/bulk/receivers"
+HEADERS = {'Content-Type': 'application/json'}
+
+with open(os.path.join(__location__, "..", "tests", "examples", "st2110-20-2022-7.sdp")) as f:
+    SDP = f.read()
+TRANSPORT_FILE = {"type": "application/sdp", "data": SDP}
+
+
+class QuietLogger:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def provision(logger):
+    dut = ConnectionManagementAPI(logger)
+    dut.schemaPath = SCHEMA_PATH
+    receiverIds = []
+    for index in range(0, RECEIVERS):
+        receiver = RtpReceiver(logger, SdpManager, 2)
+        receiver.schemaPath = SCHEMA_PATH
+        receiver.addInterface("192.168.100.1", 0)
+        receiver.addInterface("192.168.101.1", 1)
+        receiverId = "receiver-{}".format(index)
+        dut.addReceiver(receiver, receiverId)
+        receiverIds.append(receiverId)
+    return dut, receiverIds
+
+
+def timed(name, client, url, body, vary=True):
+    start = time.time()
+    for count in range(0, REQUESTS):
+        # Unless told otherwise each request carries a different file, so
+        # neither the parse cache nor the check for unchanged files can help
+        sdp = SDP + "a=x-request:{}\n".format(count) if vary else SDP
+        data = json.dumps(body(dict(TRANSPORT_FILE, data=sdp)))
+        response = client.post(url, headers=HEADERS, data=data)
+        assert response.status_code == 200, response.data
+    elapsed = time.time() - start
+    print("{:<24} {:>8.1f}kB {:>8.2f}ms/request".format(
+        name, len(data) / 1e3, elapsed * 1e3 / REQUESTS))
+
+
+def main():
+    dut, receiverIds = provision(QuietLogger())
+    client = dut.app.test_client()
+    print("{} two-leg receivers".format(RECEIVERS))
+    timed("bulk/receivers", client, ROOT, lambda transportFile: [
+        {"id": receiverId, "params": {"transport_file": transportFile}} for receiverId in receiverIds
+    ])
+
+    def bulkTransportFile(transportFile):
+        return {"transport_file": transportFile, "receiver_ids": receiverIds}
+
+    timed("bulk transport_file", client, ROOT + "/transport_file", bulkTransportFile)
+    timed("  with unchanged file", client, ROOT + "/transport_file", bulkTransportFile, vary=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures the memory taken by IS-05 state when provisioning a large number
+# of two-leg RTP receivers, and compares the transport_params legs stored as
+# FrozenRecords with the same legs stored as plain dicts. Run from the
+# repository root:
+#
+#     python benchmarks/benchDeviceMemory.py
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import tracemalloc
+
+__location__ = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(__location__, ".."))
+
+from nmosconnection.rtpReceiver import RtpReceiver, RtpReceiverLeg  # noqa: E402
+from nmosconnection.snapshot import thaw  # noqa: E402
+
+RECEIVERS = 50000
+LEGS = 2
+
+__tp__ = 'transport_params'
+
+
+class TransportManager:
+    def __init__(self, logger, receiver):
+        pass
+
+
+class QuietLogger:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def measure(build):
+    """Run build() returning its result and the bytes it left allocated"""
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def provision(logger):
+    receivers = []
+    for index in range(0, RECEIVERS):
+        receiver = RtpReceiver(logger, TransportManager, LEGS)
+        for leg in range(0, LEGS):
+            receiver.addInterface("192.168.{}.1".format(leg), leg)
+        receiver.activateStaged()
+        receivers.append(receiver)
+    return receivers
+
+
+def report(name, size):
+    print("{:<32} {:>10.1f}MB {:>10.0f}B/receiver".format(name, size / 1e6, float(size) / RECEIVERS))
+
+
+def main():
+    logger = QuietLogger()
+    tracemalloc.start()
+    start = time.time()
+    receivers, total = measure(lambda: provision(logger))
+    elapsed = time.time() - start
+
+    def legs(build):
+        return [(build(receiver.staged[__tp__]), build(receiver.active[__tp__])) for receiver in receivers]
+
+    _, dicts = measure(lambda: legs(thaw))
+    _, records = measure(lambda: legs(lambda params: [RtpReceiverLeg(leg) for leg in params]))
+    tracemalloc.stop()
+
+    print("{} receivers with {} legs, provisioned in {:.1f}s".format(RECEIVERS, LEGS, elapsed))
+    report("all receiver state", total)
+    report("staged+active legs as dicts", dicts)
+    report("staged+active legs as records", records)
+    print("records use {:.0f}% of the memory of dicts".format(100.0 * records / dicts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+#
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the time taken to validate typical staged PATCH requests using
+# plain jsonschema validators and the generated validators from
+# nmosconnection.schemaCompiler. Run from the repository root:
+#
+#     python benchmarks/benchSchemaValidation.py
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import timeit
+from jsonschema import FormatChecker
+from jsonschema.validators import validator_for
+
+__location__ = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(__location__, ".."))
+
+from nmosconnection.schemaCompiler import compileValidator  # noqa: E402
+
+SCHEMA_PATH = os.path.join(__location__, "../share/ipp-connectionmanagement/schemas/")
+EXAMPLE_PATH = os.path.join(__location__, "../tests/examples/")
+NUMBER = 2000
+
+CASES = [
+    ("v1.0-sender-stage-schema.json", "v1.0-sender-patch.json"),
+    ("v1.0-sender-stage-schema.json", "v1.0-sender-patch-absolute.json"),
+    ("v1.0-receiver-stage-schema.json", "v1.0-receiver-patch.json"),
+    ("v1.0-receiver-stage-schema.json", "v1.0-receiver-patch-transportfile.json"),
+]
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def bench(validator, document):
+    seconds = min(timeit.repeat(lambda: validator.validate(document), number=NUMBER, repeat=5))
+    return seconds / NUMBER * 1e6
+
+
+def main():
+    formatChecker = FormatChecker(["ipv4", "ipv6"])
+    print("{:<40} {:>12} {:>12} {:>8}".format("request", "jsonschema", "compiled", "speedup"))
+    for schemaFile, exampleFile in CASES:
+        schema = load(SCHEMA_PATH + schemaFile)
+        document = load(EXAMPLE_PATH + exampleFile)
+        reference = validator_for(schema)(schema, format_checker=formatChecker)
+        compiled = compileValidator(schema, formatChecker)
+        before = bench(reference, document)
+        after = bench(compiled, document)
+        print("{:<40} {:>10.1f}us {:>10.1f}us {:>7.1f}x".format(exampleFile, before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
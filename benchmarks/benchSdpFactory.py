@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures SDP generation throughput for single leg, ST 2022-7 and ST 2022-5
+# FEC senders. "blocks" concatenates the output of each block generator as
+# every activation used to, "template" fills in a compiled template for
+# parameters that change each time, and "cached" reuses the last file when
+# an activation leaves the parameters it uses alone. Run from the
+# repository root:
+#
+#     python benchmarks/benchSdpFactory.py
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+__location__ = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(__location__, ".."))
+
+from nmosconnection.rtpSender import RtpSender  # noqa: E402
+from nmosconnection.sdpFactory import senderFileFactory  # noqa: E402
+
+NUMBER = 5000
+
+CASES = [
+    ("single leg", 1, False),
+    ("ST 2022-7", 2, False),
+    ("ST 2022-5 FEC", 1, True),
+]
+
+
+class QuietLogger:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def makeSender(legs, fec):
+    sender = RtpSender(QuietLogger(), legs)
+    for leg in range(0, legs):
+        sender.addInterface("192.168.{}.1".format(leg), leg)
+        sender.setStagedParameter("232.0.{}.1".format(leg), "destination_ip", leg)
+    sender.supportFec(fec)
+    if fec:
+        sender.setStagedParameter(True, "fec_enabled")
+    sender.activateStaged()
+    return sender
+
+
+def bench(run):
+    seconds = min(timeit.repeat(run, number=NUMBER, repeat=5))
+    return NUMBER / seconds
+
+
+def main():
+    print("{:<16} {:>14} {:>14} {:>14}".format("sender", "blocks", "template", "cached"))
+    for name, legs, fec in CASES:
+        factory = senderFileFactory(makeSender(legs, fec))
+        assert factory.buildSDP() == factory.generateSDP()
+        blocks = bench(factory.buildSDP)
+
+        def changed():
+            # Forget the last file, as if the destination had changed
+            factory._cached = (None, None)
+            factory.generateSDP()
+        template = bench(changed)
+        cached = bench(factory.generateSDP)
+        print("{:<16} {:>12.0f}/s {:>12.0f}/s {:>12.0f}/s".format(name, blocks, template, cached))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+#
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compares the time taken to parse every line of ST 2110 SDP files with the
+# single pass line tokenizer in nmosconnection.sdpLineParser and with the
+# per-line regex parser it replaced, which is reproduced below. The time
+# taken by SdpParser to build the whole session model is shown alongside.
+# Run from the repository root:
+#
+#     python benchmarks/benchSdpParser.py
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import timeit
+
+__location__ = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(__location__, ".."))
+
+from nmosconnection.sdpParser import SdpParser  # noqa: E402
+from nmosconnection.sdpLineParser import parseLine, ConnectionLine, MediaLine, AttributeLine  # noqa: E402
+
+EXAMPLE_PATH = os.path.join(__location__, "../tests/examples/")
+NUMBER = 2000
+
+CASES = ["st2110-20-2022-7.sdp", "st2110-30.sdp", "st2110-40.sdp"]
+
+
+def regexParseLine(line):
+    """The previous parser: two regex matches to split the line, then
+    uncompiled regexes for each connection, media and attribute line"""
+    type = re.match("^(.)=.*", line).group(1)
+    value = re.match("^.=(.*)", line).group(1)
+    if type == "c":
+        if re.match(r"^ *IN +IP4 +.*$", value):
+            match = re.match(r"^ *IN +IP4 +([^/]+)(?:/(\d+)(?:/(\d+))?)? *$", value)
+            addr, ttl, groupsize = match.groups()
+            return ConnectionLine("IN", "IP4", addr, groupsize or 1, ttl or 127)
+        match = re.match(r"^ *IN +IP6 +([^/]+) *$", value)
+        return ConnectionLine("IN", "IP6", match.groups()[0], 1, 1)
+    elif type == "a":
+        if re.match(r"^.*source-filter: +incl +IN +IP4 +.*", value):
+            match = re.match(r"^.*IN +IP4+ (?:((?:\d+\.?)+)) (?:((?:\d+\.?)+))", value)
+            dest, source = match.groups(match)
+            return AttributeLine("IN", "IP4", dest, source)
+        return None
+    elif type == "m":
+        regexp = (r"^(audio|video|text|application|message) +"
+                  r"(\d+)(?:[/](\d+))? +([^ ]+) +(.+)$")
+        media, port, numports, protocol, fmt = re.match(regexp, value).groups()
+        return MediaLine(media, int(port), int(numports or 1), protocol, fmt)
+    return None
+
+
+def tokenize(sdp, parse):
+    return [parse(line) for line in sdp.splitlines() if line]
+
+
+def buildModel(sdp):
+    parser = SdpParser(None)
+    parser.parseFile(sdp)
+    return parser.sources
+
+
+def bench(run):
+    return min(timeit.repeat(run, number=NUMBER, repeat=5)) / NUMBER * 1e6
+
+
+def main():
+    print("{:<24} {:>12} {:>12} {:>8} {:>12}".format("sdp", "regex", "tokenizer", "speedup", "model"))
+    for name in CASES:
+        with open(EXAMPLE_PATH + name) as f:
+            sdp = f.read()
+        assert tokenize(sdp, regexParseLine) == tokenize(sdp, parseLine)
+        before = bench(lambda: tokenize(sdp, regexParseLine))
+        after = bench(lambda: tokenize(sdp, parseLine))
+        model = bench(lambda: buildModel(sdp))
+        print("{:<24} {:>10.1f}us {:>10.1f}us {:>7.1f}x {:>10.1f}us".format(
+            name, before, after, before / after, model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+#
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures how long it takes to bring back the staged and active state of a
+# large number of two-leg RTP senders from a state journal after a restart.
+# Device construction is timed separately, since a driver has to do that
+# whether or not there is a journal. Run from the repository root:
+#
+#     python benchmarks/benchWarmRestart.py
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+__location__ = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(__location__, ".."))
+
+from nmosconnection import api  # noqa: E402
+from nmosconnection.api import ConnectionManagementAPI  # noqa: E402
+from nmosconnection.rtpSender import RtpSender  # noqa: E402
+
+SENDERS = 10000
+LEGS = 2
+
+
+class QuietLogger:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def provision(logger):
+    senders = []
+    for index in range(0, SENDERS):
+        sender = RtpSender(logger, LEGS)
+        for leg in range(0, LEGS):
+            sender.addInterface("192.168.{}.1".format(leg), leg)
+        senders.append(("sender-{}".format(index), sender))
+    return senders
+
+
+def timed(name, run):
+    start = time.time()
+    result = run()
+    elapsed = time.time() - start
+    print("{:<32} {:>8.3f}s {:>8.1f}us/sender".format(name, elapsed, elapsed * 1e6 / SENDERS))
+    return result
+
+
+def addAll(dut, senders):
+    for senderId, sender in senders:
+        dut.addSender(sender, senderId)
+
+
+def main():
+    logger = QuietLogger()
+    tmpDir = tempfile.mkdtemp()
+    api._config['state_journal'] = os.path.join(tmpDir, "state.journal")
+    try:
+        # Previous run: activate every sender and journal the result
+        dut = ConnectionManagementAPI(logger)
+        senders = provision(logger)
+        addAll(dut, senders)
+        for index, (senderId, sender) in enumerate(senders):
+            sender.setStagedParameter("232.0.{}.{}".format(index // 256, index % 256), "destination_ip")
+            sender.setMasterEnable(True)
+            sender.activateStaged()
+            dut.saveState(senderId)
+        dut.journal.compact()
+        dut.journal.close()
+        size = sum(os.path.getsize(dut.journal.path + suffix) for suffix in ("", ".snapshot"))
+        print("{} senders with {} legs, {:.1f}MB journalled".format(SENDERS, LEGS, size / 1e6))
+
+        # Restart
+        senders = timed("construct devices", lambda: provision(logger))
+        restarted = timed("load journal", lambda: ConnectionManagementAPI(logger))
+        timed("restore devices", lambda: addAll(restarted, senders))
+        restored = sum(1 for senderId, sender in senders if sender.active["master_enable"])
+        print("{} of {} senders restored".format(restored, SENDERS))
+        restarted.journal.close()
+    finally:
+        del api._config['state_journal']
+        shutil.rmtree(tmpDir)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,25 +14,190 @@
 
 import copy
 import socket
-from jsonschema import validate, FormatChecker, ValidationError
+from collections import namedtuple
+from jsonschema import ValidationError
 from abc import ABCMeta, abstractmethod
 import re
 import six
+import gevent
+
+from .schemaRegistry import SchemaRegistry
+from .versions import nextVersion
+from .snapshot import FrozenDict, freeze, thaw, setIn
+from .constraintPool import constraintPool
 
 __tp__ = 'transport_params'
 
+# Base transport parameter schemas are shared between all devices
+schemaRegistry = SchemaRegistry()
+
+ParamsSchemaEntry = namedtuple("ParamsSchemaEntry", "generation, base, schema, validator")
+
+
+def diffParameters(old, new):
+    """Find the parameters that differ between two parameter sets. The
+    result takes the form of a PATCH document holding the new values of the
+    changed keys, with one dict per leg of transport_params, and is empty
+    when nothing changed"""
+    delta = {}
+    for key, value in new.items():
+        if key != __tp__ and (key not in old or old[key] != value):
+            delta[key] = value
+    oldLegs = old.get(__tp__, [])
+    newLegs = new.get(__tp__, [])
+    legs = []
+    for leg, params in enumerate(newLegs):
+        previous = oldLegs[leg] if leg < len(oldLegs) else {}
+        if params is previous:
+            legs.append({})
+        else:
+            legs.append(dict(
+                (key, value) for key, value in params.items() if key not in previous or previous[key] != value
+            ))
+    if any(legs) or len(oldLegs) != len(newLegs):
+        delta[__tp__] = legs
+    return delta
+
 
 @six.add_metaclass(ABCMeta)
 class AbstractDevice:
+
+    # FrozenRecord type used to store each leg of transport_params
+    legRecord = None
+
+    # Resolvers for "auto" transport parameters, in the order they run. Each
+    # entry names the parameter, the method that resolves it and the other
+    # parameters of the same leg that it depends on. Driver selectors have
+    # None for their inputs, as they may look at any of the staged parameters
+    resolvers = []
+
     def __init__(self, logger):
-        self.staged = {}
-        self.active = {}
+        self.staged = {
+            'master_enable': False,
+            'receiver_id': None,
+            'sender_id': None
+        }
+        self.active = FrozenDict()
         self.callback = None
+        self.callbackDelta = False
         self.stageLocked = False
         self.logger = logger
-        self.staged['master_enable'] = False
-        self.staged['receiver_id'] = None
-        self.staged['sender_id'] = None
+        self._constraints = []
+        self._constraintsShared = False
+        self._constraintsGeneration = nextVersion()
+        self._paramsSchemas = {}
+        self._resolved = {}
+
+    @property
+    def staged(self):
+        """Immutable snapshot of the staged parameters. Assigning a new
+        parameter set freezes it and bumps the staged version"""
+        return self._staged
+
+    @staged.setter
+    def staged(self, params):
+        self._staged = self._freezeParams(params)
+        self.stagedChanged()
+
+    @property
+    def active(self):
+        """Immutable snapshot of the active parameters"""
+        return self._active
+
+    @active.setter
+    def active(self, params):
+        self._active = self._freezeParams(params)
+        self.activeChanged()
+
+    def _freezeParams(self, params):
+        """Snapshot a parameter set, storing each leg as a legRecord"""
+        legs = params.get(__tp__)
+        if self.legRecord is not None and legs is not None and \
+                not all(type(leg) is self.legRecord for leg in legs):
+            params = dict(params)
+            params[__tp__] = [self.legRecord.fromMapping(leg) for leg in legs]
+        return freeze(params)
+
+    @property
+    def constraints(self):
+        """Devices with identical constraints share one read only set, so
+        reading this gives the device its own mutable copy, which may be
+        modified in place as long as constraintsChanged is called afterwards.
+        The device then stops sharing its constraints, and the schemas built
+        from them, until a set is assigned here again. Code that only reads
+        the constraints should use the snapshot in _constraints instead"""
+        if self._constraintsShared:
+            self._constraints = thaw(self._constraints)
+            self._constraintsShared = False
+        return self._constraints
+
+    @constraints.setter
+    def constraints(self, constraints):
+        self._constraints = constraintPool.intern(constraints)
+        self._constraintsShared = True
+        self.constraintsChanged()
+
+    @property
+    def constraintsVersion(self):
+        return self._constraintsGeneration
+
+    def constraintsChanged(self):
+        """Must be called whenever the constraints, or the set of supported
+        parameters, are modified so that the cached schema is rebuilt"""
+        self._constraintsGeneration = nextVersion()
+
+    def stagedChanged(self):
+        """Bump the staged version. Done automatically when staged is assigned"""
+        self.stagedVersion = nextVersion()
+
+    def activeChanged(self):
+        """Bump the active version. Done automatically when active is assigned"""
+        self.activeVersion = nextVersion()
+
+    def resolveParameters(self, parameterSet):
+        """Resolve the actual values of all parameters set to "auto". The
+        result of each resolver is remembered for each leg along with its
+        inputs, and the resolver is only run again once they change. Legs are
+        resolved concurrently, each in its own greenlet, so resolvers see the
+        other legs as staged, with any "auto" values still unresolved"""
+        legs = [dict(params) for params in parameterSet[__tp__]]
+        if len(legs) > 1:
+            greenlets = [gevent.spawn(self._resolveLeg, parameterSet, legs, leg) for leg in range(0, len(legs))]
+            gevent.joinall(greenlets)
+            for greenlet in greenlets:
+                greenlet.get()
+        else:
+            for leg in range(0, len(legs)):
+                self._resolveLeg(parameterSet, legs, leg)
+        return setIn(parameterSet, [__tp__], legs)
+
+    def _resolveLeg(self, parameterSet, legs, leg):
+        staged = parameterSet[__tp__][leg]
+        resolved = self._resolved.setdefault(leg, {})
+        # The leg being resolved alongside the other legs as staged, so that
+        # what a resolver sees doesn't depend on how far the others have got
+        view = list(parameterSet[__tp__])
+        view[leg] = legs[leg]
+        for key, method, inputs in self.resolvers:
+            if staged[key] != "auto":
+                continue
+            resolver = getattr(self, method)
+            if inputs is None:
+                args = (resolver, parameterSet[__tp__], self._constraintsGeneration)
+            else:
+                args = tuple(legs[leg][name] for name in inputs)
+            previous = resolved.get(key)
+            if previous is not None and previous[0] == args:
+                legs[leg][key] = previous[1]
+            else:
+                legs[leg][key] = resolver(view, leg)
+                resolved[key] = (args, legs[leg][key])
+
+    def invalidateResolution(self):
+        """Forget all remembered resolutions. Drivers whose selectors depend
+        on state outside of the staged parameters should call this when that
+        state changes"""
+        self._resolved = {}
 
     def lock(self):
         """Prevents any updates to staged parameters"""
@@ -42,36 +207,54 @@ class AbstractDevice:
         """Allows updates to staged parameters"""
         self.stageLocked = False
 
-    def setActivateCallback(self, callback):
+    def setActivateCallback(self, callback, delta=False):
+        """Set the driver method called when parameters are activated. If
+        delta is True it is passed the changes made by the activation, as
+        returned by diffParameters. Activations that change nothing don't
+        call it at all"""
         self.callback = callback
+        self.callbackDelta = delta
 
     def activateStaged(self):
-        oldParams = copy.deepcopy(self.active)
-        self.active = copy.deepcopy(self.resolveParameters(self.staged))
+        """Resolve and activate the staged parameters. Returns the changes
+        made, as returned by diffParameters"""
+        # Snapshots are never modified in place, so keeping a reference to
+        # the old one is enough to roll back
+        oldParams = self.active
+        newParams = self.resolveParameters(self.staged)
+        delta = diffParameters(oldParams, newParams)
         self.unLock()
+        if not delta:
+            self.logger.writeDebug("Activation changed no parameters")
+            return delta
+        self.active = newParams
         if self.callback is not None:
             try:
                 self.logger.writeDebug("Activation suceeded")
-                self.callback()
+                if self.callbackDelta:
+                    self.callback(delta)
+                else:
+                    self.callback()
             except Exception as e:
                 self.logger.writeWarning("Activation failed, reverting to old params. {}".format(e))
-                self.active = copy.deepcopy(oldParams)
+                self.active = oldParams
                 raise
+        return delta
 
     def setMasterEnable(self, masterEnable):
         if self.stageLocked:
             raise StagedLockedException()
-        self.staged['master_enable'] = masterEnable
+        self.staged = setIn(self.staged, ['master_enable'], masterEnable)
 
     def setSenderId(self, senderId):
         if self.stageLocked:
             raise StagedLockedException()
         if senderId is None:
-            self.staged['sender_id'] = None
+            self.staged = setIn(self.staged, ['sender_id'], None)
         else:
             pattern = "^[0-9a-f]{8}-[0-9a-f]{4}-[1-5][0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$"
             if re.match(pattern, senderId):
-                self.staged['sender_id'] = senderId
+                self.staged = setIn(self.staged, ['sender_id'], senderId)
             else:
                 raise ValidationError("Invalid sender id")
 
@@ -79,11 +262,11 @@ class AbstractDevice:
         if self.stageLocked:
             raise StagedLockedException()
         if receiverId is None:
-            self.staged['receiver_id'] = None
+            self.staged = setIn(self.staged, ['receiver_id'], None)
         else:
             pattern = "^[0-9a-f]{8}-[0-9a-f]{4}-[1-5][0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$"
             if re.match(pattern, receiverId):
-                self.staged['receiver_id'] = receiverId
+                self.staged = setIn(self.staged, ['receiver_id'], receiverId)
             else:
                 raise ValidationError("Invalid sender id")
 
@@ -91,16 +274,37 @@ class AbstractDevice:
         """Update based on a patch object"""
         for leg in range(0, self.legs):
             if not self.stageLocked:
-                toCheck = []
-                toCheck.append(updateObject[leg])
-                schema = self.getParamsSchema(leg)
-                checker = FormatChecker(["ipv4", "ipv6"])
-                validate(updateObject, schema, format_checker=checker)
-                self._updateTransportParamerters(updateObject, self.staged)
+                self.getParamsValidator(leg).validate(updateObject)
+                self.staged = self._updateTransportParamerters(updateObject, self.staged)
                 return True
             else:
                 raise StagedLockedException()
 
+    def _getConstraintsDocument(self, variant, build):
+        """Get the document made by build(constraints). Devices sharing a
+        constraint set and variant share the document, so it is read only"""
+        if self._constraintsShared:
+            return constraintPool.document(self._constraints, (type(self), self.legs) + variant, build)
+        return freeze(build(self._constraints))
+
+    def getParamsSchema(self, leg=0):
+        """Get the schema of the transport params, with constraints merged in.
+        The returned schema is cached and must not be modified"""
+        return self._getParamsSchemaEntry(leg).schema
+
+    def getParamsValidator(self, leg=0):
+        """Get a compiled validator for the transport params schema"""
+        return self._getParamsSchemaEntry(leg).validator
+
+    def _getParamsSchemaEntry(self, leg):
+        base = schemaRegistry.getSchema(self.paramsSchemaFile, schemaPath=self.schemaPath)
+        entry = self._paramsSchemas.get(leg)
+        if entry is None or entry.generation != self._constraintsGeneration or entry.base is not base:
+            schema = self._buildParamsSchema(copy.deepcopy(base), leg)
+            entry = ParamsSchemaEntry(self._constraintsGeneration, base, schema, schemaRegistry.compile(schema))
+            self._paramsSchemas[leg] = entry
+        return entry
+
     def stagedToJson(self):
         return self._assembleJsonDescription(self.staged)
 
@@ -110,7 +314,7 @@ class AbstractDevice:
     def setStagedParameter(self, value, parameter, leg=0):
         """Set the value of a staged parameter"""
         if parameter in self.staged[__tp__][leg]:
-            self.staged[__tp__][leg][parameter] = value
+            self.staged = setIn(self.staged, [__tp__, leg, parameter], value)
         else:
             raise ValueError
 
@@ -121,7 +325,7 @@ class AbstractDevice:
     def setActiveParameter(self, value, parameter, leg=0):
         """Set the value of an active parameter"""
         if parameter in self.active[__tp__][leg]:
-            self.active[__tp__][leg][parameter] = value
+            self.active = setIn(self.active, [__tp__, leg, parameter], value)
         else:
             raise ValueError
 
@@ -130,13 +334,18 @@ class AbstractDevice:
         return self.active[__tp__][leg][parameter]
 
     def _updateTransportParamerters(self, updateObject, dest):
-        """Merge in transport parameters"""
+        """Merge in transport parameters, returning a new snapshot. Legs
+        the update doesn't touch are shared with dest"""
+        legs = list(dest[__tp__])
         leg = 0
         for tp in updateObject:
-            for key, value in tp.items():
-                if key in dest[__tp__][leg]:
-                    dest[__tp__][leg][key] = updateObject[leg][key]
+            updated = dict((key, value) for key, value in tp.items() if key in legs[leg])
+            if updated:
+                params = dict(legs[leg])
+                params.update(updated)
+                legs[leg] = params
             leg += 1
+        return setIn(dest, [__tp__], legs)
 
     def _checkIsIpv4(self, addr):
         """Checks a given address is ipv4"""
@@ -172,7 +381,7 @@ class AbstractDevice:
         pass
 
     @abstractmethod
-    def getParamsSchema(self):
+    def _buildParamsSchema(self, schema, leg):
         pass
 
     @abstractmethod
@@ -14,26 +14,188 @@
 
 from __future__ import absolute_import
 
-import os
 import time
-import json
 import copy
+import math
+import logging
+from collections import deque
 
 from nmoscommon import timestamp as ipptimestamp
-from threading import Timer
+from threading import Lock
+from gevent.lock import RLock
+from gevent.pool import Pool
 from .fieldException import FieldException
-from jsonschema import validate
 from .constants import SCHEMA_LOCAL
+from .schemaRegistry import SchemaRegistry
+from .scheduler import activationScheduler
+from .versions import nextVersion
+from .bulkExecutor import DEFAULT_BULK_CONCURRENCY
 
-__location__ = os.path.realpath(
-    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+ACTIVATE_SCHEMA = "v1.0-activate-schema.json"
+
+# Number of recent activations used to estimate how long a device takes to activate
+ACTIVATION_COST_WINDOW = 20
+
+# Number of members of an activation group switched at once
+GROUP_CONCURRENCY = DEFAULT_BULK_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# A single compiled activation schema is shared by every Activator. It is
+# loaded on first use. Schema paths are used as given rather than relative
+# to this module.
+activationSchemas = SchemaRegistry(location="")
+
+
+class ActivationCost:
+    """Rolling record of how long a device takes to activate, covering
+    parameter resolution, copying staged to active and the driver callback"""
+
+    def __init__(self, window=ACTIVATION_COST_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.total = 0.0
+
+    def add(self, seconds):
+        if len(self.samples) == self.samples.maxlen:
+            self.total -= self.samples[0]
+        self.samples.append(seconds)
+        self.total += seconds
+
+    def estimate(self):
+        """Mean activation time over the window, or zero with no samples"""
+        if not self.samples:
+            return 0.0
+        return self.total / len(self.samples)
+
+
+class ActivationGroup:
+    """A set of activators scheduled for the same absolute time. One scheduled
+    event fires every member in a single pass so that they switch together"""
+
+    def __init__(self, key, offset, groups):
+        self.key = key
+        self.groups = groups
+        self.members = []
+        self.spread = None
+        self.fired = False
+        self.deadline = activationScheduler.now() + offset
+        self.lead = 0.0
+        self.maxCost = 0.0
+        self.timer = activationScheduler.schedule(offset, self._fire)
+
+    def add(self, activator):
+        """Add a member, starting the group early enough to cover its
+        activation cost. Called with the groups lock held"""
+        self.members.append(activator)
+        self.maxCost = max(self.maxCost, activator.activationCost.estimate())
+        # Members are switched GROUP_CONCURRENCY at a time, so start early
+        # enough for each batch to take as long as the slowest member
+        batches = int(math.ceil(len(self.members) / float(GROUP_CONCURRENCY)))
+        lead = self.maxCost * batches
+        if lead != self.lead:
+            self.lead = lead
+            self._reschedule()
+
+    def cancel(self, activator):
+        """Remove an activator from the group, cancelling the group if it was the last one"""
+        with self.groups.lock:
+            if activator in self.members:
+                self.members.remove(activator)
+            if not self.members and self.groups.groups.get(self.key) is self:
+                del self.groups.groups[self.key]
+                self.timer.cancel()
+
+    def _reschedule(self):
+        # Start early by the lead for the last member to finish at the
+        # requested time
+        self.timer.cancel()
+        delay = self.deadline - self.lead - activationScheduler.now()
+        self.timer = activationScheduler.schedule(delay, self._fire)
+
+    def _fire(self):
+        with self.groups.lock:
+            if self.fired:
+                return
+            self.fired = True
+            if self.groups.groups.get(self.key) is self:
+                del self.groups.groups[self.key]
+            # Note which scheduling each member joined with, so that a member
+            # cancelled or rescheduled while waiting for its lane is skipped
+            members = [(activator, activator.scheduledVersion) for activator in self.members]
+
+        def fireMember(member):
+            # A member that fails mustn't stop the others being switched or
+            # having their completion recorded
+            try:
+                return member[0]._runScheduled(member[1])
+            except Exception:
+                logger.exception("Scheduled activation failed")
+                return None
+
+        if len(members) > 1:
+            # Members are switched concurrently so that slow drivers, such as
+            # those waiting on an external allocator, overlap
+            pool = Pool(min(len(members), GROUP_CONCURRENCY))
+            completed = pool.map(fireMember, members)
+        else:
+            completed = [fireMember(member) for member in members]
+        times = sorted(each for activatorTimes in completed if activatorTimes for each in activatorTimes)
+        if times:
+            self.spread = times[-1] - times[0]
+        for (activator, version), activatorTimes in zip(members, completed):
+            if activatorTimes:
+                activator.activationSpread = self.spread
+
+
+class ActivationMembership:
+    """Handle held by an Activator for its place in an ActivationGroup"""
+
+    def __init__(self, group, activator):
+        self.group = group
+        self.activator = activator
+
+    def cancel(self):
+        self.group.cancel(self.activator)
+
+
+class ActivationGroups:
+    """Groups scheduled activations by requested time, so that activations
+    sharing a time (such as those from one bulk request) fire together"""
+
+    def __init__(self):
+        self.groups = {}
+        self.lock = Lock()
+
+    def join(self, key, offset, activator):
+        """Add the activator to the group for key, creating and scheduling
+        the group if needed. Returns a handle that can be cancelled"""
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                group = ActivationGroup(key, offset, self)
+                self.groups[key] = group
+            group.add(activator)
+        return ActivationMembership(group, activator)
+
+
+# Absolute scheduled activations from every Activator are grouped here
+activationGroups = ActivationGroups()
 
 
 class Activator:
 
     def __init__(self, targets):
         self.targets = targets
+        # Execution lane for the device. Everything that changes the staged or
+        # active state of the targets, whether a request or a scheduled
+        # activation, runs holding it, so operations on one device run one at
+        # a time in the order they arrive while other devices carry on in
+        # parallel. It is re-entrant and greenlet aware, so drivers may yield
+        # while holding it, and it may also be taken by the scheduler's
+        # worker threads
+        self.lane = RLock()
         self.scheduled = False
+        self.scheduledVersion = None
         self.lastRequest = {"mode": None,
                             "requested_time": None,
                             "activation_time": None}
@@ -43,21 +205,35 @@ class Activator:
             "activation_time": None
         }
         self.schemaPath = SCHEMA_LOCAL
+        self.activationSpread = None
+        self.activationCost = ActivationCost()
+        self.lastRequestVersion = nextVersion()
+        self.activeRequestVersion = nextVersion()
+        self.completionCallback = None
+
+    def setCompletionCallback(self, callback):
+        """Set a method to call each time a scheduled activation completes"""
+        self.completionCallback = callback
+
+    def restoreActiveRequest(self, request):
+        """Put back an active request saved before a restart"""
+        self.activeRequest = dict(request)
+        self.activeRequestVersion = nextVersion()
 
     def parseActivationObject(self, obj):
-        schema = self._getSchema()
-        validate(obj, schema)
+        activationSchemas.validate(obj, ACTIVATE_SCHEMA, schemaPath=self.schemaPath)
         mode = obj['mode']
-        if mode == "activate_immediate":
-            return self._scheduleImmediate()
-        else:
-            schedTime = obj['requested_time']
-            if mode == "activate_scheduled_absolute":
-                return self._scheduleAbsolute(schedTime)
-            elif mode == "activate_scheduled_relative":
-                return self._scheduleRelative(schedTime)
-            elif mode is None:
-                return self._scheduleNone()
+        with self.lane:
+            if mode == "activate_immediate":
+                return self._scheduleImmediate()
+            else:
+                schedTime = obj['requested_time']
+                if mode == "activate_scheduled_absolute":
+                    return self._scheduleAbsolute(schedTime)
+                elif mode == "activate_scheduled_relative":
+                    return self._scheduleRelative(schedTime)
+                elif mode is None:
+                    return self._scheduleNone()
 
     def getLastRequest(self):
         return self.lastRequest
@@ -65,6 +241,11 @@ class Activator:
     def getActiveRequest(self):
         return self.activeRequest
 
+    def getActivationSpread(self):
+        """Seconds between the first and last target switching in the
+        most recent grouped activation, or None"""
+        return self.activationSpread
+
     def moveToActive(self):
         """Move the last request through to active on completion
         of an activation"""
@@ -74,15 +255,11 @@ class Activator:
         self.lastRequest['mode'] = None
         self.lastRequest['requested_time'] = None
         self.lastRequest['activation_time'] = None
+        self.lastRequestVersion = nextVersion()
+        self.activeRequestVersion = nextVersion()
 
     def _getSchema(self):
-        path = self.schemaPath + "v1.0-activate-schema.json"
-        try:
-            with open(path) as json_data:
-                obj = json_data.read()
-                return json.loads(obj)
-        except EnvironmentError as e:
-            raise IOError('failed to load schema file' + str(e))
+        return activationSchemas.getSchema(ACTIVATE_SCHEMA, schemaPath=self.schemaPath)
 
     def _parseTimeString(self, timeString):
         """Convert TAI time stirng into {'seconds', 'nanoseconds'} tuple"""
@@ -102,16 +279,17 @@ class Activator:
 
     def _getCurrentTime(self):
         """Get the current time as an NMOS timestamp"""
-        now = time.time()
+        return self._toTimestamp(time.time())
+
+    def _toTimestamp(self, now):
+        """Convert a time.time() value to an NMOS timestamp"""
         secs = int(now)
         nanos = (now - secs) * 1e9
         return ipptimestamp.Timestamp.from_utc(secs, nanos)
 
     def _scheduleImmediate(self):
         """Schedule an activation ASAP"""
-        utc = self._getCurrentTime()
-        for target in self.targets:
-            target.activateStaged()
+        utc = self._toTimestamp(self._activateTargets()[-1])
         toReturn = (200, {"mode": "activate_immediate",
                           "requested_time": None,
                           "activation_time": str(utc)})
@@ -130,12 +308,13 @@ class Activator:
         zero = ipptimestamp.TimeOffset()
         if diff < zero:
             diff = zero
-        self._scheduleActivation(diff)
+        self._scheduleActivation(diff, targetTimestamp)
         actual = utc + diff
         toReturn = (202, {"mode": "activate_scheduled_absolute",
                           "requested_time": timeString,
                           "activation_time": str(actual)})
         self.lastRequest = toReturn[1]
+        self.lastRequestVersion = nextVersion()
         return toReturn
 
     def _scheduleRelative(self, timeString):
@@ -148,6 +327,7 @@ class Activator:
                           "requested_time": str(timeString),
                           "activation_time": str(absTime)})
         self.lastRequest = toReturn[1]
+        self.lastRequestVersion = nextVersion()
         return toReturn
 
     def _scheduleNone(self):
@@ -161,19 +341,59 @@ class Activator:
                      "requested_time": None,
                      "activation_time": None})
         self.lastRequest = ret[1]
+        self.lastRequestVersion = nextVersion()
         return ret
 
-    def _timerCallback(self):
+    def _activateTargets(self):
+        """Activate every target, adding the time taken to the activation
+        cost. Returns the time.time() at which each target completed"""
+        start = time.time()
+        completed = []
         for target in self.targets:
             target.activateStaged()
+            completed.append(time.time())
+        if completed:
+            self.activationCost.add(completed[-1] - start)
+        else:
+            completed.append(start)
+        return completed
+
+    def _completeScheduled(self, completed):
+        """Unlock targets and make the last request active, reporting the
+        time the activation actually completed"""
+        for target in self.targets:
             target.unLock()
+        self.lastRequest['activation_time'] = str(self._toTimestamp(completed))
         self.moveToActive()
         self.scheduled = False
+        if self.completionCallback is not None:
+            self.completionCallback()
+
+    def _runScheduled(self, version):
+        """Run the scheduled activation with the given version in the lane.
+        Returns the completion times of the targets, or None if the
+        activation was cancelled or replaced while waiting for the lane"""
+        with self.lane:
+            if not self.scheduled or self.scheduledVersion != version:
+                return None
+            completed = self._activateTargets()
+            self._completeScheduled(completed[-1])
+            return completed
 
-    def _scheduleActivation(self, timeOffset):
+    def _timerCallback(self, version):
+        self._runScheduled(version)
+
+    def _scheduleActivation(self, timeOffset, requestedTime=None):
+        """Schedule activation to complete after timeOffset, starting early
+        by the measured activation cost. Activations with a requestedTime are
+        grouped with any others for the same time"""
         for target in self.targets:
             target.lock()
         offset = float(timeOffset.to_sec_frac())
         self.scheduled = True
-        self.timer = Timer(offset,  self._timerCallback)
-        self.timer.start()
+        self.scheduledVersion = nextVersion()
+        if requestedTime is not None:
+            self.timer = activationGroups.join(str(requestedTime), offset, self)
+        else:
+            delay = offset - self.activationCost.estimate()
+            self.timer = activationScheduler.schedule(delay, self._timerCallback, self.scheduledVersion)
@@ -14,13 +14,15 @@
 
 from __future__ import absolute_import
 
+import six
 import json
-import os
+import uuid
 import traceback
 
-from flask import request, abort, Response
-from jsonschema import validate, FormatChecker, ValidationError
-from nmoscommon.webapi import WebAPI, route, basic_route
+from flask import request, abort, Response, has_request_context, _request_ctx_stack
+from jsonschema import ValidationError
+from werkzeug.http import quote_etag
+from nmoscommon.webapi import WebAPI, IppResponse, route, basic_route
 from nmoscommon.auth.auth_middleware import AuthMiddleware
 from nmoscommon.nmoscommonconfig import config as _config
 
@@ -28,9 +30,13 @@ from nmoscommon.nmoscommonconfig import config as _config
 from .activator import Activator
 from .constants import SCHEMA_LOCAL
 from .abstractDevice import StagedLockedException
-
-__location__ = os.path.realpath(
-    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+from .cmExceptions import SdpParseError
+from .schemaRegistry import SchemaRegistry
+from .bulkExecutor import BulkExecutor, DEFAULT_BULK_CONCURRENCY
+from .responseCache import ResponseCache, encodeJson
+from .stateJournal import StateJournal
+from .sdpManager import parseTransportFile, setSdpLimits
+from .snapshot import freeze, thaw
 
 CONN_APINAMESPACE = "x-nmos"
 CONN_APINAME = "connection"
@@ -46,6 +52,11 @@ VALID_TRANSPORTS = {
     "v1.1": ["rtp", "mqtt", "websocket"]
 }
 
+STAGE_SCHEMAS = [
+    "v1.0-sender-stage-schema.json",
+    "v1.0-receiver-stage-schema.json"
+]
+
 
 class NotSupportedError(Exception):
     """Raised when the request uses functionality from a later version of the API"""
@@ -62,7 +73,19 @@ class ConnectionManagementAPI(WebAPI):
         self.activators = {}
         self.transportManagers = {}
         self.schemaPath = SCHEMA_LOCAL
+        self.schemaRegistry = SchemaRegistry(self.schemaPath)
+        self.schemaRegistry.preload(STAGE_SCHEMAS, CONN_APIVERSIONS)
         self.useValidation = True  # Used for unit testing
+        # Distinguishes ETags issued by this process from those issued before a restart
+        self.etagPrefix = uuid.uuid4().hex[:8]
+        self.responseCache = ResponseCache()
+        self.bulkExecutor = BulkExecutor(_config.get('bulk_concurrency', DEFAULT_BULK_CONCURRENCY))
+        # Optional journal used to restore staged and active state after a restart
+        journalPath = _config.get('state_journal')
+        self.journal = StateJournal(journalPath) if journalPath else None
+        self.journalVersions = {}
+        # Optional limits on the SDP files accepted by receivers
+        setSdpLimits(_config.get('sdp_max_size'), _config.get('sdp_max_line_length'), _config.get('sdp_max_media'))
 
         # Add Auth Middleware
         oauth_mode = _config.get('oauth_mode', False)
@@ -76,6 +99,7 @@ class ConnectionManagementAPI(WebAPI):
             )
         self.senders[senderId] = sender
         self.activators[senderId] = Activator([sender])
+        self.restoreState(senderId)
         return self.activators[senderId]
 
     def addReceiver(self, receiver, receiverId):
@@ -98,6 +122,7 @@ class ConnectionManagementAPI(WebAPI):
                 receiver
             ])
         self.transportManagers[receiverId] = receiver.transportManagers[0]
+        self.restoreState(receiverId)
         return self.activators[receiverId]
 
     def getTransceiver(self, api_version, transceiverType, transceiverId):
@@ -136,10 +161,88 @@ class ConnectionManagementAPI(WebAPI):
     def removeSender(self, senderId):
         del self.senders[senderId]
         del self.activators[senderId]
+        self.responseCache.discard(senderId)
+        self.forgetState(senderId)
 
     def removeReceiver(self, receiverId):
         del self.receivers[receiverId]
         del self.activators[receiverId]
+        self.responseCache.discard(receiverId)
+        self.forgetState(receiverId)
+
+    def stateVersions(self, transceiverId):
+        """Get the version numbers of everything journalled for a sender or receiver"""
+        activator = self.getActivator(transceiverId)
+        if transceiverId in self.senders:
+            transceiver = self.senders[transceiverId]
+            versions = [transceiver.transportFileVersion]
+        else:
+            transceiver = self.receivers[transceiverId]
+            versions = [manager.stagedVersion for manager in transceiver.transportManagers] + \
+                [manager.activeVersion for manager in transceiver.transportManagers]
+        versions += [transceiver.stagedVersion, transceiver.activeVersion, activator.activeRequestVersion]
+        return tuple(versions)
+
+    def captureState(self, transceiverId):
+        """Get the journalled state of a sender or receiver"""
+        activator = self.getActivator(transceiverId)
+        if transceiverId in self.senders:
+            transceiver = self.senders[transceiverId]
+            transportFile = transceiver.transportFile
+        else:
+            transceiver = self.receivers[transceiverId]
+            transportFile = [
+                {"staged": manager.getStagedRequest(), "active": manager.getActiveRequest()}
+                for manager in transceiver.transportManagers
+            ]
+        return {
+            "staged": thaw(transceiver.staged),
+            "active": thaw(transceiver.active),
+            "activation": thaw(activator.getActiveRequest()),
+            "transport_file": transportFile
+        }
+
+    def saveState(self, transceiverId):
+        """Append the state of a sender or receiver to the journal, unless
+        nothing has changed since it was last saved"""
+        if self.journal is None or transceiverId not in self.activators:
+            return
+        versions = self.stateVersions(transceiverId)
+        if self.journalVersions.get(transceiverId) != versions:
+            self.journal.record(transceiverId, self.captureState(transceiverId))
+            self.journalVersions[transceiverId] = versions
+
+    def restoreState(self, transceiverId):
+        """Put back the journalled state of a newly added sender or receiver.
+        The driver isn't called, so it must bring the device into line with
+        the restored active parameters itself"""
+        if self.journal is None:
+            return False
+        activator = self.getActivator(transceiverId)
+        activator.setCompletionCallback(lambda: self.saveState(transceiverId))
+        state = self.journal.take(transceiverId)
+        if state is None:
+            return False
+        transceiver = self.senders.get(transceiverId) or self.receivers.get(transceiverId)
+        if len(state["active"].get("transport_params", [])) != transceiver.legs:
+            self.logger.writeWarning("Not restoring {}, the number of legs has changed".format(transceiverId))
+            return False
+        transceiver.active = state["active"]
+        # Nothing staged since the last activation, so both can share one snapshot
+        transceiver.staged = transceiver.active if state["staged"] == state["active"] else state["staged"]
+        activator.restoreActiveRequest(state["activation"])
+        if transceiverId in self.senders:
+            transceiver.transportFile = state["transport_file"]
+        else:
+            for manager, requests in zip(transceiver.transportManagers, state["transport_file"]):
+                manager.restore(requests["staged"], requests["active"])
+        self.journalVersions[transceiverId] = self.stateVersions(transceiverId)
+        return True
+
+    def forgetState(self, transceiverId):
+        if self.journal is not None:
+            self.journal.remove(transceiverId)
+            self.journalVersions.pop(transceiverId, None)
 
     def getActivator(self, transceiverId):
         return self.activators[transceiverId]
@@ -157,6 +260,53 @@ class ConnectionManagementAPI(WebAPI):
             response['id'] = id
         return response
 
+    def makeETag(self, *versions):
+        """Build a strong ETag from the version counters of everything
+        that contributes to a resource"""
+        return quote_etag("-".join([self.etagPrefix] + [str(version) for version in versions]))
+
+    def notModified(self, etag):
+        """Check whether the client already holds the version of the resource
+        identified by etag"""
+        return request.if_none_match.contains_weak(etag.strip('"'))
+
+    def conditionalResponse(self, etag, build):
+        """Answer 304 Not Modified if the client already holds this version,
+        otherwise build the response body"""
+        if self.notModified(etag):
+            return IppResponse(status=304, headers={'ETag': etag})
+        return (200, build(), {'ETag': etag})
+
+    def cachedResponse(self, transceiverId, resource, etag, build):
+        """As conditionalResponse, but the JSON body is encoded once for each
+        version of the resource and then served from the response cache"""
+        if self.notModified(etag):
+            return IppResponse(status=304, headers={'ETag': etag})
+        if request.accept_mimetypes.best_match(['application/json', 'text/html']) != 'application/json':
+            return (200, build(), {'ETag': etag})
+        data = self.responseCache.get(transceiverId, resource, etag, lambda: encodeJson(build()))
+        return IppResponse(data, status=200, mimetype='application/json', headers={'ETag': etag})
+
+    def stagedETag(self, transceiverType, transceiver, transceiverId):
+        versions = [
+            transceiver.stagedVersion,
+            transceiver.constraintsVersion,
+            self.getActivator(transceiverId).lastRequestVersion
+        ]
+        if transceiverType == "receivers":
+            versions.append(self.getTransportManager(transceiverId).stagedVersion)
+        return self.makeETag(*versions)
+
+    def activeETag(self, transceiverType, transceiver, transceiverId):
+        versions = [
+            transceiver.activeVersion,
+            transceiver.constraintsVersion,
+            self.getActivator(transceiverId).activeRequestVersion
+        ]
+        if transceiverType == "receivers":
+            versions.append(self.getTransportManager(transceiverId).activeVersion)
+        return self.makeETag(*versions)
+
     @route('/')
     def __index(self):
         return (200, [CONN_APINAMESPACE + "/"])
@@ -218,7 +368,8 @@ class ConnectionManagementAPI(WebAPI):
     )
     def __constraints(self, api_version, transceiverType, transceiverId):
         transceiver = self.validateAPIVersion(api_version, transceiverType, transceiverId)
-        return transceiver.getConstraints()
+        etag = self.makeETag(transceiver.constraintsVersion)
+        return self.cachedResponse(transceiverId, "constraints", etag, transceiver.getConstraints)
 
     @route(CONN_ROOT + "<api_version>/" + SINGLE_ROOT + '<transceiverType>/<transceiverId>/staged',
            methods=['PATCH'])
@@ -230,6 +381,12 @@ class ConnectionManagementAPI(WebAPI):
            methods=['GET'])
     def __staged_get(self, api_version, transceiverType, transceiverId):
         transceiver = self.validateAPIVersion(api_version, transceiverType, transceiverId)
+        etag = self.stagedETag(transceiverType, transceiver, transceiverId)
+        return self.conditionalResponse(
+            etag, lambda: self.stagedToJson(transceiverType, transceiver, transceiverId)
+        )
+
+    def stagedToJson(self, transceiverType, transceiver, transceiverId):
         toReturn = transceiver.stagedToJson()
         toReturn['activation'] = self.getActivator(transceiverId).getLastRequest()
         if transceiverType == "receivers":
@@ -238,10 +395,22 @@ class ConnectionManagementAPI(WebAPI):
         return toReturn
 
     def staged_patch(self, api_version, transceiverType, transceiverId, params):
+        activator = self.activators.get(transceiverId)
+        if activator is None:
+            # Leave reporting the unknown device to applyStagedPatch
+            return self.applyStagedPatch(api_version, transceiverType, transceiverId, params)
+        # Run in the device's lane so that this request, other requests and
+        # scheduled activations for the device take effect one at a time
+        with activator.lane:
+            toReturn = self.applyStagedPatch(api_version, transceiverType, transceiverId, params)
+            self.saveState(transceiverId)
+        return toReturn
+
+    def applyStagedPatch(self, api_version, transceiverType, transceiverId, params):
         toReturn = {}
         transceiver = self.validateAPIVersion(api_version, transceiverType, transceiverId)
         try:
-            self.validateAgainstSchema(params, 'v1.0-{}-stage-schema.json'.format(transceiverType[:-1]))
+            self.validateAgainstSchema(params, 'v1.0-{}-stage-schema.json'.format(transceiverType[:-1]), api_version)
         except ValidationError as e:
             return (400, self.errorResponse(400, str(e)))
         # If receiver check if transport file must be applied
@@ -276,22 +445,14 @@ class ConnectionManagementAPI(WebAPI):
                 return activationRet
             toReturn = self.assembleResponse(transceiverType, transceiver, transceiverId, activationRet)
         else:
-            toReturn = (200, self.__staged_get(api_version, transceiverType, transceiverId))
+            toReturn = (200, self.stagedToJson(transceiverType, transceiver, transceiverId))
         return toReturn
 
-    def validateAgainstSchema(self, request, schemaFile):
+    def validateAgainstSchema(self, request, schemaFile, api_version=CONN_APIVERSIONS[0]):
         """Check a request against the sender patch schema"""
         # Validation may be disabled for unit testing purposes
         if self.useValidation:
-            schema = self.schemaPath + schemaFile
-            try:
-                schemaPath = os.path.join(__location__, schema)
-                with open(schemaPath) as json_data:
-                    schema = json.loads(json_data.read())
-            except EnvironmentError:
-                raise IOError('failed to load schema file at:{}'.format(schemaPath))
-            checker = FormatChecker(["ipv4", "ipv6"])
-            validate(request, schema, format_checker=checker)
+            self.schemaRegistry.validate(request, schemaFile, api_version, self.schemaPath)
 
     def assembleResponse(self, transceiverType, transceiver, transceiverId, activationRet):
         toReturn = transceiver.stagedToJson()
@@ -339,6 +500,8 @@ class ConnectionManagementAPI(WebAPI):
             transportManager.update(request)
         except KeyError as err:
             return (400, self.errorResponse(400, str(err)))
+        except SdpParseError as err:
+            return (400, self.errorResponse(400, str(err)))
         except ValueError as err:
             return (400, self.errorResponse(400, str(err)))
         except ValidationError as err:
@@ -360,7 +523,12 @@ class ConnectionManagementAPI(WebAPI):
     @route(CONN_ROOT + "<api_version>/" + SINGLE_ROOT + '<transceiverType>/<transceiverId>/active/', methods=['GET'])
     def __activeReceiver(self, api_version, transceiverType, transceiverId):
         transceiver = self.validateAPIVersion(api_version, transceiverType, transceiverId)
-        toReturn = {}
+        etag = self.activeETag(transceiverType, transceiver, transceiverId)
+        return self.cachedResponse(
+            transceiverId, "active", etag, lambda: self.activeToJson(transceiverType, transceiver, transceiverId)
+        )
+
+    def activeToJson(self, transceiverType, transceiver, transceiverId):
         toReturn = transceiver.activeToJson()
         toReturn['activation'] = self.getActivator(transceiverId).getActiveRequest()
         if transceiverType == "receivers":
@@ -371,8 +539,16 @@ class ConnectionManagementAPI(WebAPI):
     @basic_route(CONN_ROOT + "<api_version>/" + SINGLE_ROOT + 'senders/<senderId>/transportfile/')
     def __transportFileRedirect(self, api_version, senderId):
         sender = self.validateAPIVersion(api_version, 'senders', senderId)
-        resp = Response(sender.transportFile)
-        resp.headers['content-type'] = 'application/sdp'
+        etag = self.makeETag(sender.transportFileVersion)
+        if self.notModified(etag):
+            resp = Response(status=304)
+        else:
+            data = self.responseCache.get(
+                senderId, "transportfile", etag, lambda: sender.transportFile.encode("utf-8")
+            )
+            resp = Response(data)
+            resp.headers['content-type'] = 'application/sdp'
+        resp.headers['ETag'] = etag
         return resp
 
     @basic_route(CONN_ROOT + "<api_version>/" + SINGLE_ROOT + '<transceiverType>/<transceiverId>/transporttype/')
@@ -398,7 +574,7 @@ class ConnectionManagementAPI(WebAPI):
         senders/receivers"""
         self.validateAPIVersion(api_version)
         req = request.get_json()
-        statuses = []
+        entries = []
         try:
             for entry in req:
                 try:
@@ -411,13 +587,96 @@ class ConnectionManagementAPI(WebAPI):
                 except KeyError as e:
                     message = "{}. Failed to find field 'params' in one or more objects".format(e)
                     return (400, self.errorResponse(400, message))
-                res = self.staged_patch(api_version, transceiverType, id, params)
-                statuses.append({"id": id, "code": res[0]})
+                entries.append((id, params))
+            statuses = self.bulk_staged_patch(api_version, transceiverType, entries)
         except TypeError as err:
             return (400, {"code": 400, "error": str(err),
                           "debug": str(traceback.format_exc())})
         return (200, statuses)
 
+    def bulk_staged_patch(self, api_version, transceiverType, entries):
+        """Stage a list of (id, params) pairs using the bulk executor, so that
+        a slow device doesn't hold up the others. Returns the status of each
+        entry in request order"""
+        context = _request_ctx_stack.top if has_request_context() else None
+
+        def patch(id, params):
+            # Each greenlet needs its own copy of the request context
+            if context is None:
+                return self.staged_patch(api_version, transceiverType, id, params)
+            with context.copy():
+                return self.staged_patch(api_version, transceiverType, id, params)
+
+        results = self.bulkExecutor.execute(entries, patch)
+        return [{"id": id, "code": res[0]} for (id, params), res in zip(entries, results)]
+
+    # The below is not part of the API - it stages one transport file, and
+    # optionally an activation, onto many receivers, so that the file is only
+    # sent, validated and parsed once
+    @route(CONN_ROOT + "<api_version>/" + BULK_ROOT + 'receivers/transport_file',
+           methods=['POST'])
+    def __bulk_transport_file(self, api_version):
+        """Process a bulk transport file object of the form
+        {"transport_file": {...}, "receiver_ids": [...], "activation": {...}}"""
+        self.validateAPIVersion(api_version)
+        req = request.get_json()
+        try:
+            receiverIds = req['receiver_ids']
+            params = {'transport_file': req['transport_file']}
+        except (KeyError, TypeError) as e:
+            message = "{}. Failed to find field 'receiver_ids' or 'transport_file'".format(e)
+            return (400, self.errorResponse(400, message))
+        if not isinstance(receiverIds, list) or \
+                not all(isinstance(receiverId, six.string_types) for receiverId in receiverIds):
+            return (400, self.errorResponse(400, "'receiver_ids' must be a list of IDs"))
+        if 'activation' in req:
+            params['activation'] = req['activation']
+        try:
+            self.validateAgainstSchema(params, 'v1.0-receiver-stage-schema.json', api_version)
+        except ValidationError as e:
+            return (400, self.errorResponse(400, str(e)))
+        try:
+            parsed = parseTransportFile(self.logger, params['transport_file'])
+        except (KeyError, ValueError, SdpParseError) as err:
+            return (400, self.errorResponse(400, str(err)))
+        # Every receiver stages the same read only copy of the file
+        statuses = self.bulk_transport_file(
+            api_version, receiverIds, freeze(params['transport_file']), parsed, params.get('activation')
+        )
+        return (200, statuses)
+
+    def bulk_transport_file(self, api_version, receiverIds, transportFile, parsed, activation=None):
+        """Stage a transport file already parsed by parseTransportFile onto each
+        receiver, then apply the activation if there is one. Returns the
+        status of each receiver in request order"""
+        entries = [(receiverId, None) for receiverId in receiverIds]
+
+        def stage(receiverId, unused):
+            activator = self.activators.get(receiverId)
+            if receiverId not in self.receivers or activator is None:
+                return (404, {})
+            if self.receivers[receiverId].getTransportType() not in VALID_TRANSPORTS[api_version]:
+                return (409, {})
+            with activator.lane:
+                ret = self.applyParsedTransportFile(transportFile, parsed, receiverId)
+                if ret[0] == 200 and activation is not None:
+                    ret = self.applyActivation(activation, receiverId)
+                self.saveState(receiverId)
+            return ret
+
+        results = self.bulkExecutor.execute(entries, stage)
+        return [{"id": id, "code": res[0]} for (id, unused), res in zip(entries, results)]
+
+    def applyParsedTransportFile(self, request, parsed, transceiverId):
+        transportManager = self.getTransportManager(transceiverId)
+        try:
+            transportManager.stageParsed(request, parsed)
+        except ValidationError as err:
+            return (400, self.errorResponse(400, str(err)))
+        except StagedLockedException as e:
+            return (423, self.errorResponse(423, "{}. Resource is locked due to a pending activation".format(e)))
+        return (200, {})
+
     # The below is not part of the API - it is used to make the active
     # SDP file available over HTTP to BBC R&D RTP Receivers
     @basic_route(CONN_ROOT + "<api_version>/" + SINGLE_ROOT + 'receivers/<transceiverId>/active/sdp/')
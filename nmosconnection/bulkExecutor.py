@@ -0,0 +1,71 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import sys
+import six
+from collections import OrderedDict
+from gevent.pool import Pool
+
+DEFAULT_BULK_CONCURRENCY = 16
+
+
+class BulkExecutor:
+    """Runs the entries of a bulk request on a bounded pool of greenlets.
+    Entries that share a key are run one after another in the order they
+    appear in the request, and results are always returned in request order"""
+
+    def __init__(self, concurrency=DEFAULT_BULK_CONCURRENCY):
+        self.concurrency = concurrency
+
+    def execute(self, entries, handler):
+        """Call handler(key, value) for each (key, value) pair in entries,
+        returning a list of the results. If any call raises, the remaining
+        entries for that key are skipped and, once every other key has
+        finished, the exception from the earliest entry is re-raised"""
+        groups = OrderedDict()
+        for index, (key, value) in enumerate(entries):
+            groups.setdefault(key, []).append(index)
+        results = [None] * len(entries)
+        errors = [None] * len(entries)
+
+        def runGroup(indexes):
+            for index in indexes:
+                key, value = entries[index]
+                try:
+                    results[index] = handler(key, value)
+                except Exception:
+                    errors[index] = sys.exc_info()
+                    return False
+            return True
+
+        if self.concurrency <= 1:
+            # Run strictly in request order in the calling greenlet
+            failed = set()
+            for index, (key, value) in enumerate(entries):
+                if key not in failed and not runGroup([index]):
+                    failed.add(key)
+        elif len(groups) == 1:
+            runGroup(list(groups.values())[0])
+        else:
+            pool = Pool(min(self.concurrency, len(groups)))
+            for indexes in groups.values():
+                pool.spawn(runGroup, indexes)
+            pool.join()
+
+        for error in errors:
+            if error is not None:
+                six.reraise(*error)
+        return results
@@ -0,0 +1,75 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import json
+import weakref
+from threading import Lock
+
+from .snapshot import freeze, FrozenList
+
+
+class InternedConstraints(FrozenList):
+    """A constraint set held by a ConstraintPool, along with the documents
+    derived from it. The pool only holds a weak reference, so the set and its
+    documents are released once no device uses them"""
+
+    __slots__ = ("__weakref__", "documents")
+
+    def __init__(self, legs):
+        FrozenList.__init__(self, legs)
+        object.__setattr__(self, "documents", {})
+
+
+class ConstraintPool:
+    """Interns constraint sets, which are lists of per-leg constraints, so
+    that every device with identical constraints points at one shared,
+    read only copy. Documents derived from a shared set, such as the
+    filtered constraints served by the API, are cached alongside it. Sets
+    are only kept while a device refers to them, so a service whose devices
+    come and go doesn't accumulate them"""
+
+    def __init__(self):
+        self._sets = weakref.WeakValueDictionary()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._sets)
+
+    def intern(self, constraints):
+        """Get the shared frozen copy of a constraint set"""
+        key = json.dumps(constraints, sort_keys=True)
+        shared = self._sets.get(key)
+        if shared is None:
+            interned = InternedConstraints(freeze(constraints))
+            with self._lock:
+                shared = self._sets.setdefault(key, interned)
+        return shared
+
+    def document(self, constraints, variant, build):
+        """Get the document built by build(constraints) for an interned set,
+        building it only the first time it is asked for. variant must
+        identify everything other than the constraints that build depends
+        on. The result is frozen and shared, so must not be modified"""
+        document = constraints.documents.get(variant)
+        if document is None:
+            document = freeze(build(constraints))
+            with self._lock:
+                document = constraints.documents.setdefault(variant, document)
+        return document
+
+
+# Process wide pool shared by every device
+constraintPool = ConstraintPool()
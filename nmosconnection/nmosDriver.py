@@ -35,6 +35,8 @@ from .sdpFactory import senderFileFactory
 from .facadeWrapper import SimpleFacadeWrapper
 from .api import CONN_ROOT, CONN_APIVERSIONS
 
+__tp__ = 'transport_params'
+
 # Set this to change the port the API is presented on
 WS_PORT = 8858
 
@@ -188,7 +190,7 @@ class NmosDriverWebApi(WebAPI):
         # Provide the API a method to call on activation
         fileFactory = senderFileFactory(sender)
         controller = activationController(senderId, sender, self.facadeWrapper, fileFactory)
-        sender.setActivateCallback(controller.activateSender)
+        sender.setActivateCallback(controller.activateSender, delta=True)
         sender.activateStaged()
         # Add the sender to the IS-05 API
         self.manager.addSender(sender, senderId)
@@ -225,7 +227,7 @@ class NmosDriverWebApi(WebAPI):
         receiver.activateStaged()
         receiverId = str(uuid4())
         controller = activationController(receiverId, receiver, self.facadeWrapper)
-        receiver.setActivateCallback(controller.activateReceiver)
+        receiver.setActivateCallback(controller.activateReceiver, delta=True)
         self.manager.addReceiver(receiver, receiverId)
         # Add receiver to IS-04
         self.facadeWrapper.registerReceiver(receiverId)
@@ -288,9 +290,11 @@ class activationController:
         self.facadeWrapper = facadeWrapper
         self.fileFactory = fileFactory
 
-    def activateSender(self):
-        self.fileFactory.activateCallback()
+    def activateSender(self, delta):
+        # The SDP file only depends on the transport parameters
+        if __tp__ in delta:
+            self.fileFactory.activateCallback()
         self.facadeWrapper.updateSender(self.portId)
 
-    def activateReceiver(self):
+    def activateReceiver(self, delta):
         self.facadeWrapper.updateReceiver(self.portId)
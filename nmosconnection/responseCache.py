@@ -0,0 +1,51 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import json
+from threading import Lock
+
+
+def encodeJson(obj):
+    """Encode a document the same way as the JSON responses built by nmoscommon"""
+    return json.dumps(obj, indent=4).encode("utf-8")
+
+
+class ResponseCache:
+    """Encoded response bodies for each device, stored against the ETag they
+    were built for. An entry is rebuilt as soon as its ETag changes, so
+    anything that bumps a version number invalidates it"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, transceiverId, resource, etag, build):
+        """Get the encoded body of resource for the ETag, calling build() to
+        produce it if the cached copy is missing or out of date"""
+        entries = self._entries.get(transceiverId)
+        if entries is not None:
+            entry = entries.get(resource)
+            if entry is not None and entry[0] == etag:
+                return entry[1]
+        data = build()
+        with self._lock:
+            self._entries.setdefault(transceiverId, {})[resource] = (etag, data)
+        return data
+
+    def discard(self, transceiverId):
+        """Drop everything held for a device"""
+        with self._lock:
+            self._entries.pop(transceiverId, None)
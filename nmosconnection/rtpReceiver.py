@@ -14,22 +14,41 @@
 
 from __future__ import absolute_import
 
-import os
-import json
 import copy
 
 from .abstractDevice import AbstractDevice
 from .constants import SCHEMA_LOCAL
-
-__location__ = os.path.realpath(
-    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+from .snapshot import FrozenRecord, setIn
+from .selectors import Selector
 
 __tp__ = 'transport_params'
 __sd__ = 'session_description'
 
 
+class RtpReceiverLeg(FrozenRecord):
+    """Transport parameters for one leg of an RTP receiver"""
+    __slots__ = (
+        'source_ip', 'interface_ip', 'multicast_ip', 'destination_port',
+        'fec_enabled', 'fec_destination_ip', 'fec_mode',
+        'fec1D_destination_port', 'fec2D_destination_port', 'rtcp_enabled',
+        'rtcp_destination_ip', 'rtcp_destination_port', 'rtp_enabled'
+    )
+
+
 class RtpReceiver(AbstractDevice):
 
+    paramsSchemaFile = 'v1.0_receiver_transport_params_rtp.json'
+    legRecord = RtpReceiverLeg
+    resolvers = [
+        ("interface_ip", "interfaceSelector", None),
+        ("destination_port", "_resolveInterfacePort", ()),
+        ("fec_destination_ip", "_resolveFecIp", ("multicast_ip", "interface_ip")),
+        ("fec1D_destination_port", "_resolveFec1DDestPort", ("destination_port",)),
+        ("fec2D_destination_port", "_resolveFec2DDestPort", ("destination_port",)),
+        ("rtcp_destination_ip", "_resolveRtcpDestIp", ("multicast_ip", "interface_ip")),
+        ("rtcp_destination_port", "_resolveRtcpDestPort", ("destination_port",))
+    ]
+
     def __init__(self, logger, transportManagerClass, legs=1):
         """All IP and Port parameters should be tuples containing one
         entry for each leg. In single leg mode the second entry of each
@@ -44,10 +63,8 @@ class RtpReceiver(AbstractDevice):
 
         self.legs = legs
         self.transportManagers = []
-        self.staged[__tp__] = list(range(legs))
-        self.staged[__tp__][0] = {}
-        if legs == 2:
-            self.staged[__tp__][1] = {}
+        staged = dict(self.staged)
+        staged[__tp__] = []
 
         # Set collections of parameters
         self.generalParams = ['source_ip', 'multicast_ip', 'interface_ip', 'destination_port', 'rtp_enabled']
@@ -62,89 +79,76 @@ class RtpReceiver(AbstractDevice):
             self.transportManagers.append(
                 transportManagerClass(self.logger, self)
             )
-            self.staged[__tp__][leg]['source_ip'] = None
-            self.staged[__tp__][leg]['interface_ip'] = "auto"
-            self.staged[__tp__][leg]['multicast_ip'] = None
-            self.staged[__tp__][leg]['destination_port'] = 5004
-            self.staged[__tp__][leg]['fec_enabled'] = False
-            self.staged[__tp__][leg]['fec_destination_ip'] = "auto"
-            self.staged[__tp__][leg]['fec_mode'] = "1D"
-            self.staged[__tp__][leg]['fec1D_destination_port'] = "auto"
-            self.staged[__tp__][leg]['fec2D_destination_port'] = "auto"
-            self.staged[__tp__][leg]['rtcp_enabled'] = False
-            self.staged[__tp__][leg]['rtcp_destination_ip'] = "auto"
-            self.staged[__tp__][leg]['rtcp_destination_port'] = "auto"
-            self.staged[__tp__][leg]['rtp_enabled'] = True
-        self.staged['sender_id'] = None
+            params = {}
+            params['source_ip'] = None
+            params['interface_ip'] = "auto"
+            params['multicast_ip'] = None
+            params['destination_port'] = 5004
+            params['fec_enabled'] = False
+            params['fec_destination_ip'] = "auto"
+            params['fec_mode'] = "1D"
+            params['fec1D_destination_port'] = "auto"
+            params['fec2D_destination_port'] = "auto"
+            params['rtcp_enabled'] = False
+            params['rtcp_destination_ip'] = "auto"
+            params['rtcp_destination_port'] = "auto"
+            params['rtp_enabled'] = True
+            staged[__tp__].append(params)
+        staged['sender_id'] = None
+        self.staged = staged
 
         self._enableRtcp = True
         self._enableFec = True
         self._initConstraints()
 
     def _initConstraints(self):
-        self.constraints = []
+        constraints = []
         for leg in range(0, self.legs):
-            self.constraints.append({})
+            constraints.append({})
             for param in self.generalParams:
-                self.constraints[leg][param] = {}
+                constraints[leg][param] = {}
             for param in self.fecParams:
-                self.constraints[leg][param] = {}
+                constraints[leg][param] = {}
             for param in self.rtcpParams:
-                self.constraints[leg][param] = {}
-        self._initInterfaceConstraints()
+                constraints[leg][param] = {}
+        self._initInterfaceConstraints(constraints)
+        self.constraints = constraints
 
-    def _initInterfaceConstraints(self):
+    def _initInterfaceConstraints(self, constraints):
         for leg in range(0, self.legs):
-            self.constraints[leg]['interface_ip']['enum'] = ["auto"]
+            constraints[leg]['interface_ip']['enum'] = ["auto"]
 
     def addInterface(self, addr, leg=0):
         """Used to add allowed revieve interfaces"""
         # Check supplied IP is valid
         if self._checkIsIpv4(addr) or self._checkIsIpv6(addr):
-            self.constraints[leg]['interface_ip']['enum'].append(addr)
+            enum = self._constraints[leg]['interface_ip']['enum']
+            self.constraints = setIn(self._constraints, [leg, 'interface_ip', 'enum'], enum + [addr])
         else:
             self.logger.writeWarning("Driver tried to add an interface with an invalid IP: {}".format(addr))
             raise ValueError("Invalid IP added by driver")
 
-    def setInterfaceResoltionMethod(self, method):
+    def setInterfaceResoltionMethod(self, method, timeout=None, fallback=None):
         """May be used by the driver to insert a custom
         method that can be called during parameter resolution
         to automatically select the correct interface to use
-        for a given set of parameters"""
-        self.interfaceSelector = method
+        for a given set of parameters. See Selector for the use
+        of timeout and fallback"""
+        self.interfaceSelector = Selector(method, timeout, fallback, self.logger)
 
     def defaultInterfaceSelector(self, parameterSet, leg):
         """In the absense of the driver having supplied an interface
         resolution method this method just returns the first interface
         on the list"""
         try:
-            return self.constraints[leg]['interface_ip']['enum'][1]
+            return self._constraints[leg]['interface_ip']['enum'][1]
         except IndexError:
             self.logger.writeError("Driver has not supplied an interface for the receiver, cannot resolve interface ip")
             return None
 
     def resolveParameters(self, parameterSet):
-        """For all parameters that may be set to auto run through and resolve
-        their actual values"""
         self.logger.writeDebug("Starting receiver parameter resolution")
-        toReturn = copy.deepcopy(parameterSet)
-        resolveLookup = {
-            "interface_ip": self.interfaceSelector,
-            "destination_port": self._resolveInterfacePort,
-            "fec_destination_ip": self._resolveFecIp,
-            "fec1D_destination_port": self._resolveFec1DDestPort,
-            "fec2D_destination_port": self._resolveFec2DDestPort,
-            "rtcp_destination_ip": self._resolveRtcpDestIp,
-            "rtcp_destination_port": self._resolveRtcpDestPort
-        }
-        order = ["interface_ip", "destination_port", "fec_destination_ip",
-                 "fec1D_destination_port", "fec2D_destination_port",
-                 "rtcp_destination_ip", "rtcp_destination_port"]
-        for leg in range(0, len(toReturn[__tp__])):
-            for key in order:
-                if parameterSet[__tp__][leg][key] == "auto":
-                    toReturn[__tp__][leg][key] = resolveLookup[key](toReturn[__tp__], leg)
-        return toReturn
+        return super(RtpReceiver, self).resolveParameters(parameterSet)
 
     def _resolveRtcpDestPort(self, parameterSet, leg):
         return parameterSet[leg]['destination_port'] + 1
@@ -175,10 +179,14 @@ class RtpReceiver(AbstractDevice):
         return 5004
 
     def supportRtcp(self, support=True):
-        self._enableRtcp = support
+        if support != self._enableRtcp:
+            self._enableRtcp = support
+            self.constraintsChanged()
 
     def supportFec(self, support=True):
-        self._enableFec = support
+        if support != self._enableFec:
+            self._enableFec = support
+            self.constraintsChanged()
 
     def _assembleJsonDescription(self, params):
         """Assemble a dictionary only of parameters required currently"""
@@ -193,15 +201,8 @@ class RtpReceiver(AbstractDevice):
         toReturn.pop('receiver_id')
         return toReturn
 
-    def getParamsSchema(self, leg):
-        """Get the schema of the transport params"""
-        schema = self.schemaPath + 'v1.0_receiver_transport_params_rtp.json'
-        try:
-            schemaPath = os.path.join(__location__, schema)
-            with open(schemaPath) as json_data:
-                obj = json.loads(json_data.read())
-        except EnvironmentError:
-            raise IOError('failed to load schema file at: {}'.format(schemaPath))
+    def _buildParamsSchema(self, obj, leg):
+        """Filter the base transport params schema and merge in constraints"""
         params = obj['items']['properties']
         if not self._enableFec:
             for key in self.fecParams:
@@ -213,15 +214,18 @@ class RtpReceiver(AbstractDevice):
                     params.pop(key)
         # Merge in extra requirements required by constraints
         for key, entry in params.items():
-            if key in self.constraints[leg]:
-                entry.update(self.constraints[leg][key])
+            if key in self._constraints[leg]:
+                entry.update(copy.deepcopy(self._constraints[leg][key]))
         obj['items']['properties'] = params
         return obj
 
     def getConstraints(self):
-        toReturn = copy.deepcopy(self.constraints)
+        return self._getConstraintsDocument((self._enableFec, self._enableRtcp), self._filterConstraints)
+
+    def _filterConstraints(self, constraints):
+        toReturn = copy.deepcopy(constraints)
         for leg in range(0, self.legs):
-            for key, value in self.constraints[leg].items():
+            for key, value in constraints[leg].items():
                 if not self._enableFec:
                     if key in self.fecParams:
                         toReturn[leg].pop(key)
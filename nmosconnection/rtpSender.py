@@ -14,20 +14,47 @@
 
 from __future__ import absolute_import
 
-import os
-import json
 import copy
 from .abstractDevice import AbstractDevice
 from .constants import SCHEMA_LOCAL
-
-__location__ = os.path.realpath(
-    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+from .snapshot import FrozenRecord, setIn
+from .selectors import Selector
+from .versions import nextVersion
 
 __tp__ = 'transport_params'
 
 
+class RtpSenderLeg(FrozenRecord):
+    """Transport parameters for one leg of an RTP sender"""
+    __slots__ = (
+        'source_ip', 'destination_ip', 'destination_port', 'source_port',
+        'fec_enabled', 'fec_destination_ip', 'fec_mode', 'fec_type',
+        'fec_block_width', 'fec_block_height', 'fec1D_destination_port',
+        'fec2D_destination_port', 'fec1D_source_port', 'fec2D_source_port',
+        'rtcp_enabled', 'rtcp_destination_ip', 'rtcp_destination_port',
+        'rtcp_source_port', 'rtp_enabled'
+    )
+
+
 class RtpSender(AbstractDevice):
 
+    paramsSchemaFile = 'v1.0_sender_transport_params_rtp.json'
+    legRecord = RtpSenderLeg
+    resolvers = [
+        ("source_ip", "sourceSelector", None),
+        ("destination_ip", "destinationSelector", None),
+        ("source_port", "_resolveSourcePort", ()),
+        ("destination_port", "_resolveDestinationPort", ()),
+        ("fec_destination_ip", "_resolveFecIp", ("destination_ip",)),
+        ("fec1D_destination_port", "_resolveFec1DDestPort", ("destination_port",)),
+        ("fec2D_destination_port", "_resolveFec2DDestPort", ("destination_port",)),
+        ("fec1D_source_port", "_resolveFec1DSrcPort", ("source_port",)),
+        ("fec2D_source_port", "_resolveFec2DSrcPort", ("source_port",)),
+        ("rtcp_source_port", "_resolveRtcpSrcPort", ("source_port",)),
+        ("rtcp_destination_ip", "_resolveRtcpDestIp", ("destination_ip",)),
+        ("rtcp_destination_port", "_resolveRtcpDestPort", ("destination_port",))
+    ]
+
     def __init__(self, logger, legs=1):
         """All IP and Port parameters should be tuples containing one
         entry for each leg. In single leg mode the second entry of each
@@ -43,10 +70,8 @@ class RtpSender(AbstractDevice):
         self.destinationSelector = self.defaultDestinationSelector
 
         self.legs = legs
-        self.staged[__tp__] = list(range(legs))
-        self.staged[__tp__][0] = {}
-        if legs == 2:
-            self.staged[__tp__][1] = {}
+        staged = dict(self.staged)
+        staged[__tp__] = []
 
         # Set collections of parameters
         self.generalParams = [
@@ -63,27 +88,30 @@ class RtpSender(AbstractDevice):
 
         # Set up default values as per spec.
         for leg in range(0, legs):
-            self.staged[__tp__][leg]['source_ip'] = "auto"
-            self.staged[__tp__][leg]['destination_ip'] = "auto"
-            self.staged[__tp__][leg]['destination_port'] = 5004
-            self.staged[__tp__][leg]['source_port'] = "auto"
-            self.staged[__tp__][leg]['fec_enabled'] = False
-            self.staged[__tp__][leg]['fec_destination_ip'] = "auto"
-            self.staged[__tp__][leg]['fec_mode'] = "1D"
-            self.staged[__tp__][leg]['fec_type'] = "XOR"
-            self.staged[__tp__][leg]['fec_block_width'] = 4
-            self.staged[__tp__][leg]['fec_block_height'] = 4
-            self.staged[__tp__][leg]['fec1D_destination_port'] = "auto"
-            self.staged[__tp__][leg]['fec2D_destination_port'] = "auto"
-            self.staged[__tp__][leg]['fec1D_source_port'] = "auto"
-            self.staged[__tp__][leg]['fec2D_source_port'] = "auto"
-            self.staged[__tp__][leg]['rtcp_enabled'] = False
-            self.staged[__tp__][leg]['rtcp_destination_ip'] = "auto"
-            self.staged[__tp__][leg]['rtcp_destination_port'] = "auto"
-            self.staged[__tp__][leg]['rtcp_source_port'] = "auto"
-            self.staged[__tp__][leg]['rtp_enabled'] = True
-        self.staged['receiver_id'] = None
-        self.staged['master_enable'] = False
+            params = {}
+            params['source_ip'] = "auto"
+            params['destination_ip'] = "auto"
+            params['destination_port'] = 5004
+            params['source_port'] = "auto"
+            params['fec_enabled'] = False
+            params['fec_destination_ip'] = "auto"
+            params['fec_mode'] = "1D"
+            params['fec_type'] = "XOR"
+            params['fec_block_width'] = 4
+            params['fec_block_height'] = 4
+            params['fec1D_destination_port'] = "auto"
+            params['fec2D_destination_port'] = "auto"
+            params['fec1D_source_port'] = "auto"
+            params['fec2D_source_port'] = "auto"
+            params['rtcp_enabled'] = False
+            params['rtcp_destination_ip'] = "auto"
+            params['rtcp_destination_port'] = "auto"
+            params['rtcp_source_port'] = "auto"
+            params['rtp_enabled'] = True
+            staged[__tp__].append(params)
+        staged['receiver_id'] = None
+        staged['master_enable'] = False
+        self.staged = staged
         self.transportFile = ""
 
         self._enableRtcp = True
@@ -91,48 +119,65 @@ class RtpSender(AbstractDevice):
         self._initConstraints()
         self.activateStaged()
 
+    @property
+    def transportFile(self):
+        return self._transportFile
+
+    @transportFile.setter
+    def transportFile(self, transportFile):
+        self._transportFile = transportFile
+        self.transportFileVersion = nextVersion()
+
     def supportRtcp(self, support=True):
-        self._enableRtcp = support
+        if support != self._enableRtcp:
+            self._enableRtcp = support
+            self.constraintsChanged()
 
     def supportFec(self, support=True):
-        self._enableFec = support
+        if support != self._enableFec:
+            self._enableFec = support
+            self.constraintsChanged()
 
     def _initConstraints(self):
-        self.constraints = []
+        constraints = []
         for leg in range(0, self.legs):
-            self.constraints.append({})
+            constraints.append({})
             for param in self.generalParams:
-                self.constraints[leg][param] = {}
+                constraints[leg][param] = {}
             for param in self.fecParams:
-                self.constraints[leg][param] = {}
+                constraints[leg][param] = {}
             for param in self.rtcpParams:
-                self.constraints[leg][param] = {}
-        self._initSourceConstraints()
+                constraints[leg][param] = {}
+        self._initSourceConstraints(constraints)
+        self.constraints = constraints
 
-    def _initSourceConstraints(self):
+    def _initSourceConstraints(self, constraints):
         for leg in range(0, self.legs):
-            self.constraints[leg]['source_ip']['enum'] = ["auto"]
+            constraints[leg]['source_ip']['enum'] = ["auto"]
 
     def addInterface(self, addr, leg=0):
         """Used to add allowed source IPs"""
         # Check supplied IP is valid
         if self._checkIsIpv4(addr) or self._checkIsIpv6(addr):
-            self.constraints[leg]['source_ip']['enum'].append(addr)
+            enum = self._constraints[leg]['source_ip']['enum']
+            self.constraints = setIn(self._constraints, [leg, 'source_ip', 'enum'], enum + [addr])
         else:
             self.logger.writeWarning("Driver tried to provide an invalid source IP: {}".format(addr))
             raise ValueError("Invalid source IP added by driver")
 
-    def setDestinationSelector(self, selector):
+    def setDestinationSelector(self, selector, timeout=None, fallback=None):
         """Set the method used to select the destination IP
         address. The method must accept two parameters, which are
-        the staged parameter set and the 0 based leg number."""
-        self.destinationSelector = selector
+        the staged parameter set and the 0 based leg number. See
+        Selector for the use of timeout and fallback."""
+        self.destinationSelector = Selector(selector, timeout, fallback, self.logger)
 
-    def setSourceSelector(self, selector):
+    def setSourceSelector(self, selector, timeout=None, fallback=None):
         """Set the method used to select the source IP address.
         The method must accept two parameters, which are
-        the staged parameter set and the 0 based leg number."""
-        self.sourceSelector = selector
+        the staged parameter set and the 0 based leg number. See
+        Selector for the use of timeout and fallback."""
+        self.sourceSelector = Selector(selector, timeout, fallback, self.logger)
 
     def defaultDestinationSelector(self, parameterSet, leg):
         """This method provides a 'dummy' loopback destination
@@ -150,40 +195,11 @@ class RtpSender(AbstractDevice):
         resolution method this method just returns the first source IP
         on the list"""
         try:
-            return self.constraints[leg]['source_ip']['enum'][1]
+            return self._constraints[leg]['source_ip']['enum'][1]
         except IndexError:
             self.logger.writeError("Driver has not supplied a source for the receiver, cannot resolve source ip")
             return None
 
-    def resolveParameters(self, parameterSet):
-        """For all parameters that may be set to auto run through and resolve
-        their actual values"""
-        toReturn = copy.deepcopy(parameterSet)
-        resolveLookup = {
-            "source_ip": self.sourceSelector,
-            "destination_ip": self.destinationSelector,
-            "source_port": self._resolveSourcePort,
-            "destination_port": self._resolveDestinationPort,
-            "fec_destination_ip": self._resolveFecIp,
-            "fec1D_destination_port": self._resolveFec1DDestPort,
-            "fec2D_destination_port": self._resolveFec2DDestPort,
-            "fec1D_source_port": self._resolveFec1DSrcPort,
-            "fec2D_source_port": self._resolveFec2DSrcPort,
-            "rtcp_destination_ip": self._resolveRtcpDestIp,
-            "rtcp_source_port": self._resolveRtcpSrcPort,
-            "rtcp_destination_port": self._resolveRtcpDestPort
-        }
-        order = ["source_ip", "destination_ip", "source_port",
-                 "destination_port", "fec_destination_ip",
-                 "fec1D_destination_port", "fec2D_destination_port",
-                 "fec1D_source_port", "fec2D_source_port", "rtcp_source_port",
-                 "rtcp_destination_ip", "rtcp_destination_port"]
-        for leg in range(0, len(toReturn[__tp__])):
-            for key in order:
-                if parameterSet[__tp__][leg][key] == "auto":
-                    toReturn[__tp__][leg][key] = resolveLookup[key](toReturn[__tp__], leg)
-        return toReturn
-
     def _resolveRtcpDestPort(self, parameterSet, leg):
         return parameterSet[leg]['destination_port'] + 1
 
@@ -227,15 +243,8 @@ class RtpSender(AbstractDevice):
         toReturn.pop('sender_id')
         return toReturn
 
-    def getParamsSchema(self, leg=0):
-        """Get the schema of the transport params"""
-        schema = self.schemaPath + 'v1.0_sender_transport_params_rtp.json'
-        try:
-            schemaPath = os.path.join(__location__, schema)
-            with open(schemaPath) as json_data:
-                obj = json.loads(json_data.read())
-        except EnvironmentError:
-            raise IOError('failed to load schema file')
+    def _buildParamsSchema(self, obj, leg):
+        """Filter the base transport params schema and merge in constraints"""
         params = obj['items']['properties']
         if not self._enableFec:
             for key in self.fecParams:
@@ -247,15 +256,18 @@ class RtpSender(AbstractDevice):
                     params.pop(key)
         # Merge in extra requirements required by constraints
         for key, entry in params.items():
-            if key in self.constraints[leg]:
-                entry.update(self.constraints[leg][key])
+            if key in self._constraints[leg]:
+                entry.update(copy.deepcopy(self._constraints[leg][key]))
         obj['items']['properties'] = params
         return obj
 
     def getConstraints(self):
-        toReturn = copy.deepcopy(self.constraints)
+        return self._getConstraintsDocument((self._enableFec, self._enableRtcp), self._filterConstraints)
+
+    def _filterConstraints(self, constraints):
+        toReturn = copy.deepcopy(constraints)
         for leg in range(0, self.legs):
-            for key, value in self.constraints[leg].items():
+            for key, value in constraints[leg].items():
                 if not self._enableFec:
                     if key in self.fecParams:
                         toReturn[leg].pop(key)
@@ -0,0 +1,185 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import time
+import heapq
+import itertools
+import logging
+from collections import deque
+from threading import Thread, Condition, Event
+
+_clock = getattr(time, "monotonic", time.time)
+
+logger = logging.getLogger(__name__)
+
+# Largest number of callbacks run at once
+DEFAULT_SCHEDULER_WORKERS = 16
+
+
+class ScheduledEvent:
+    """Handle for a callback waiting in an ActivationScheduler"""
+
+    def __init__(self, scheduler, when, callback, args):
+        self.scheduler = scheduler
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.started = False
+        self.finished = False
+        self._done = None
+
+    def cancel(self):
+        """Stop the callback from running, if it hasn't already started"""
+        self.scheduler._cancel(self)
+
+    def wait(self, timeout=None):
+        """Block until the callback has run or been cancelled. Returns False on timeout"""
+        with self.scheduler._condition:
+            if self.finished:
+                return True
+            if self._done is None:
+                self._done = Event()
+            done = self._done
+        return done.wait(timeout)
+
+
+class ActivationScheduler:
+    """Runs callbacks at a given time using one heap of pending events and a
+    single dispatcher thread, rather than a thread or greenlet per event.
+    Scheduling is O(log n). Cancelling is O(1): cancelled events stay in the
+    heap and are skipped, and the heap is compacted once they make up half
+    of it.
+
+    Due events are handed to a pool of up to workers threads, started as
+    they are needed, so a callback that blocks (such as one waiting for its
+    device's lane) only holds up others once every worker is busy. Events
+    are started in due order.
+
+    Each worker is a native thread with its own gevent hub. Callbacks may
+    use gevent from it: they can take a device's lane (a gevent RLock, which
+    can be waited on from any thread) while a request greenlet on the main
+    hub holds it, and spawn greenlets or use gevent pools, which run on the
+    worker's hub. This is how Activator's scheduled activations run
+    parameter resolution and group activations. A lane released on the
+    main hub only wakes a waiting worker once that hub runs again, which the
+    API's server always does, so the main thread must not block natively
+    while a callback waits for a lane it has just released"""
+
+    def __init__(self, workers=DEFAULT_SCHEDULER_WORKERS):
+        self.workers = workers
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = Condition()
+        self._cancelled = 0
+        self._thread = None
+        self._due = deque()
+        self._dueCondition = Condition()
+        self._idle = 0
+        self._workerCount = 0
+
+    def __len__(self):
+        """Number of events waiting to run"""
+        with self._condition:
+            return len(self._heap) - self._cancelled
+
+    def now(self):
+        """The scheduler's clock, in seconds"""
+        return _clock()
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) after delay seconds. Returns a ScheduledEvent"""
+        event = ScheduledEvent(self, _clock() + max(delay, 0), callback, args)
+        with self._condition:
+            heapq.heappush(self._heap, (event.when, next(self._counter), event))
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="ActivationScheduler")
+                self._thread.daemon = True
+                self._thread.start()
+            elif self._heap[0][2] is event:
+                # The dispatcher is waiting on a later event
+                self._condition.notify()
+        return event
+
+    def _cancel(self, event):
+        with self._condition:
+            if event.cancelled or event.started:
+                return
+            event.cancelled = True
+            self._cancelled += 1
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+            self._finish(event)
+
+    def _finish(self, event):
+        event.finished = True
+        if event._done is not None:
+            event._done.set()
+
+    def _next(self):
+        """Wait for the next due event, removing it from the heap"""
+        with self._condition:
+            while True:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - _clock()
+                if delay <= 0:
+                    event = heapq.heappop(self._heap)[2]
+                    event.started = True
+                    return event
+                self._condition.wait(delay)
+
+    def _run(self):
+        while True:
+            self._dispatch(self._next())
+
+    def _dispatch(self, event):
+        """Queue a due event for a worker, starting another worker if every
+        one is busy and there are fewer than self.workers"""
+        with self._dueCondition:
+            self._due.append(event)
+            if len(self._due) <= self._idle:
+                self._dueCondition.notify()
+            elif self._workerCount < self.workers:
+                self._workerCount += 1
+                worker = Thread(target=self._work, name="ActivationScheduler-{}".format(self._workerCount))
+                worker.daemon = True
+                worker.start()
+
+    def _work(self):
+        while True:
+            with self._dueCondition:
+                while not self._due:
+                    self._idle += 1
+                    self._dueCondition.wait()
+                    self._idle -= 1
+                event = self._due.popleft()
+            try:
+                event.callback(*event.args)
+            except Exception:
+                logger.exception("Scheduled callback %r failed", event.callback)
+            with self._condition:
+                self._finish(event)
+
+
+# Process wide scheduler used by every Activator
+activationScheduler = ActivationScheduler()
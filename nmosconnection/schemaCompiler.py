@@ -0,0 +1,290 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Generates plain Python validation functions from the draft-04 JSON
+# schemas used by the API. The generated code only decides whether a
+# document is valid. Documents it rejects are passed to jsonschema so that
+# the error raised (message, path, schema path) is exactly the one
+# jsonschema would have produced.
+
+from __future__ import absolute_import
+
+import re
+import numbers
+import six
+from jsonschema.validators import validator_for
+
+DRAFT4_SCHEMAS = [
+    "http://json-schema.org/draft-04/schema#",
+    "http://json-schema.org/draft-04/schema"
+]
+
+# Keywords that have no effect on validation
+IGNORED_KEYWORDS = [
+    "$schema", "id", "title", "description", "default", "definitions",
+    "exclusiveMinimum", "exclusiveMaximum"
+]
+
+# Validation keywords the generator doesn't handle. Schemas using these
+# are validated by jsonschema instead
+UNSUPPORTED_KEYWORDS = [
+    "$ref", "dependencies", "patternProperties", "additionalItems",
+    "uniqueItems", "multipleOf", "minLength", "maxLength", "minProperties",
+    "maxProperties"
+]
+
+TYPE_CHECKS = {
+    "string": "isinstance({0}, _str)",
+    "integer": "(isinstance({0}, _int) and not isinstance({0}, bool))",
+    "number": "(isinstance({0}, _number) and not isinstance({0}, bool))",
+    "boolean": "isinstance({0}, bool)",
+    "null": "{0} is None",
+    "object": "isinstance({0}, dict)",
+    "array": "isinstance({0}, list)"
+}
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+def _equal(one, two):
+    """Equality as used by jsonschema for enums, where booleans
+    never compare equal to numbers"""
+    if one is two:
+        return True
+    if isinstance(one, six.string_types) or isinstance(two, six.string_types):
+        return one == two
+    if isinstance(one, list) and isinstance(two, list):
+        return len(one) == len(two) and all(_equal(a, b) for a, b in zip(one, two))
+    if isinstance(one, dict) and isinstance(two, dict):
+        return len(one) == len(two) and all(k in two and _equal(v, two[k]) for k, v in one.items())
+    if isinstance(one, bool) or isinstance(two, bool):
+        return False
+    return one == two
+
+
+def _inEnum(instance, enums):
+    for each in enums:
+        if _equal(each, instance):
+            return True
+    return False
+
+
+class SchemaCodeGenerator:
+    """Turns a schema into the source of a module level function named
+    'validate' that returns True if a document is valid"""
+
+    def __init__(self, schema, formatChecker=None):
+        self.schema = schema
+        self.formatChecker = formatChecker
+        self.namespace = {
+            "_str": six.string_types,
+            "_int": six.integer_types,
+            "_number": numbers.Number,
+            "_inEnum": _inEnum,
+            "_formatChecker": formatChecker
+        }
+        self.blocks = []
+        self.functions = {}
+        self.counter = 0
+
+    def generate(self):
+        """Returns the generated source"""
+        if self.schema.get("$schema") not in DRAFT4_SCHEMAS:
+            raise UnsupportedSchema("Only draft-04 schemas are supported")
+        name = self._function(self.schema)
+        self.blocks.append("validate = {}".format(name))
+        return "\n\n".join(self.blocks) + "\n"
+
+    def compile(self):
+        """Returns the generated validation function"""
+        source = self.generate()
+        namespace = dict(self.namespace)
+        exec(compile(source, "<schema>", "exec"), namespace)
+        return namespace["validate"], source
+
+    def _constant(self, value, prefix="_c"):
+        self.counter += 1
+        name = "{}{}".format(prefix, self.counter)
+        self.namespace[name] = value
+        return name
+
+    def _function(self, schema):
+        """Generate a function for a (sub)schema, returning its name"""
+        if not isinstance(schema, dict):
+            raise UnsupportedSchema("Schema must be an object")
+        if id(schema) in self.functions:
+            return self.functions[id(schema)]
+        self.counter += 1
+        name = "_v{}".format(self.counter)
+        self.functions[id(schema)] = name
+        lines = []
+        for keyword, value in schema.items():
+            if keyword in UNSUPPORTED_KEYWORDS:
+                raise UnsupportedSchema("Keyword {} is not supported".format(keyword))
+            method = getattr(self, "_keyword_" + keyword, None)
+            if method is not None:
+                lines.extend(method(value, schema))
+        body = "\n".join("    " + line for line in lines)
+        self.blocks.append("def {}(x):\n{}\n    return True".format(name, body))
+        return name
+
+    def _keyword_type(self, value, schema):
+        types = value if isinstance(value, list) else [value]
+        checks = []
+        for type in types:
+            if type not in TYPE_CHECKS:
+                raise UnsupportedSchema("Type {} is not supported".format(type))
+            checks.append(TYPE_CHECKS[type].format("x"))
+        return ["if not ({}):".format(" or ".join(checks)), "    return False"]
+
+    def _keyword_enum(self, value, schema):
+        strings = [each for each in value if isinstance(each, six.string_types)]
+        others = [each for each in value if not isinstance(each, six.string_types)]
+        if all(each is None for each in others):
+            check = "(isinstance(x, _str) and x in {})".format(self._constant(frozenset(strings)))
+            if others:
+                check = "(x is None or {})".format(check)
+        else:
+            check = "_inEnum(x, {})".format(self._constant(list(value)))
+        return ["if not {}:".format(check), "    return False"]
+
+    def _keyword_minimum(self, value, schema):
+        op = "<=" if schema.get("exclusiveMinimum", False) else "<"
+        return [
+            "if {} and x {} {}:".format(TYPE_CHECKS["number"].format("x"), op, self._constant(value)),
+            "    return False"
+        ]
+
+    def _keyword_maximum(self, value, schema):
+        op = ">=" if schema.get("exclusiveMaximum", False) else ">"
+        return [
+            "if {} and x {} {}:".format(TYPE_CHECKS["number"].format("x"), op, self._constant(value)),
+            "    return False"
+        ]
+
+    def _keyword_pattern(self, value, schema):
+        search = self._constant(re.compile(value).search, "_re")
+        return ["if isinstance(x, _str) and not {}(x):".format(search), "    return False"]
+
+    def _keyword_format(self, value, schema):
+        if self.formatChecker is None:
+            return []
+        return ["if not _formatChecker.conforms(x, {!r}):".format(value), "    return False"]
+
+    def _keyword_properties(self, value, schema):
+        lines = ["if isinstance(x, dict):"]
+        for key, subschema in value.items():
+            name = self._function(subschema)
+            lines.append("    if {0!r} in x and not {1}(x[{0!r}]):".format(key, name))
+            lines.append("        return False")
+        return lines if len(lines) > 1 else []
+
+    def _keyword_additionalProperties(self, value, schema):
+        known = self._constant(frozenset(schema.get("properties", {})))
+        if value is False:
+            return [
+                "if isinstance(x, dict) and not {}.issuperset(x):".format(known),
+                "    return False"
+            ]
+        if isinstance(value, dict):
+            name = self._function(value)
+            return [
+                "if isinstance(x, dict):",
+                "    for key in x:",
+                "        if key not in {} and not {}(x[key]):".format(known, name),
+                "            return False"
+            ]
+        return []
+
+    def _keyword_required(self, value, schema):
+        lines = ["if isinstance(x, dict):"]
+        for key in value:
+            lines.append("    if {!r} not in x:".format(key))
+            lines.append("        return False")
+        return lines if len(lines) > 1 else []
+
+    def _keyword_items(self, value, schema):
+        if isinstance(value, list):
+            lines = ["if isinstance(x, list):"]
+            for index, subschema in enumerate(value):
+                name = self._function(subschema)
+                lines.append("    if len(x) > {0} and not {1}(x[{0}]):".format(index, name))
+                lines.append("        return False")
+            return lines if len(lines) > 1 else []
+        name = self._function(value)
+        return [
+            "if isinstance(x, list):",
+            "    for item in x:",
+            "        if not {}(item):".format(name),
+            "            return False"
+        ]
+
+    def _keyword_maxItems(self, value, schema):
+        return ["if isinstance(x, list) and len(x) > {}:".format(int(value)), "    return False"]
+
+    def _keyword_minItems(self, value, schema):
+        return ["if isinstance(x, list) and len(x) < {}:".format(int(value)), "    return False"]
+
+    def _keyword_anyOf(self, value, schema):
+        names = [self._function(subschema) for subschema in value]
+        return ["if not ({}):".format(" or ".join(name + "(x)" for name in names)), "    return False"]
+
+    def _keyword_allOf(self, value, schema):
+        names = [self._function(subschema) for subschema in value]
+        return ["if not ({}):".format(" and ".join(name + "(x)" for name in names)), "    return False"]
+
+    def _keyword_oneOf(self, value, schema):
+        names = [self._function(subschema) for subschema in value]
+        return ["if ({}) != 1:".format(" + ".join(name + "(x)" for name in names)), "    return False"]
+
+    def _keyword_not(self, value, schema):
+        return ["if {}(x):".format(self._function(value)), "    return False"]
+
+
+class CompiledValidator:
+    """Validator backed by generated code, with the same interface as
+    the jsonschema validators used elsewhere in the API"""
+
+    def __init__(self, schema, fallback, formatChecker=None):
+        self.schema = schema
+        self.fallback = fallback
+        self._isValid, self.source = SchemaCodeGenerator(schema, formatChecker).compile()
+
+    def is_valid(self, instance):
+        return self._isValid(instance)
+
+    def iter_errors(self, instance):
+        if self._isValid(instance):
+            return iter([])
+        return self.fallback.iter_errors(instance)
+
+    def validate(self, instance):
+        """Raise ValidationError if the instance is invalid. Errors are
+        always produced by jsonschema so that messages are unchanged"""
+        if not self._isValid(instance):
+            self.fallback.validate(instance)
+
+
+def compileValidator(schema, formatChecker=None):
+    """Get the fastest available validator for the schema. Schemas the
+    generator can't handle get a plain jsonschema validator"""
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    fallback = cls(schema, format_checker=formatChecker)
+    try:
+        return CompiledValidator(schema, fallback, formatChecker)
+    except UnsupportedSchema:
+        return fallback
@@ -0,0 +1,103 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import os
+import json
+from collections import namedtuple
+from threading import Lock
+from jsonschema import FormatChecker
+
+from .constants import SCHEMA_LOCAL
+from .schemaCompiler import compileValidator
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+SCHEMA_FORMATS = ["ipv4", "ipv6"]
+DEFAULT_API_VERSION = "v1.0"
+
+SchemaEntry = namedtuple("SchemaEntry", "path, mtime, schema, validator")
+
+
+class SchemaRegistry:
+    """Holds compiled JSON schema validators keyed by schema file name and API
+    version. Schema files are only read from disk the first time they are
+    requested, or when their modification time changes"""
+
+    def __init__(self, schemaPath=SCHEMA_LOCAL, location=__location__):
+        self.schemaPath = schemaPath
+        self.location = location
+        self.formatChecker = FormatChecker(SCHEMA_FORMATS)
+        self._entries = {}
+        self._lock = Lock()
+
+    def preload(self, schemaFiles, apiVersions=(DEFAULT_API_VERSION,)):
+        """Load and compile a set of schemas up front. Schemas that can't
+        be found are skipped, and will be loaded on first use instead"""
+        for apiVersion in apiVersions:
+            for schemaFile in schemaFiles:
+                try:
+                    self.getValidator(schemaFile, apiVersion)
+                except IOError:
+                    pass
+
+    def getSchema(self, schemaFile, apiVersion=DEFAULT_API_VERSION, schemaPath=None):
+        """Get the parsed schema. The returned object is shared and must not be modified"""
+        return self._getEntry(schemaFile, apiVersion, schemaPath).schema
+
+    def getValidator(self, schemaFile, apiVersion=DEFAULT_API_VERSION, schemaPath=None):
+        """Get a ready compiled validator for the schema"""
+        return self._getEntry(schemaFile, apiVersion, schemaPath).validator
+
+    def validate(self, obj, schemaFile, apiVersion=DEFAULT_API_VERSION, schemaPath=None):
+        """Validate obj against the schema, raising ValidationError on failure"""
+        self.getValidator(schemaFile, apiVersion, schemaPath).validate(obj)
+
+    def compile(self, schema):
+        """Compile an in memory schema into a validator using the same format
+        checker as the schemas held in the registry"""
+        return compileValidator(schema, self.formatChecker)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def _resolvePath(self, schemaFile, schemaPath):
+        if schemaPath is None:
+            schemaPath = self.schemaPath
+        return os.path.join(self.location, schemaPath + schemaFile)
+
+    def _getEntry(self, schemaFile, apiVersion, schemaPath):
+        path = self._resolvePath(schemaFile, schemaPath)
+        key = (apiVersion, schemaFile)
+        try:
+            mtime = os.path.getmtime(path)
+        except EnvironmentError:
+            raise IOError('failed to load schema file at: {}'.format(path))
+        entry = self._entries.get(key)
+        if entry is None or entry.path != path or entry.mtime != mtime:
+            with self._lock:
+                entry = self._load(path, mtime)
+                self._entries[key] = entry
+        return entry
+
+    def _load(self, path, mtime):
+        try:
+            with open(path) as json_data:
+                schema = json.loads(json_data.read())
+        except EnvironmentError:
+            raise IOError('failed to load schema file at: {}'.format(path))
+        return SchemaEntry(path, mtime, schema, self.compile(schema))
@@ -0,0 +1,64 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from .snapshot import freeze
+
+# Number of distinct SDP files whose parse results are kept
+DEFAULT_SDP_CACHE_SIZE = 256
+
+
+class SdpCache:
+    """Least recently used cache of the results of parsing SDP files, keyed
+    by a hash of the file. When a controller stages one sender's SDP onto
+    many receivers it is only parsed once. Cached results are frozen, so
+    the receivers sharing them can't modify each other's copy"""
+
+    def __init__(self, size=DEFAULT_SDP_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Forget every cached result"""
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, sdp, parse):
+        """Get the result of parsing sdp, calling parse(sdp) to produce it if
+        it isn't cached. Errors raised by parse aren't cached"""
+        key = hashlib.sha256(sdp.encode("utf-8")).digest()
+        with self._lock:
+            sources = self._entries.pop(key, None)
+            if sources is not None:
+                self._entries[key] = sources
+                return sources
+        sources = freeze(parse(sdp))
+        with self._lock:
+            self._entries[key] = sources
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return sources
+
+
+# Process wide cache shared by every SdpManager
+sdpCache = SdpCache()
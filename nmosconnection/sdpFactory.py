@@ -14,20 +14,74 @@
 
 # This class produces very simple SDP files for the nmos driver
 
+from __future__ import absolute_import
+
+from collections import namedtuple
+from operator import attrgetter
+
+__tp__ = 'transport_params'
+
+# Active parameters the SDP file depends on, read from every leg
+SDP_LEG_PARAMETERS = ("source_ip", "destination_ip", "destination_port", "rtp_enabled",
+                      "rtcp_destination_ip", "rtcp_destination_port")
+# Active parameters the SDP file depends on, read from the first leg only
+SDP_FEC_PARAMETERS = ("fec_enabled", "fec_type", "fec_destination_ip",
+                      "fec1D_destination_port", "fec2D_destination_port")
+
+# The choices that decide which blocks appear in an SDP file. rtcp has an
+# entry for each leg
+SdpShape = namedtuple("SdpShape", "legs, multicast, rtcp, redundant, fec2022_5")
+
+
+# Leg records keep their values in slots, which attrgetter reads far faster
+# than looking up each key in turn
+_getLegValues = attrgetter(*SDP_LEG_PARAMETERS)
+_getFecValues = attrgetter(*SDP_FEC_PARAMETERS)
+
+
+def _readValues(leg, names, getValues):
+    try:
+        return getValues(leg)
+    except AttributeError:
+        # A leg stored as a plain mapping
+        return tuple(leg[name] for name in names)
+
 
 class senderFileFactory:
 
     def __init__(self, interface):
         self.interface = interface
         self.groups = []
+        self._cached = (None, None)
 
     def activateCallback(self):
         transportFile = self.generateSDP()
         self.interface.transportFile = transportFile
 
     def generateSDP(self):
-        """Builds up an example SDP based on the stream type
-        and transport parameters"""
+        """Builds up an example SDP based on the stream type and transport
+        parameters by filling in the template for its shape. The last file
+        made is reused until an activation changes a parameter it uses"""
+        legs = self.interface.active[__tp__]
+        values = sum((_readValues(leg, SDP_LEG_PARAMETERS, _getLegValues) for leg in legs), ()) + \
+            _readValues(legs[0], SDP_FEC_PARAMETERS, _getFecValues)
+        key = (self.interface._enableRtcp, values)
+        if self._cached[0] == key:
+            return self._cached[1]
+        shape = SdpShape(
+            self.interface.legs,
+            self.checkMulticast(),
+            tuple(bool(self.checkRtcp(leg)) for leg in range(0, self.interface.legs)),
+            bool(self.checkRedundant()),
+            bool(self.check2022_5())
+        )
+        sdp = compileTemplate(shape).format(*values)
+        self._cached = (key, sdp)
+        return sdp
+
+    def buildSDP(self):
+        """Builds up an example SDP by concatenating each of the blocks for
+        the stream. Used to compile the templates filled in by generateSDP"""
         self.groups = []
         toReturn = ""
         toReturn = toReturn + self.generateBlockOne()
@@ -159,6 +213,56 @@ class senderFileFactory:
         # to create such SDP files.
 
 
+class _PlaceholderInterface:
+    """Stands in for a sender while a template is compiled, giving a format
+    field in place of the value of each active parameter"""
+
+    def __init__(self, legs):
+        self.legs = legs
+
+    def getActiveParameter(self, parameter, leg=0):
+        # Fields are numbered in the order generateSDP reads the values
+        if parameter in SDP_LEG_PARAMETERS:
+            index = leg * len(SDP_LEG_PARAMETERS) + SDP_LEG_PARAMETERS.index(parameter)
+        else:
+            index = self.legs * len(SDP_LEG_PARAMETERS) + SDP_FEC_PARAMETERS.index(parameter)
+        return "{{{}}}".format(index)
+
+
+class _TemplateCompiler(senderFileFactory):
+    """Runs the block generators for a given shape against placeholders,
+    producing a template for str.format"""
+
+    def __init__(self, shape):
+        senderFileFactory.__init__(self, _PlaceholderInterface(shape.legs))
+        self.shape = shape
+
+    def checkMulticast(self):
+        return self.shape.multicast
+
+    def checkRtcp(self, leg=0):
+        return self.shape.rtcp[leg]
+
+    def checkRedundant(self):
+        return self.shape.redundant
+
+    def check2022_5(self):
+        return self.shape.fec2022_5
+
+
+# Compiled templates by shape. There are only a handful of shapes, so these
+# are kept for the life of the process
+_templates = {}
+
+
+def compileTemplate(shape):
+    """Get the template for SDP files of an SdpShape"""
+    template = _templates.get(shape)
+    if template is None:
+        template = _templates.setdefault(shape, _TemplateCompiler(shape).buildSDP())
+    return template
+
+
 SDP_BLOCK_ONE = """v=0
 o=- 1504701982 1504701982 IN IP4 {}
 s=NMOS Example Stream
@@ -14,7 +14,6 @@
 
 from __future__ import absolute_import
 
-import re
 from collections import namedtuple
 from .cmExceptions import SdpParseError
 
@@ -23,102 +22,90 @@ ConnectionLine = namedtuple("ConnectionLine", "ntype, atype, addr, groupsize, tt
 MediaLine = namedtuple("MediaLine", "media, port, numports, protocol, fmt")
 AttributeLine = namedtuple("AttributeLine", "ntype, atype, dest, source")
 
+MEDIA_TYPES = frozenset(["audio", "video", "text", "application", "message"])
+SOURCE_FILTER = "source-filter:"
 
-def parseLine(line):
-
-    type = _get_line_type(line)
-    value = _get_line_value(line)
 
-    if type == "c":
-        return _parseConnectionLine(value)
-    elif type == "a":
-        return _parseAttributeLine(value)
-    elif type == "m":
-        return _parseMediaLine(value)
-    else:
+def parseLine(line):
+    """Parse a single "<type>=<value>" SDP line in one pass. Returns a
+    ConnectionLine, MediaLine or AttributeLine, or None for lines that
+    aren't of interest. Raises SdpParseError for malformed lines"""
+    if len(line) < 2 or line[1] != "=":
+        raise SdpParseError("Could not parse SDP line: {}".format(line))
+    parser = _lineParsers.get(line[0])
+    if parser is None:
         return None
+    return parser(line[2:])
 
 
-def _get_line_type(line):
-    match = re.match("^(.)=.*", line)
-    return match.group(1)
-
-
-def _get_line_value(line):
-    match = re.match("^.=(.*)", line)
-    return match.group(1)
+def _parseError(value):
+    return SdpParseError("Could not parse SDP line: {}".format(value))
 
 
 def _parseConnectionLine(value):
     # Look for connection information - sadly sdp connection field
     # doesn't accomodate SSMC so we have to find the destination IP
     # from an source filter attribute instead
-    if re.match(r"^ *IN +IP4 +.*$", value):
-        return _parseIPv4ConnectionLine(value)
-    elif re.match(r"^ *IN +IP6 +.*$", value):
-        return _parseIPv6ConnectionLine(value)
-    else:
-        raise SdpParseError("Could not parse SDP line: {}".format(value))
-
-
-def _parseIPv6ConnectionLine(value):
-    match = re.match(r"^ *IN +IP6 +([^/]+) *$", value)
-    ntype, atype = "IN", "IP6"
-    addr = match.groups()[0]
-    groupsize = 1
-    ttl = 1
-    return ConnectionLine(ntype, atype, addr, groupsize, ttl)
-
-
-def _parseIPv4ConnectionLine(value):
-    match = re.match(r"^ *IN +IP4 +([^/]+)(?:/(\d+)(?:/(\d+))?)? *$", value)
-    ntype, atype = "IN", "IP4"
-    addr, ttl, groupsize = match.groups()
-    if ttl is None:
-        ttl = 127
-    if groupsize is None:
-        groupsize = 1
-    return ConnectionLine(ntype, atype, addr, groupsize, ttl)
+    fields = value.split()
+    if len(fields) != 3 or fields[0] != "IN":
+        raise _parseError(value)
+    if fields[1] == "IP4":
+        return _parseIPv4ConnectionLine(fields[2], value)
+    elif fields[1] == "IP6":
+        return _parseIPv6ConnectionLine(fields[2], value)
+    raise _parseError(value)
+
+
+def _parseIPv6ConnectionLine(address, value):
+    addr = address.split("/", 1)[0]
+    if not addr:
+        raise _parseError(value)
+    return ConnectionLine("IN", "IP6", addr, 1, 1)
+
+
+def _parseIPv4ConnectionLine(address, value):
+    parts = address.split("/")
+    if len(parts) > 3 or not parts[0] or not all(part.isdigit() for part in parts[1:]):
+        raise _parseError(value)
+    ttl = parts[1] if len(parts) > 1 else 127
+    groupsize = parts[2] if len(parts) > 2 else 1
+    return ConnectionLine("IN", "IP4", parts[0], groupsize, ttl)
 
 
 def _parseAttributeLine(value):
     # Looks for media attributes - I'm only interested in finding
     # source filters (RFC4570) to work out the SSMC destination address
-    if re.match(r"^.*source-filter: +incl +IN +IP4 +.*", value):
-        return _parseIPv4AttributeLine(value)
-    elif re.match(r"^.*source-filter: +incl +IN +IP6 +.*", value):
-        return _parseIPv6AttributeLine(value)
-    else:
+    if not value.startswith(SOURCE_FILTER):
         return None
+    return parseSourceFilter(value[len(SOURCE_FILTER):])
 
 
-def _parseIPv4AttributeLine(value):
-    # IPV4 Source filter
-    ntype, atype = "IN", "IP4"
-    match = re.match(r"^.*IN +IP4+ (?:((?:\d+\.?)+)) (?:((?:\d+\.?)+))", value)
-    dest, source = match.groups(match)
-    return AttributeLine(ntype, atype, dest, source)
-
-
-def _parseIPv6AttributeLine(value):
-    # IPV6 Source filter
-    ntype, atype = "IN", "IP6"
-    regexp = (r"^.*source-filter: +incl +IN +IP6 +"
-              r"((?:[\dabcdefABCDEF]{1,4}:*)+) +((?:[\dabcdefABCDEF]"
-              r"{1,4}:*)+)")
-    match = re.match(regexp, value)
-    dest, source = match.groups(match)
-    return AttributeLine(ntype, atype, dest, source)
+def parseSourceFilter(value):
+    """Parse the value of a source-filter attribute, returning an
+    AttributeLine for inclusive filters or None for others"""
+    fields = value.split()
+    if len(fields) < 3 or fields[0] != "incl" or fields[1] != "IN" or fields[2] not in ("IP4", "IP6"):
+        return None
+    if len(fields) < 5:
+        raise _parseError(value)
+    return AttributeLine("IN", fields[2], fields[3], fields[4])
 
 
 def _parseMediaLine(value):
     # We need to look at the media tag to get the port number to use...
-    regexp = (r"^(audio|video|text|application|message) +"
-              r"(\d+)(?:[/](\d+))? +([^ ]+) +(.+)$")
-    media, port, numports, protocol, fmt = re.match(regexp, value).groups()
-    port = int(port)
-    if numports is None:
-        numports = 1
-    else:
-        numports = int(numports)
-    return MediaLine(media, port, numports, protocol, fmt)
+    fields = value.split(None, 3)
+    if len(fields) != 4 or fields[0] not in MEDIA_TYPES:
+        raise _parseError(value)
+    media, ports, protocol, fmt = fields
+    port, _, numports = ports.partition("/")
+    if not port.isdigit() or not (numports.isdigit() or not numports):
+        raise _parseError(value)
+    return MediaLine(media, int(port), int(numports) if numports else 1, protocol, fmt)
+
+
+# Parsers for the line types of interest, by type character
+_lineParsers = {
+    "c": _parseConnectionLine,
+    "a": _parseAttributeLine,
+    "m": _parseMediaLine,
+}
@@ -14,10 +14,46 @@
 
 from __future__ import absolute_import
 
+import six
 import time
+from collections import Counter
+from threading import Lock
 from .abstractDevice import StagedLockedException
-from .sdpParser import SdpParser
+from .sdpParser import SdpParser, encodedSize, DEFAULT_MAX_SIZE, DEFAULT_MAX_LINE_LENGTH, DEFAULT_MAX_MEDIA
+from .sdpCache import sdpCache
 from .cmExceptions import SdpParseError
+from .versions import nextVersion
+
+# Limits on the SDP files accepted by every SdpManager, passed to SdpParser
+sdpLimits = {
+    "maxSize": DEFAULT_MAX_SIZE,
+    "maxLineLength": DEFAULT_MAX_LINE_LENGTH,
+    "maxMedia": DEFAULT_MAX_MEDIA
+}
+
+
+def setSdpLimits(maxSize=None, maxLineLength=None, maxMedia=None):
+    """Change the limits on the SDP files accepted. Limits left as None are
+    unchanged. Files parsed under the old limits are forgotten"""
+    changed = False
+    for name, value in (("maxSize", maxSize), ("maxLineLength", maxLineLength), ("maxMedia", maxMedia)):
+        if value is not None and int(value) != sdpLimits[name]:
+            sdpLimits[name] = int(value)
+            changed = True
+    if changed:
+        sdpCache.clear()
+
+
+# Transport file updates and activations skipped because they wouldn't have
+# changed anything, counted across every SdpManager by kind ("staged" or
+# "activated")
+noopCounts = Counter()
+_noopLock = Lock()
+
+
+def countNoop(kind):
+    with _noopLock:
+        noopCounts[kind] += 1
 
 
 class SdpManager():
@@ -27,6 +63,12 @@ class SdpManager():
         self.activeSdp = ""
         self.stagedSources = []
         self.activeSources = []
+        # Normalised content of the staged and active SDP files, see
+        # SdpSession.semantics. None when unknown
+        self.stagedSemantics = None
+        self.activeSemantics = None
+        # The receiver's staged parameters as left by the last SDP applied
+        self.appliedStaged = None
         self.logger = logger
         self.lastUpdated = 0
         self.stageLocked = False
@@ -38,6 +80,8 @@ class SdpManager():
             "data": ""
         }
         self.activeRequest = self.stagedRequest
+        self.stagedVersion = nextVersion()
+        self.activeVersion = nextVersion()
 
     def getStagedSdp(self):
         return self.stagedSdp
@@ -61,72 +105,146 @@ class SdpManager():
 
     def update(self, updateObject):
         """Update staged SDP if not locked"""
-        if not self.stageLocked:
-            try:
-                data = updateObject['data']
-                type = updateObject['type']
-            except KeyError as err:
-                # Something wrong with the request JSON
-                errMessage = ("Missing field in "
-                              "PUT request to transport file:".format(str(err)))
-                self.logger.writeError(errMessage)
-                raise KeyError(errMessage)
-            if type != 'application/sdp':
-                # Asked to process a transport file other than SDP
-                errMessage = ("This implementation of the CM API "
-                              "cannot handle transport files of type {}:".format(type))
-                self.logger.writeError(errMessage)
-                raise ValueError(errMessage)
-            self.stagedRequest = updateObject
-            self.addSdpByAssignment(data)
-            self.applyParamsToInterface()
+        self.checkUnlocked()
+        self.stageParsed(updateObject, parseTransportFile(self.logger, updateObject))
+
+    def stageParsed(self, updateObject, parsed):
+        """Update staged SDP if not locked, using the result of
+        parseTransportFile. Lets one transport file be parsed once and
+        staged onto any number of receivers.
+
+        A file with the same content as the staged one isn't applied to the
+        receiver again, as long as the receiver's staged parameters haven't
+        been changed since it was applied. The file itself is still staged,
+        so the API reports the one most recently sent, but the staged
+        version only changes if its text does. Returns False if the receiver
+        wasn't patched"""
+        self.checkUnlocked()
+        applied = parsed['semantics'] != self.stagedSemantics or self.receiver.staged is not self.appliedStaged
+        if applied:
+            # Only record the file as staged once the receiver has accepted it
+            self.applyParamsToInterface(parsed['sources'])
         else:
+            self.logger.writeDebug("Transport file is already staged")
+            countNoop("staged")
+        if applied or updateObject != self.stagedRequest:
+            self.stagedVersion = nextVersion()
+        self.stagedRequest = updateObject
+        self.stagedSources = parsed['sources']
+        self.stagedSemantics = parsed['semantics']
+        self.stagedSdp = updateObject['data']
+        self.lastUpdated = time.time()
+        return applied
+
+    def checkUnlocked(self):
+        """Raise StagedLockedException if staged parameters are locked"""
+        if self.stageLocked:
             errMessage = ("Attempted to updated parameters "
                           "while staged is locked")
             self.logger.writeError(errMessage)
             raise StagedLockedException(errMessage)
 
     def activateStaged(self):
+        """Make the staged file active. The active version only changes if
+        the file does, and activating a file with the same content as the
+        active one is counted as a no-op"""
+        if self.stagedSemantics is not None and self.stagedSemantics == self.activeSemantics:
+            countNoop("activated")
+        if self.stagedRequest != self.activeRequest:
+            self.activeVersion = nextVersion()
+        self.activeSemantics = self.stagedSemantics
         self.activeSdp = self.stagedSdp
         self.activeRequest = self.stagedRequest
         self.activeSources = self.stagedSources
         self.unLock()
 
-    def applyParamsToInterface(self):
-        """Apply the parameters from the
-        sdp onto the interface class"""
-        self.receiver._setTp(
-            self.stagedSources[0]['dest'],
-            'multicast_ip',
-            0
-        )
-        self.receiver._setTp(
-            self.stagedSources[0]['port'],
-            'destination_port',
-            0
-        )
-        self.receiver._setTp(
-            True,
-            'rtp_enabled',
-            0
-        )
-        if 'source' in self.stagedSources[0]:
-            # May not be present if not using source specific multicast
-            self.receiver._setTp(
-                self.stagedSources[0]['source'],
-                'source_ip',
-                0
-            )
+    def restore(self, stagedRequest, activeRequest):
+        """Put back transport files saved before a restart"""
+        self.stagedRequest = stagedRequest
+        self.stagedSdp = stagedRequest['data']
+        self.activeRequest = activeRequest
+        self.activeSdp = activeRequest['data']
+        self.stagedVersion = nextVersion()
+        self.activeVersion = nextVersion()
+        self.stagedSemantics = None
+        self.activeSemantics = None
+
+    def applyParamsToInterface(self, sources=None):
+        """Apply the parameters from the sdp, or the given sources, onto the
+        interface class. Every leg the receiver has is staged in one
+        validated patch, so both legs of an ST 2022-7 SDP are applied
+        together"""
+        if sources is None:
+            sources = self.stagedSources
+        update = [{} for leg in range(0, self.receiver.legs)]
+        for params, source in zip(update, sources):
+            if 'dest' in source:
+                params['multicast_ip'] = source['dest']
+            params['destination_port'] = source['port']
+            params['rtp_enabled'] = True
+            if 'source' in source:
+                # May not be present if not using source specific multicast
+                params['source_ip'] = source['source']
+        self.receiver.patch(update)
+        self.appliedStaged = self.receiver.staged
 
     def addSdpByAssignment(self, sdp):
         # Add an SDP directly
-        parser = SdpParser(self.logger)
-        parser.parseFile(sdp)
-        if parser.sources:
-            self.stagedSources = parser.sources
-            self.lastUpdated = time.time()
-            self.stagedSdp = sdp
-            return True
-        errMessage = "Could not extract sources form SDP file"
-        self.logger.writeError(errMessage)
+        parsed = parseSdp(self.logger, sdp)
+        self.stagedSources = parsed['sources']
+        self.stagedSemantics = parsed['semantics']
+        self.lastUpdated = time.time()
+        self.stagedSdp = sdp
+        return True
+
+
+def parseTransportFile(logger, updateObject):
+    """Check a transport file object from a staging request and parse its
+    SDP, see parseSdp. Raises KeyError or ValueError if the object is
+    malformed and SdpParseError if the SDP is"""
+    try:
+        data = updateObject['data']
+        type = updateObject['type']
+    except KeyError as err:
+        # Something wrong with the request JSON
+        errMessage = ("Missing field in "
+                      "PUT request to transport file: {}".format(str(err)))
+        logger.writeError(errMessage)
+        raise KeyError(errMessage)
+    if type != 'application/sdp':
+        # Asked to process a transport file other than SDP
+        errMessage = ("This implementation of the CM API "
+                      "cannot handle transport files of type {}:".format(type))
+        logger.writeError(errMessage)
+        raise ValueError(errMessage)
+    if not isinstance(data, six.string_types):
+        errMessage = "Transport file data must be a string"
+        logger.writeError(errMessage)
+        raise ValueError(errMessage)
+    return parseSdp(logger, data)
+
+
+def parseSdp(logger, sdp):
+    """Parse an SDP file into a frozen dict holding the sources of each leg
+    and the normalised content of the file, as returned by
+    SdpSession.semantics. Oversized files are turned away before they are
+    hashed or parsed"""
+    maxSize = sdpLimits["maxSize"]
+    # A character takes at most four bytes in UTF-8, so short files needn't
+    # be encoded to be measured
+    if len(sdp) > maxSize or (len(sdp) * 4 > maxSize and encodedSize(sdp) > maxSize):
+        errMessage = "SDP file is larger than {} bytes".format(maxSize)
+        logger.writeError(errMessage)
         raise SdpParseError(errMessage)
+
+    def parse(sdp):
+        parser = SdpParser(logger, **sdpLimits)
+        parser.parseFile(sdp)
+        return {'sources': parser.sources, 'semantics': parser.session.semantics()}
+
+    parsed = sdpCache.get(sdp, parse)
+    if parsed['sources']:
+        return parsed
+    errMessage = "Could not extract sources form SDP file"
+    logger.writeError(errMessage)
+    raise SdpParseError(errMessage)
@@ -0,0 +1,190 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Structured model of an SDP file.
+
+Sessions and media descriptions keep their attributes as (name, value)
+pairs of text, and only decode the ones that are asked for, so parsing a
+file costs little more than splitting it into lines."""
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+from .sdpLineParser import parseSourceFilter
+from .cmExceptions import SdpParseError
+
+RtpMap = namedtuple("RtpMap", "payload, encoding, clockRate, parameters")
+Group = namedtuple("Group", "semantics, mids")
+
+
+def splitAttribute(value):
+    """Split the text following "a=" into a (name, value) pair. The value
+    of a property attribute is None"""
+    name, sep, rest = value.partition(":")
+    return name, (rest if sep else None)
+
+
+def _normaliseAttributes(attributes):
+    """Attributes in name order, with runs of whitespace in values collapsed"""
+    normalised = [(name, None if value is None else " ".join(value.split())) for name, value in attributes]
+    return tuple(sorted(normalised, key=lambda attribute: (attribute[0], attribute[1] or "")))
+
+
+class SdpAttributes:
+    """Base for the parts of an SDP file that carry a=, c= and source filter lines"""
+
+    def __init__(self):
+        self.connection = None
+        self.attributes = []
+        self._decoded = {}
+
+    def attribute(self, name):
+        """Get the value of the first attribute called name, None for a
+        property attribute with no value, or KeyError if it isn't present"""
+        for attrName, attrValue in self.attributes:
+            if attrName == name:
+                return attrValue
+        raise KeyError(name)
+
+    def attributeValues(self, name):
+        """Get the values of every attribute called name"""
+        return [attrValue for attrName, attrValue in self.attributes if attrName == name]
+
+    def _decode(self, name, decoder):
+        if name not in self._decoded:
+            self._decoded[name] = decoder()
+        return self._decoded[name]
+
+    @property
+    def sourceFilter(self):
+        """The first inclusive source filter (RFC 4570) as an AttributeLine, or None"""
+        def decode():
+            for value in self.attributeValues("source-filter"):
+                result = parseSourceFilter(value)
+                if result is not None:
+                    return result
+            return None
+        return self._decode("source-filter", decode)
+
+    def semantics(self):
+        """A hashable description of the part, which is equal for parts that
+        only differ in the order of their attributes or in whitespace"""
+        return (self.connection, _normaliseAttributes(self.attributes))
+
+
+class SdpMedia(SdpAttributes):
+    """A media description, starting at an m= line"""
+
+    def __init__(self, media):
+        SdpAttributes.__init__(self)
+        self.media = media
+
+    @property
+    def mid(self):
+        """The media identification (RFC 5888), or None"""
+        def decode():
+            values = self.attributeValues("mid")
+            return values[0] if values else None
+        return self._decode("mid", decode)
+
+    @property
+    def rtpmap(self):
+        """The RtpMap for the first payload format of the media, or None"""
+        def decode():
+            payload = self.media.fmt.split()[0]
+            for value in self.attributeValues("rtpmap"):
+                fields = value.split(None, 1)
+                if len(fields) == 2 and fields[0] == payload:
+                    parts = fields[1].split("/", 2)
+                    if len(parts) < 2 or not parts[1].isdigit():
+                        raise SdpParseError("Could not parse SDP rtpmap: {}".format(value))
+                    return RtpMap(payload, parts[0], int(parts[1]), parts[2] if len(parts) > 2 else None)
+            return None
+        return self._decode("rtpmap", decode)
+
+    @property
+    def fmtp(self):
+        """The format parameters for the first payload format of the media
+        as a dict. Parameters without a value map to None"""
+        def decode():
+            payload = self.media.fmt.split()[0]
+            parameters = {}
+            for value in self.attributeValues("fmtp"):
+                fields = value.split(None, 1)
+                if len(fields) == 2 and fields[0] == payload:
+                    for parameter in fields[1].split(";"):
+                        name, sep, paramValue = parameter.strip().partition("=")
+                        if name:
+                            parameters[name] = paramValue if sep else None
+            return parameters
+        return self._decode("fmtp", decode)
+
+    def semantics(self):
+        media = self.media._replace(fmt=tuple(self.media.fmt.split()))
+        return (media,) + SdpAttributes.semantics(self)
+
+    def source(self, session):
+        """The destination and source of the media as a dict of port, dest
+        and source, using the session's connection and source filter for
+        any the media doesn't give itself"""
+        toReturn = {'port': self.media.port}
+        connection = self.connection or session.connection
+        if connection is not None:
+            toReturn['dest'] = connection.addr
+        sourceFilter = self.sourceFilter or session.sourceFilter
+        if sourceFilter is not None:
+            toReturn['source'] = sourceFilter.source
+        return toReturn
+
+
+class SdpSession(SdpAttributes):
+    """An SDP file: the session level lines followed by media descriptions"""
+
+    def __init__(self):
+        SdpAttributes.__init__(self)
+        self.version = None
+        self.origin = None
+        self.name = None
+        self.media = []
+
+    @property
+    def groups(self):
+        """The media groups (RFC 5888) of the session"""
+        def decode():
+            groups = []
+            for value in self.attributeValues("group"):
+                fields = value.split()
+                if fields:
+                    groups.append(Group(fields[0], fields[1:]))
+            return groups
+        return self._decode("group", decode)
+
+    def legs(self):
+        """The media descriptions in leg order. Media in an ST 2022-7 DUP
+        group are ordered as in the group, otherwise in file order"""
+        byMid = dict((media.mid, media) for media in self.media if media.mid is not None)
+        for group in self.groups:
+            if group.semantics == "DUP" and all(mid in byMid for mid in group.mids):
+                return [byMid[mid] for mid in group.mids]
+        return list(self.media)
+
+    def sources(self):
+        """The destination and source of each leg, see SdpMedia.source"""
+        return [media.source(self) for media in self.legs()]
+
+    def semantics(self):
+        """A hashable description of what the file asks a receiver to do.
+        The version, origin and session name are left out, since they
+        don't change the streams described, and media are in leg order"""
+        return SdpAttributes.semantics(self) + (tuple(media.semantics() for media in self.legs()),)
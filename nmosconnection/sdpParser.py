@@ -14,38 +14,143 @@
 
 from __future__ import absolute_import
 
-from .sdpLineParser import parseLine, ConnectionLine, MediaLine, AttributeLine
+import codecs
+import six
+
+from .sdpLineParser import parseLine
+from .sdpModel import SdpSession, SdpMedia, splitAttribute
+from .cmExceptions import SdpParseError
+
+# Limits on the SDP files accepted, which bound the memory used to parse
+# one. Files from real devices are a few kilobytes at most
+DEFAULT_MAX_SIZE = 64 * 1024
+DEFAULT_MAX_LINE_LENGTH = 4096
+DEFAULT_MAX_MEDIA = 64
+
+
+def encodedSize(text):
+    """Size in bytes of text encoded as UTF-8"""
+    if isinstance(text, six.binary_type):
+        return len(text)
+    return len(text.encode("utf-8"))
 
 
 class SdpParser:
+    """Builds an SdpSession from the text of an SDP file. Connection and
+    media lines are parsed as they are read, while attributes are kept as
+    text until they are used.
+
+    Files can be given whole to parseFile, or in chunks of text or UTF-8
+    bytes to feed followed by close, in which case no more than one line is
+    buffered. A file that breaks one of the limits is rejected with an
+    SdpParseError as soon as the limit is passed"""
 
-    def __init__(self, logger):
+    def __init__(self, logger, maxSize=DEFAULT_MAX_SIZE, maxLineLength=DEFAULT_MAX_LINE_LENGTH,
+                 maxMedia=DEFAULT_MAX_MEDIA):
         self.sources = []
-        self.source = {}
+        self.session = SdpSession()
         self.logger = logger
+        self.maxSize = maxSize
+        self.maxLineLength = maxLineLength
+        self.maxMedia = maxMedia
+        self.size = 0
+        self._pending = ""
+        self._decoder = None
+        self._finished = []
 
     def parseFile(self, sdp):
-        lines = sdp.splitlines()
+        for media in self.iterMedia([sdp]):
+            pass
+
+    def iterMedia(self, chunks):
+        """Parse an iterable of chunks of the file, yielding each SdpMedia
+        once it is complete"""
+        for chunk in chunks:
+            self.feed(chunk)
+            while self._finished:
+                yield self._finished.pop(0)
+        self.close()
+        while self._finished:
+            yield self._finished.pop(0)
+
+    def feed(self, chunk):
+        """Parse the next chunk of the file"""
+        self.size += encodedSize(chunk)
+        if self.size > self.maxSize:
+            raise SdpParseError("SDP file is larger than {} bytes".format(self.maxSize))
+        if isinstance(chunk, six.binary_type):
+            if self._decoder is None:
+                self._decoder = codecs.getincrementaldecoder("utf-8")()
+            try:
+                chunk = self._decoder.decode(chunk)
+            except UnicodeDecodeError as err:
+                raise SdpParseError("SDP file is not valid UTF-8: {}".format(err))
+        lines = (self._pending + chunk).split("\n")
+        self._pending = lines.pop()
         for line in lines:
-            if line != "":
-                self._getLineData(line)
+            self._parseLine(line)
+        if len(self._pending) > self.maxLineLength:
+            self._lineTooLong()
+
+    def close(self):
+        """Parse the rest of the file once every chunk has been fed"""
+        if self._decoder is not None:
+            self._pending += self._decoder.decode(b"", True)
+        self._parseLine(self._pending)
+        self._pending = ""
+        if self.session.media:
+            self._finished.append(self.session.media[-1])
+        self.sources = self.session.sources()
+        return self.session
+
+    def _lineTooLong(self):
+        raise SdpParseError("SDP line is longer than {} characters".format(self.maxLineLength))
+
+    def _parseLine(self, line):
+        line = line.rstrip("\r")
+        if len(line) > self.maxLineLength:
+            self._lineTooLong()
+        if line and not line.isspace():
+            self._getLineData(line)
+
+    def _current(self):
+        return self.session.media[-1] if self.session.media else self.session
 
     def _getLineData(self, line):
-        result = parseLine(line)
-        if type(result) is ConnectionLine:
-            self._extractConnectionInfo(result)
-        elif type(result) is MediaLine:
-            self._extractMediaInfo(result)
-        elif type(result) is AttributeLine:
-            self._extractAttributeInfo(result)
-
-    def _extractConnectionInfo(self, result):
-        self.sources[-1]['dest'] = result.addr
-
-    def _extractMediaInfo(self, result):
-        self.source = {}
-        self.sources.append(self.source)
-        self.source['port'] = result.port
-
-    def _extractAttributeInfo(self, result):
-        self.sources[-1]['source'] = result.source
+        if len(line) < 2 or line[1] != "=":
+            raise SdpParseError("Could not parse SDP line: {}".format(line))
+        handler = self._handlers.get(line[0])
+        if handler is not None:
+            handler(self, line)
+
+    def _extractVersion(self, line):
+        self.session.version = line[2:]
+
+    def _extractOrigin(self, line):
+        self.session.origin = line[2:]
+
+    def _extractName(self, line):
+        self.session.name = line[2:]
+
+    def _extractConnectionInfo(self, line):
+        self._current().connection = parseLine(line)
+
+    def _extractMediaInfo(self, line):
+        if len(self.session.media) >= self.maxMedia:
+            raise SdpParseError("SDP file has more than {} media descriptions".format(self.maxMedia))
+        media = SdpMedia(parseLine(line))
+        if self.session.media:
+            self._finished.append(self.session.media[-1])
+        self.session.media.append(media)
+
+    def _extractAttributeInfo(self, line):
+        self._current().attributes.append(splitAttribute(line[2:]))
+
+    _handlers = {
+        "v": _extractVersion,
+        "o": _extractOrigin,
+        "s": _extractName,
+        "c": _extractConnectionInfo,
+        "m": _extractMediaInfo,
+        "a": _extractAttributeInfo,
+    }
@@ -0,0 +1,73 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import time
+import gevent
+from gevent import Greenlet
+from gevent.event import AsyncResult
+
+
+class SelectorTimeout(Exception):
+    pass
+
+
+class Selector:
+    """Wraps a driver selector, the method used to choose a value for an
+    "auto" parameter from the staged parameters and leg number. The method
+    may block cooperatively, or return a gevent AsyncResult or Greenlet
+    that later provides the value. The legs of a device are resolved
+    concurrently, so the method is given the other legs as staged, with
+    their "auto" values unresolved, rather than as resolved so far.
+
+    With a timeout the method runs in its own greenlet and is abandoned
+    after that many seconds. The fallback method, if given, is then used
+    in its place, as it is if the method raises. Without a fallback a
+    timeout raises SelectorTimeout"""
+
+    def __init__(self, method, timeout=None, fallback=None, logger=None):
+        self.method = method
+        self.timeout = timeout
+        self.fallback = fallback
+        self.logger = logger
+
+    def __call__(self, parameterSet, leg):
+        try:
+            return self._select(parameterSet, leg)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            if self.logger is not None:
+                self.logger.writeWarning("Selector failed, using fallback. {!r}".format(e))
+            return self.fallback(parameterSet, leg)
+
+    def _select(self, parameterSet, leg):
+        if self.timeout is None:
+            return self._wait(self.method(parameterSet, leg), None)
+        deadline = time.time() + self.timeout
+        greenlet = gevent.spawn(self.method, parameterSet, leg)
+        greenlet.join(self.timeout)
+        if not greenlet.ready():
+            greenlet.kill(block=False)
+            raise SelectorTimeout("Selector took longer than {}s".format(self.timeout))
+        return self._wait(greenlet.get(), max(deadline - time.time(), 0))
+
+    def _wait(self, value, timeout):
+        if isinstance(value, (AsyncResult, Greenlet)):
+            try:
+                return value.get(timeout=timeout)
+            except gevent.Timeout:
+                raise SelectorTimeout("Selector took longer than {}s".format(self.timeout))
+        return value
@@ -0,0 +1,187 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Immutable parameter snapshots.
+
+Snapshots are ordinary dicts and lists as far as readers are concerned,
+so they compare, index and serialise as before, but any attempt to modify
+them raises a TypeError. Updates are made with setIn, which copies only the
+containers along the path being changed and shares everything else with
+the original snapshot."""
+
+from __future__ import absolute_import
+
+import six
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError("Parameter snapshots cannot be modified, use setIn")
+
+
+class FrozenDict(dict):
+    """A dict that can't be modified after it has been created"""
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """A list that can't be modified after it has been created"""
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = remove = pop = clear = sort = reverse = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+class FrozenRecord(Mapping):
+    """Base for immutable mappings with a fixed set of keys. Subclasses list
+    their keys in __slots__, so values are held in slots rather than in a
+    hash table per instance, which takes a fraction of the memory of the
+    equivalent dict. Records read, compare and iterate like a dict with
+    keys in __slots__ order"""
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and type(args[0]) is dict:
+            values = args[0]
+        else:
+            values = dict(*args, **kwargs)
+        if len(values) != len(self.__slots__):
+            raise KeyError(sorted(set(values).symmetric_difference(self.__slots__)))
+        for name in self.__slots__:
+            object.__setattr__(self, name, freeze(values[name]))
+
+    @classmethod
+    def fromMapping(cls, mapping):
+        """Make a record from a mapping. Mappings without exactly the
+        record's keys are frozen as a FrozenDict instead"""
+        if type(mapping) is cls:
+            return mapping
+        if len(mapping) == len(cls.__slots__):
+            try:
+                return cls(mapping)
+            except KeyError:
+                pass
+        return freeze(mapping)
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __setattr__(self, name, value):
+        _immutable(self)
+
+    __delattr__ = __setitem__ = __delitem__ = _immutable
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, dict(self))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def replace(self, key, value):
+        """Return a new record with the value of key replaced"""
+        values = dict(self)
+        if key not in values:
+            raise KeyError(key)
+        values[key] = value
+        return type(self)(values)
+
+
+# Scalar types, which are returned from freeze and thaw without further checks
+_SCALARS = frozenset([type(None), bool, int, float] + list(six.string_types) + [six.text_type])
+
+
+def freeze(value):
+    """Make an immutable snapshot of value. Parts that are already frozen
+    are reused rather than copied"""
+    if type(value) in _SCALARS:
+        return value
+    if isinstance(value, (FrozenDict, FrozenList, FrozenRecord)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Make a mutable deep copy of a snapshot"""
+    if type(value) in _SCALARS:
+        return value
+    if isinstance(value, (dict, FrozenRecord)):
+        return dict((key, thaw(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
+
+
+def setIn(snapshot, path, value):
+    """Return a new snapshot with the item at path (a sequence of keys and
+    indices) replaced by value"""
+    if not path:
+        return freeze(value)
+    key = path[0]
+    if isinstance(snapshot, FrozenRecord):
+        return snapshot.replace(key, setIn(snapshot[key], path[1:], value))
+    if isinstance(snapshot, list):
+        items = list(snapshot)
+        items[key] = setIn(items[key], path[1:], value)
+        return FrozenList(freeze(item) for item in items)
+    items = dict(snapshot)
+    items[key] = setIn(items.get(key), path[1:], value)
+    return FrozenDict((name, freeze(item)) for name, item in items.items())
@@ -0,0 +1,131 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import os
+import json
+import mmap
+from threading import Lock
+
+# Number of records appended to the journal before it is compacted
+DEFAULT_COMPACT_EVERY = 10000
+
+
+def _readLines(path):
+    """Yield (key, data) for each complete line of a journal file, using a
+    memory map so that large files aren't copied into memory up front"""
+    try:
+        f = open(path, "rb")
+    except IOError:
+        return
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(mapped.readline, b""):
+                if not line.endswith(b"\n"):
+                    # Torn write at the end of the journal
+                    break
+                key, sep, data = line.rstrip(b"\n").partition(b"\t")
+                if sep:
+                    yield key.decode("utf-8"), data
+        finally:
+            mapped.close()
+
+
+class StateJournal:
+    """Append only journal of the state of each sender and receiver, so that
+    the previous state can be served again straight after a restart.
+
+    Each record is a line holding the id and the JSON encoded state of one
+    device, and later records replace earlier ones. Every compactEvery
+    records the journal is folded into a snapshot file (path + ".snapshot"),
+    which is written to the side and renamed into place. On load only the
+    ids are read; the state of a device is decoded when it is taken"""
+
+    def __init__(self, path, compactEvery=DEFAULT_COMPACT_EVERY):
+        self.path = path
+        self.snapshotPath = path + ".snapshot"
+        self.compactEvery = compactEvery
+        self._lock = Lock()
+        self._saved = self._load()
+        self._records = 0
+        self._file = open(self.path, "ab")
+
+    def __len__(self):
+        """Number of devices with saved state that hasn't been taken yet"""
+        return len(self._saved)
+
+    def _load(self):
+        saved = {}
+        for path in (self.snapshotPath, self.path):
+            for key, data in _readLines(path):
+                if data == b"null":
+                    saved.pop(key, None)
+                else:
+                    saved[key] = data
+        return saved
+
+    def take(self, key):
+        """Get the saved state of a device, or None. Each state is only
+        handed out once"""
+        with self._lock:
+            data = self._saved.pop(key, None)
+        if data is None:
+            return None
+        return json.loads(data.decode("utf-8"))
+
+    def record(self, key, state):
+        """Append the current state of a device. A state of None removes it"""
+        line = "{}\t{}\n".format(key, json.dumps(state, separators=(",", ":"))).encode("utf-8")
+        with self._lock:
+            self._saved.pop(key, None)
+            self._file.write(line)
+            self._file.flush()
+            self._records += 1
+            if self._records >= self.compactEvery:
+                self._compact()
+
+    def remove(self, key):
+        """Forget a device"""
+        self.record(key, None)
+
+    def compact(self):
+        """Fold the journal into the snapshot file"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        self._file.flush()
+        latest = {}
+        for path in (self.snapshotPath, self.path):
+            for key, data in _readLines(path):
+                latest[key] = data
+        tmpPath = self.snapshotPath + ".tmp"
+        with open(tmpPath, "wb") as f:
+            for key, data in latest.items():
+                if data != b"null":
+                    f.write(key.encode("utf-8") + b"\t" + data + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmpPath, self.snapshotPath)
+        self._file.close()
+        self._file = open(self.path, "wb")
+        self._records = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -16,10 +16,16 @@ import os
 import unittest
 import time
 import json
+import gevent
+import mock
 from mediatimestamp import Timestamp, TimeOffset
 from jsonschema import validate, ValidationError
 
-from nmosconnection.activator import Activator
+from nmoscommon.logger import Logger
+from nmosconnection import activator as activatorModule
+from nmosconnection.api import ConnectionManagementAPI
+from nmosconnection.rtpSender import RtpSender
+from nmosconnection.activator import Activator, ActivationCost, activationSchemas, activationGroups, ACTIVATE_SCHEMA
 from nmosconnection.fieldException import FieldException
 
 __location__ = os.path.realpath(
@@ -316,6 +322,16 @@ class TestActivatorModule(unittest.TestCase):
             actual = self.dut._getSchema()
             self.assertEqual(expected, actual)
 
+    def test_schema_shared(self):
+        """Checks that all activators share one compiled activation schema"""
+        other = Activator([MockApi(self.mockApiCallback)])
+        other.schemaPath = self.dut.schemaPath
+        self.dut.parseActivationObject({'mode': 'activate_immediate'})
+        other.parseActivationObject({'mode': 'activate_immediate'})
+        validator = activationSchemas.getValidator(ACTIVATE_SCHEMA, schemaPath=self.dut.schemaPath)
+        self.assertIs(validator, activationSchemas.getValidator(ACTIVATE_SCHEMA, schemaPath=other.schemaPath))
+        self.assertIs(self.dut._getSchema(), other._getSchema())
+
     def test_get_last_request(self):
         """Checks that the last request function returns the
         correct property"""
@@ -332,3 +348,222 @@ class TestActivatorModule(unittest.TestCase):
         self.assertEqual(self.dut.activeRequest['mode'], "testMode")
         self.assertEqual(self.dut.activeRequest['activation_time'], "5:0")
         self.check_last_is_null()
+
+    def scheduleAbsolute(self, activator, offset):
+        myTime = time.time() + offset
+        secs = int(myTime)
+        ippTime = Timestamp.from_utc(secs, 0)
+        activator.parseActivationObject({'mode': 'activate_scheduled_absolute',
+                                         'requested_time': str(ippTime)})
+        return ippTime
+
+    def test_shared_absolute_activation(self):
+        """Check activators scheduled for the same time share one timer
+        and report the spread between targets"""
+        activators = [self.dut]
+        for i in range(0, 4):
+            activator = Activator([MockApi(self.mockApiCallback), MockApi(self.mockApiCallback)])
+            activator.schemaPath = self.dut.schemaPath
+            activators.append(activator)
+        requested = None
+        for activator in activators:
+            requested = self.scheduleAbsolute(activator, 1)
+        group = activationGroups.groups[str(requested)]
+        self.assertEqual(group.members, activators)
+        self.assertEqual(len(set(id(activator.timer.group) for activator in activators)), 1)
+        group.timer.wait(5)
+        for activator in activators:
+            self.assertFalse(activator.scheduled)
+            self.assertEqual(activator.getActiveRequest()['mode'], 'activate_scheduled_absolute')
+            self.assertEqual(activator.getActivationSpread(), group.spread)
+            for target in activator.targets:
+                self.assertFalse(target.locked)
+        self.assertGreaterEqual(group.spread, 0)
+        self.assertNotIn(str(requested), activationGroups.groups)
+
+    def test_shared_absolute_concurrent(self):
+        """Check the members of a group are activated concurrently"""
+        def slowCallback(*args):
+            gevent.sleep(0.2)
+
+        activators = []
+        for i in range(0, 4):
+            activator = Activator([MockApi(slowCallback)])
+            activator.schemaPath = self.dut.schemaPath
+            activators.append(activator)
+        requested = None
+        for activator in activators:
+            requested = self.scheduleAbsolute(activator, 1)
+        group = activationGroups.groups[str(requested)]
+        group.timer.wait(5)
+        for activator in activators:
+            self.assertFalse(activator.scheduled)
+        self.assertLess(group.spread, 0.15)
+
+    def test_shared_absolute_on_time(self):
+        """Check a group starts early by the cost of its concurrent batches,
+        not the sum of its members' costs, so it completes at the requested time"""
+        def slowCallback(*args):
+            gevent.sleep(0.1)
+
+        activators = []
+        for i in range(0, 16):
+            activator = Activator([MockApi(slowCallback)])
+            activator.schemaPath = self.dut.schemaPath
+            activator.activationCost.add(0.1)
+            activators.append(activator)
+        requested = None
+        for activator in activators:
+            requested = self.scheduleAbsolute(activator, 2)
+        group = activationGroups.groups[str(requested)]
+        self.assertAlmostEqual(group.lead, 0.1)
+        group.timer.wait(5)
+        for activator in activators:
+            completed = Timestamp.from_sec_nsec(activator.getActiveRequest()['activation_time'])
+            self.assertGreaterEqual(float(completed.to_sec_frac()), float(requested.to_sec_frac()) - 0.02)
+            self.assertLess(float(completed.to_sec_frac()), float(requested.to_sec_frac()) + 0.1)
+
+    def test_shared_absolute_failure(self):
+        """Check a member that fails doesn't stop the rest of its group"""
+        class FailingApi(MockApi):
+            def activateStaged(self):
+                raise ValueError("fail")
+
+        failing = Activator([FailingApi(self.mockApiCallback)])
+        failing.schemaPath = self.dut.schemaPath
+        requested = self.scheduleAbsolute(failing, 1)
+        self.scheduleAbsolute(self.dut, 1)
+        group = activationGroups.groups[str(requested)]
+        with mock.patch.object(activatorModule.logger, "exception") as exception:
+            group.timer.wait(5)
+        self.assertEqual(exception.call_count, 1)
+        self.assertTrue(self.hadCallback)
+        self.assertFalse(self.dut.scheduled)
+        self.assertEqual(self.dut.getActivationSpread(), group.spread)
+
+    def test_shared_absolute_cancel(self):
+        """Check cancelling one grouped activation leaves the others scheduled"""
+        other = Activator([MockApi(self.mockApiCallback)])
+        other.schemaPath = self.dut.schemaPath
+        requested = self.scheduleAbsolute(self.dut, 10)
+        self.scheduleAbsolute(other, 10)
+        group = activationGroups.groups[str(requested)]
+        self.dut._scheduleNone()
+        self.assertEqual(group.members, [other])
+        self.assertFalse(self.api.locked)
+        other._scheduleNone()
+        self.assertNotIn(str(requested), activationGroups.groups)
+        group.timer.wait(5)
+        self.assertFalse(self.hadCallback)
+
+    def test_lane_orders_scheduled(self):
+        """Check a scheduled activation waits for an operation already
+        running in the device's lane"""
+        with self.dut.lane:
+            self.dut._scheduleRelative("0:50000000")
+            time.sleep(0.2)
+            self.assertFalse(self.hadCallback)
+            self.assertTrue(self.dut.scheduled)
+        self.dut.timer.wait(5)
+        self.assertTrue(self.hadCallback)
+        self.assertFalse(self.dut.scheduled)
+        self.assertEqual(self.dut.getActiveRequest()['mode'], 'activate_scheduled_relative')
+
+    def test_lane_other_devices(self):
+        """Check a scheduled activation waiting for its device's lane doesn't
+        hold up other devices' scheduled activations"""
+        other = Activator([MockApi(self.mockApiCallback)])
+        other.schemaPath = self.dut.schemaPath
+        with self.dut.lane:
+            self.dut._scheduleRelative("0:100000000")
+            start = time.time()
+            other._scheduleRelative("0:300000000")
+            other.timer.wait(2)
+            self.assertTrue(self.hadCallback)
+            self.assertLess(self.callbackTime - start, 0.6)
+            self.assertFalse(other.scheduled)
+            self.assertTrue(self.dut.scheduled)
+        self.dut.timer.wait(5)
+        self.assertFalse(self.dut.scheduled)
+
+    def test_lane_with_patch(self):
+        """Check a scheduled activation, run on a scheduler worker thread,
+        waits for a PATCH holding the device's lane and then resolves and
+        activates every leg"""
+        logger = Logger("conmanage")
+        api = ConnectionManagementAPI(logger)
+        api.useValidation = False
+        sender = RtpSender(logger, 2)
+        sender.schemaPath = "../share/ipp-connectionmanagement/schemas/"
+        sender.addInterface("192.168.0.1", 0)
+        sender.addInterface("192.168.1.1", 1)
+        senderId = "c4a1b0f6-9a71-4d2e-8a32-6b1d8b5e0f11"
+        activator = api.addSender(sender, senderId)
+        activator.schemaPath = self.dut.schemaPath
+        ret = api.staged_patch("v1.0", "senders", senderId, {
+            "master_enable": True,
+            "activation": {"mode": "activate_scheduled_relative", "requested_time": "0:100000000"}
+        })
+        self.assertEqual(ret[0], 202)
+        validate = api.validateAgainstSchema
+
+        def slowValidate(*args):
+            # Hold the lane past the scheduled time
+            gevent.sleep(0.3)
+            return validate(*args)
+
+        api.validateAgainstSchema = slowValidate
+        ret = api.staged_patch("v1.0", "senders", senderId, {"master_enable": False})
+        patched = time.time()
+        self.assertEqual(ret[0], 423)
+        # Keep the main hub running, as the API's server would, so the
+        # worker is woken when the lane is released
+        for i in range(0, 500):
+            if activator.timer.finished:
+                break
+            gevent.sleep(0.01)
+        self.assertTrue(activator.timer.finished)
+        self.assertFalse(activator.scheduled)
+        self.assertTrue(sender.active["master_enable"])
+        self.assertEqual(sender.active["transport_params"][1]["source_ip"], "192.168.1.1")
+        completed = Timestamp.from_sec_nsec(activator.getActiveRequest()["activation_time"])
+        self.assertGreaterEqual(float(completed.to_sec_frac()), patched - 0.05)
+
+    def test_lane_cancel_while_waiting(self):
+        """Check a scheduled activation cancelled while waiting for the lane is skipped"""
+        with self.dut.lane:
+            self.dut._scheduleRelative("0:50000000")
+            timer = self.dut.timer
+            time.sleep(0.2)
+            self.dut._scheduleNone()
+        timer.wait(5)
+        self.assertFalse(self.hadCallback)
+        self.assertFalse(self.api.locked)
+        self.assertEqual(self.dut.getActiveRequest()['mode'], None)
+
+    def test_activation_cost(self):
+        """Check activation cost is averaged over a rolling window"""
+        cost = ActivationCost(3)
+        self.assertEqual(cost.estimate(), 0)
+        for seconds in [1.0, 2.0, 3.0, 6.0]:
+            cost.add(seconds)
+        self.assertAlmostEqual(cost.estimate(), 11.0 / 3)
+
+    def test_latency_compensation(self):
+        """Check scheduled activations start early by the measured cost and
+        report the time they completed"""
+        def slowActivate():
+            self.mockApiCallback("activateStaged")
+            time.sleep(0.05)
+        self.api.activateStaged = slowActivate
+        for i in range(0, 3):
+            self.dut._scheduleImmediate()
+        self.assertGreaterEqual(self.dut.activationCost.estimate(), 0.05)
+        start = time.time()
+        ret = self.dut._scheduleRelative("0:300000000")
+        requested = Timestamp.from_sec_nsec(ret[1]['activation_time'])
+        self.dut.timer.wait(5)
+        self.assertAlmostEqual(self.callbackTime - start, 0.25, 1)
+        completed = Timestamp.from_sec_nsec(self.dut.getActiveRequest()['activation_time'])
+        self.assertAlmostEqual(float(completed.to_sec_frac()), float(requested.to_sec_frac()), 1)
+        self.assertFalse(self.api.locked)
@@ -0,0 +1,78 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import gevent
+import unittest
+
+from nmosconnection.bulkExecutor import BulkExecutor
+
+
+class TestBulkExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = BulkExecutor(4)
+        self.calls = []
+        self.running = 0
+        self.maxRunning = 0
+
+    def handler(self, key, value):
+        self.running += 1
+        self.maxRunning = max(self.maxRunning, self.running)
+        self.calls.append((key, value))
+        gevent.sleep(value)
+        self.running -= 1
+        return (key, value)
+
+    def test_results_in_request_order(self):
+        """Check results come back in request order regardless of completion order"""
+        entries = [("a", 0.03), ("b", 0.02), ("c", 0.01), ("d", 0)]
+        self.assertEqual(self.dut.execute(entries, self.handler), entries)
+
+    def test_runs_concurrently(self):
+        """Check slow entries don't delay each other"""
+        entries = [(str(i), 0.05) for i in range(0, 8)]
+        start = time.time()
+        self.dut.execute(entries, self.handler)
+        self.assertLess(time.time() - start, 0.2)
+
+    def test_concurrency_limit(self):
+        """Check no more than the configured number of entries run at once"""
+        entries = [(str(i), 0.01) for i in range(0, 20)]
+        self.dut.execute(entries, self.handler)
+        self.assertEqual(self.maxRunning, 4)
+
+    def test_same_key_ordering(self):
+        """Check entries with the same key run one at a time in request order"""
+        entries = [("a", 0.02), ("b", 0), ("a", 0.01), ("a", 0)]
+        self.dut.execute(entries, self.handler)
+        self.assertEqual([call for call in self.calls if call[0] == "a"], [("a", 0.02), ("a", 0.01), ("a", 0)])
+
+    def test_serial(self):
+        """Check a limit of one runs everything in the calling greenlet in order"""
+        dut = BulkExecutor(1)
+        entries = [("a", 0.01), ("b", 0), ("a", 0)]
+        dut.execute(entries, self.handler)
+        self.assertEqual(self.calls, entries)
+        self.assertEqual(self.maxRunning, 1)
+
+    def test_exception(self):
+        """Check the earliest exception is raised after other entries finish"""
+        def handler(key, value):
+            self.calls.append(key)
+            if value is not None:
+                raise value
+        entries = [("a", None), ("b", KeyError("b")), ("c", ValueError("c")), ("b", None), ("d", None)]
+        self.assertRaises(KeyError, self.dut.execute, entries, handler)
+        self.assertEqual(sorted(self.calls), ["a", "b", "c", "d"])
@@ -16,11 +16,13 @@ import unittest
 import json
 import os
 import copy
+import time
+import gevent
 from jsonschema import ValidationError
 from nmoscommon.logger import Logger
 
-from nmosconnection.abstractDevice import StagedLockedException
-from nmosconnection.rtpSender import RtpSender
+from nmosconnection.abstractDevice import StagedLockedException, diffParameters
+from nmosconnection.rtpSender import RtpSender, RtpSenderLeg
 
 API_WS_PORT = 8856
 SENDER_WS_PORT = 8857
@@ -137,6 +139,42 @@ class TestRtpSenderBackend(unittest.TestCase):
         self.assertEqual(schema['source_port']['maximum'], 6000)
         self.assertEqual(schema['source_port']['minimum'], 5000)
 
+    def test_schema_caching(self):
+        """Checks the schema is only rebuilt when the constraints change"""
+        first = self.dut.getParamsValidator(0)
+        self.assertIs(first, self.dut.getParamsValidator(0))
+        self.dut.addInterface("192.168.0.1")
+        second = self.dut.getParamsValidator(0)
+        self.assertIsNot(first, second)
+        self.assertIn("192.168.0.1", self.dut.getParamsSchema(0)['items']['properties']['source_ip']['enum'])
+        self.dut.supportFec(True)
+        self.assertIs(second, self.dut.getParamsValidator(0))
+        self.dut.supportFec(False)
+        self.assertIsNot(second, self.dut.getParamsValidator(0))
+        self.assertNotIn("fec_enabled", self.dut.getParamsSchema(0)['items']['properties'])
+
+    def test_versions(self):
+        """Checks version counters change with staged, active, constraints and transport file"""
+        staged = self.dut.stagedVersion
+        active = self.dut.activeVersion
+        constraints = self.dut.constraintsVersion
+        self.dut.setMasterEnable(True)
+        self.assertNotEqual(staged, self.dut.stagedVersion)
+        staged = self.dut.stagedVersion
+        self.dut.patch([{"destination_port": 5000}])
+        self.assertNotEqual(staged, self.dut.stagedVersion)
+        self.assertEqual(active, self.dut.activeVersion)
+        self.dut.activateStaged()
+        self.assertNotEqual(active, self.dut.activeVersion)
+        self.assertEqual(constraints, self.dut.constraintsVersion)
+        self.dut.addInterface("192.168.0.1")
+        self.assertNotEqual(constraints, self.dut.constraintsVersion)
+        transportFile = self.dut.transportFileVersion
+        self.dut.transportFile = "v=0"
+        self.assertNotEqual(transportFile, self.dut.transportFileVersion)
+        other = RtpSender(self.logger, 2)
+        self.assertNotEqual(other.stagedVersion, self.dut.stagedVersion)
+
     def test_staged_get_json(self):
         """Test all parameters make it to json object"""
         expected = self._getExampleObject()
@@ -149,19 +187,20 @@ class TestRtpSenderBackend(unittest.TestCase):
     def test_disable_fec_json(self):
         """Test that disabling fec prevents FEC being returned in JSON"""
         expected = self._getExampleObject(False)
-        self.dut.staged = copy.deepcopy(expected)
+        staged = copy.deepcopy(expected)
         expected.pop('sender_id')
         for leg in range(0, 2):
-            self.dut.staged[__tp__][leg]['fec_enabled'] = True
-            self.dut.staged[__tp__][leg]['fec_destination_ip'] = "auto"
-            self.dut.staged[__tp__][leg]['fec_block_width'] = 10
-            self.dut.staged[__tp__][leg]['fec_block_height'] = 10
-            self.dut.staged[__tp__][leg]['fec1D_source_port'] = 8081
-            self.dut.staged[__tp__][leg]['fec2D_source_port'] = 8081
-            self.dut.staged[__tp__][leg]['fec_mode'] = "2D"
-            self.dut.staged[__tp__][leg]['fec_type'] = "XOR"
-            self.dut.staged[__tp__][leg]['fec1D_destination_port'] = 8080
-            self.dut.staged[__tp__][leg]['fec2D_destination_port'] = 8080
+            staged[__tp__][leg]['fec_enabled'] = True
+            staged[__tp__][leg]['fec_destination_ip'] = "auto"
+            staged[__tp__][leg]['fec_block_width'] = 10
+            staged[__tp__][leg]['fec_block_height'] = 10
+            staged[__tp__][leg]['fec1D_source_port'] = 8081
+            staged[__tp__][leg]['fec2D_source_port'] = 8081
+            staged[__tp__][leg]['fec_mode'] = "2D"
+            staged[__tp__][leg]['fec_type'] = "XOR"
+            staged[__tp__][leg]['fec1D_destination_port'] = 8080
+            staged[__tp__][leg]['fec2D_destination_port'] = 8080
+        self.dut.staged = staged
         self.dut._enableFec = False
         self.dut._enableRtcp = True
         actual = self.dut._assembleJsonDescription(self.dut.staged)
@@ -171,13 +210,14 @@ class TestRtpSenderBackend(unittest.TestCase):
     def test_disable_rtcp_json(self):
         """Test that disabling rtcp prevents RTCP being returned in JSON"""
         expected = self._getExampleObject(True, False)
-        self.dut.staged = copy.deepcopy(expected)
+        staged = copy.deepcopy(expected)
         expected.pop('sender_id')
         for leg in range(0, 2):
-            self.dut.staged[__tp__][leg]['rtcp_enabled'] = True
-            self.dut.staged[__tp__][leg]['rtcp_destination_ip'] = "192.168.0.1"
-            self.dut.staged[__tp__][leg]['rtcp_destination_port'] = 5000
-            self.dut.staged[__tp__][leg]['rtcp_source_port'] = 5000
+            staged[__tp__][leg]['rtcp_enabled'] = True
+            staged[__tp__][leg]['rtcp_destination_ip'] = "192.168.0.1"
+            staged[__tp__][leg]['rtcp_destination_port'] = 5000
+            staged[__tp__][leg]['rtcp_source_port'] = 5000
+        self.dut.staged = staged
         self.dut._enableFec = True
         self.dut._enableRtcp = False
         actual = self.dut._assembleJsonDescription(self.dut.staged)
@@ -199,8 +239,107 @@ class TestRtpSenderBackend(unittest.TestCase):
     def test_check_sets_callback(self):
         """Test setting the active callback"""
         self.dut.setActivateCallback(self._mockCallback)
+        self.dut.setMasterEnable(True)
         self.dut.activateStaged()
         self.assertTrue(self.hadCallback)
+        self.assertEqual(self.callbackArgs, ())
+
+    def test_delta_callback(self):
+        """Test delta aware callbacks are passed only the changed parameters"""
+        self.dut.setActivateCallback(self._mockCallback, delta=True)
+        self.dut.setMasterEnable(True)
+        self.dut.patch([{}, {"destination_port": 5000}])
+        expected = {
+            "master_enable": True,
+            __tp__: [{}, {
+                "destination_port": 5000,
+                "fec1D_destination_port": 5002,
+                "fec2D_destination_port": 5004,
+                "rtcp_destination_port": 5001
+            }]
+        }
+        self.assertEqual(self.dut.activateStaged(), expected)
+        self.assertEqual(self.callbackArgs, (expected,))
+
+    def test_noop_activation(self):
+        """Test activations that change nothing skip the callback and keep
+        the active parameters"""
+        self.dut.setActivateCallback(self._mockCallback)
+        before = self.dut.active
+        version = self.dut.activeVersion
+        self.assertEqual(self.dut.activateStaged(), {})
+        self.assertFalse(self.hadCallback)
+        self.assertIs(self.dut.active, before)
+        self.assertEqual(self.dut.activeVersion, version)
+
+    def test_incremental_resolution(self):
+        """Test resolvers only run again when their inputs change"""
+        calls = []
+
+        def selector(parameterSet, leg):
+            calls.append(("destination_ip", leg))
+            return "232.0.0.{}".format(leg + 1)
+
+        def rtcpPort(parameterSet, leg):
+            calls.append(("rtcp_destination_port", leg))
+            return parameterSet[leg]['destination_port'] + 1
+
+        self.dut.setDestinationSelector(selector)
+        self.dut._resolveRtcpDestPort = rtcpPort
+        self.dut.activateStaged()
+        # A new selector is a change of input, the port resolver is unaffected
+        self.assertEqual(calls, [("destination_ip", 0), ("destination_ip", 1)])
+        del calls[:]
+        self.dut.setMasterEnable(True)
+        self.dut.activateStaged()
+        self.assertEqual(calls, [])
+        self.dut.patch([{}, {"destination_port": 5000}])
+        self.dut.activateStaged()
+        self.assertEqual(calls, [("destination_ip", 0), ("destination_ip", 1), ("rtcp_destination_port", 1)])
+        self.assertEqual(self.dut.getActiveParameter("rtcp_destination_port", 1), 5001)
+        self.assertEqual(self.dut.getActiveParameter("destination_ip", 1), "232.0.0.2")
+        del calls[:]
+        self.dut.invalidateResolution()
+        self.dut.activateStaged()
+        self.assertEqual(len(calls), 4)
+
+    def test_concurrent_selectors(self):
+        """Test legs are resolved concurrently, and slow selectors fall back"""
+        def selector(parameterSet, leg):
+            gevent.sleep(0.2)
+            return "232.0.0.{}".format(leg + 1)
+
+        self.dut.setDestinationSelector(selector)
+        start = time.time()
+        self.dut.activateStaged()
+        self.assertLess(time.time() - start, 0.35)
+        self.assertEqual(self.dut.getActiveParameter("destination_ip", 1), "232.0.0.2")
+        self.dut.setDestinationSelector(selector, timeout=0.01, fallback=lambda parameterSet, leg: "232.0.1.1")
+        self.dut.activateStaged()
+        self.assertEqual(self.dut.getActiveParameter("destination_ip", 0), "232.0.1.1")
+
+    def test_selectors_see_staged_legs(self):
+        """Test a selector sees the other legs as staged, however far their
+        resolution has got"""
+        seen = []
+
+        def selector(parameterSet, leg):
+            if leg == 0:
+                gevent.sleep(0)
+            seen.append((leg, parameterSet[1 - leg]["destination_ip"]))
+            return "232.0.0.{}".format(leg + 1)
+
+        self.dut.setDestinationSelector(selector)
+        self.dut.activateStaged()
+        self.assertEqual(sorted(seen), [(0, "auto"), (1, "auto")])
+
+    def test_diff_parameters(self):
+        """Test the differences between parameter sets are found per leg and key"""
+        old = {"master_enable": False, __tp__: [{"a": 1, "b": 2}, {"a": 1}]}
+        new = {"master_enable": False, __tp__: [{"a": 1, "b": 3}, {"a": 1}]}
+        self.assertEqual(diffParameters(old, new), {__tp__: [{"b": 3}, {}]})
+        self.assertEqual(diffParameters(old, old), {})
+        self.assertEqual(diffParameters({}, {"master_enable": True}), {"master_enable": True})
 
     def test_patch_locking(self):
         """Test that patch updates cannot be made when the sender is locked"""
@@ -216,10 +355,8 @@ class TestRtpSenderBackend(unittest.TestCase):
         in the event that activation raises an error"""
         preActivationParams = copy.deepcopy(self.dut.active)
         self.dut.setActivateCallback(self._deadlyCallback)
-        self.dut.staged[__tp__][0]['destination_ip'] = "192.168.0.1"
-        self.dut.staged[__tp__][1]['rtp_enabled'] = False
-        self.dut.staged[__tp__][0]['destination_ip'] = "192.168.0.1"
-        self.dut.staged[__tp__][1]['rtp_enabled'] = False
+        self.dut.setStagedParameter("192.168.0.1", 'destination_ip', 0)
+        self.dut.setStagedParameter(False, 'rtp_enabled', 1)
         try:
             self.dut.activateStaged()
         except Exception:
@@ -227,6 +364,38 @@ class TestRtpSenderBackend(unittest.TestCase):
             pass
         self.assertEqual(self.dut.active, preActivationParams)
 
+    def test_rollback_keeps_snapshot(self):
+        """Check a failed activation restores the previous active snapshot
+        itself rather than a copy of it"""
+        before = self.dut.active
+        self.dut.setActivateCallback(self._deadlyCallback)
+        self.dut.setStagedParameter("192.168.0.1", 'destination_ip', 0)
+        self.assertRaises(Exception, self.dut.activateStaged)
+        self.assertIs(self.dut.active, before)
+
+    def test_snapshots_immutable(self):
+        """Check staged and active can't be modified in place, and that
+        updates share unchanged legs with the previous snapshot"""
+        with self.assertRaises(TypeError):
+            self.dut.staged[__tp__][0]['destination_port'] = 5000
+        with self.assertRaises(TypeError):
+            self.dut.active['master_enable'] = True
+        before = self.dut.staged
+        self.dut.patch([{}, {"destination_port": 5000}])
+        self.assertIs(self.dut.staged[__tp__][0], before[__tp__][0])
+        self.assertIsNot(self.dut.staged[__tp__][1], before[__tp__][1])
+        self.assertEqual(before[__tp__][1]['destination_port'], 5004)
+        self.assertEqual(self.dut.staged[__tp__][1]['destination_port'], 5000)
+
+    def test_leg_records(self):
+        """Check legs are stored as compact records in staged and active"""
+        self.dut.setStagedParameter(5000, 'destination_port', 1)
+        self.dut.activateStaged()
+        for params in (self.dut.staged, self.dut.active):
+            for leg in params[__tp__]:
+                self.assertIsInstance(leg, RtpSenderLeg)
+        self.assertEqual(self.dut.getActiveParameter('destination_port', 1), 5000)
+
     def test_set_master_enable(self):
         """Checks that setting master enable on the abstract works"""
         self.dut.setMasterEnable(True)
@@ -254,6 +423,19 @@ class TestRtpSenderBackend(unittest.TestCase):
         actual = constraints[0]['source_ip']['enum']
         self.assertEqual(expected, actual)
 
+    def test_shared_constraints(self):
+        """Check devices with the same constraints share them until one diverges"""
+        other = RtpSender(self.logger, 2)
+        self.assertIs(self.dut._constraints, other._constraints)
+        self.assertIs(self.dut.getConstraints(), other.getConstraints())
+        self.dut.addInterface("192.168.0.1")
+        self.assertIsNot(self.dut._constraints, other._constraints)
+        self.assertEqual(other.getConstraints()[0]['source_ip']['enum'], [])
+        other.addInterface("192.168.0.1")
+        self.assertIs(self.dut._constraints, other._constraints)
+        self.dut.constraints[0]['source_port']['minimum'] = 5000
+        self.assertNotIn('minimum', other.constraints[0]['source_port'])
+
     def test_resolve_default_source_ip(self):
         self.dut.constraints[0]['source_ip']['enum'].append("192.168.0.50")
         expected = "192.168.0.50"
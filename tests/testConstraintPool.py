@@ -0,0 +1,62 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gc
+import unittest
+
+from nmosconnection.constraintPool import ConstraintPool
+
+
+class TestConstraintPool(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = ConstraintPool()
+        self.builds = 0
+
+    def build(self, constraints):
+        self.builds += 1
+        return [dict(leg) for leg in constraints]
+
+    def test_intern(self):
+        """Check equal constraint sets are interned as one read only copy"""
+        first = self.dut.intern([{"source_ip": {"enum": ["auto"]}}])
+        second = self.dut.intern([{"source_ip": {"enum": ["auto"]}}])
+        self.assertIs(first, second)
+        self.assertEqual(len(self.dut), 1)
+        self.assertRaises(TypeError, first[0]["source_ip"]["enum"].append, "192.168.0.1")
+        other = self.dut.intern([{"source_ip": {"enum": ["auto", "192.168.0.1"]}}])
+        self.assertIsNot(first, other)
+
+    def test_document(self):
+        """Check documents are built once for each set and variant"""
+        constraints = self.dut.intern([{"source_ip": {}}])
+        first = self.dut.document(constraints, ("a",), self.build)
+        self.assertIs(first, self.dut.document(constraints, ("a",), self.build))
+        self.assertEqual(self.builds, 1)
+        self.dut.document(constraints, ("b",), self.build)
+        self.assertEqual(self.builds, 2)
+
+    def test_release(self):
+        """Check sets and their documents are released once nothing refers to them"""
+        constraints = self.dut.intern([{"source_ip": {"enum": ["auto"]}}])
+        self.dut.document(constraints, ("a",), self.build)
+        other = self.dut.intern([{"source_ip": {"enum": ["auto", "192.168.0.1"]}}])
+        self.assertEqual(len(self.dut), 2)
+        del constraints
+        gc.collect()
+        self.assertEqual(len(self.dut), 1)
+        self.assertIs(self.dut.intern([{"source_ip": {"enum": ["auto", "192.168.0.1"]}}]), other)
+        self.dut.document(self.dut.intern([{"source_ip": {"enum": ["auto"]}}]), ("a",), self.build)
+        self.assertEqual(self.builds, 2)
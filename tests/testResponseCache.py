@@ -0,0 +1,58 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from nmosconnection.responseCache import ResponseCache, encodeJson
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = ResponseCache()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return encodeJson({"build": self.builds})
+
+    def test_reused_for_same_etag(self):
+        """Check a body is only built once for each ETag"""
+        first = self.dut.get("a", "active", '"1"', self.build)
+        self.assertIs(first, self.dut.get("a", "active", '"1"', self.build))
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(json.loads(first.decode("utf-8")), {"build": 1})
+
+    def test_rebuilt_on_new_etag(self):
+        """Check a new ETag replaces the cached body"""
+        self.dut.get("a", "active", '"1"', self.build)
+        second = self.dut.get("a", "active", '"2"', self.build)
+        self.assertEqual(json.loads(second.decode("utf-8")), {"build": 2})
+        self.dut.get("a", "active", '"2"', self.build)
+        self.assertEqual(self.builds, 2)
+
+    def test_keyed_by_device_and_resource(self):
+        """Check devices and resources don't share entries"""
+        self.dut.get("a", "active", '"1"', self.build)
+        self.dut.get("a", "constraints", '"1"', self.build)
+        self.dut.get("b", "active", '"1"', self.build)
+        self.assertEqual(self.builds, 3)
+
+    def test_discard(self):
+        """Check discarding a device drops its entries"""
+        self.dut.get("a", "active", '"1"', self.build)
+        self.dut.discard("a")
+        self.dut.get("a", "active", '"1"', self.build)
+        self.assertEqual(self.builds, 2)
@@ -17,6 +17,7 @@ import requests
 import os
 import json
 import uuid
+from gevent.lock import RLock
 from jsonschema import ValidationError, validate
 
 from nmoscommon.httpserver import HttpServer
@@ -58,6 +59,9 @@ class MockActivator():
 
     def __init__(self):
         self.updated = False
+        self.lane = RLock()
+        self.lastRequestVersion = 0
+        self.activeRequestVersion = 0
 
     def parseActivationObject(self, obj):
         if obj['test'] == "ok":
@@ -81,6 +85,8 @@ class MockSdpParser():
         self.locked = False
         self.updated = False
         self.toReturn = None
+        self.stagedVersion = 0
+        self.activeVersion = 0
 
     def lock(self):
         self.locked = True
@@ -100,6 +106,13 @@ class MockSdpParser():
         else:
             raise ValidationError("Debug output")
 
+    def stageParsed(self, obj, parsed):
+        if self.locked:
+            raise StagedLockedException
+        self.updated = True
+        self.stagedFile = obj
+        self.parsed = parsed
+
     def getActiveRequest(self):
         return {"activefile": "yes"}
 
@@ -141,6 +154,11 @@ class MockSenderAPI():
         self.updated = False
         self.toReturn = None
         self.masterEnable = True
+        self.stagedVersion = 0
+        self.activeVersion = 0
+        self.constraintsVersion = 0
+        self.transportFileVersion = 0
+        self.transportFile = "sdp"
 
     def setReceiverId(self, id):
         self.receiverId = id
@@ -150,9 +168,10 @@ class MockSenderAPI():
 
     def setMasterEnable(self, state):
         self.masterEnable = state
+        self.stagedVersion += 1
 
     def getConstraints(self):
-        return json.dumps({'constraints': 'constraints'})
+        return {'constraints': 'constraints'}
 
     def stagedToJson(self):
         return self.staged
@@ -311,6 +330,73 @@ class TestRoutes(unittest.TestCase):
         actual = json.loads(r.text)
         self.assertEqual(expected, actual)
 
+    def check_conditional_get(self, url, change):
+        """Check a resource answers 304 while unchanged and a fresh ETag after change()"""
+        r = requests.get(url)
+        self.assertEqual(r.status_code, 200)
+        etag = r.headers['ETag']
+        r = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.headers['ETag'], etag)
+        self.assertEqual(r.text, "")
+        change()
+        r = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r.headers['ETag'], etag)
+
+    def test_constraints_conditional_get(self):
+        """Check constraints are only resent when their version changes"""
+        def change():
+            self.mockApi.constraintsVersion += 1
+        self.check_conditional_get(self.senderRoot + "/constraints/", change)
+
+    def test_constraints_cached(self):
+        """Check the constraints document is only built once per version"""
+        calls = []
+        original = self.mockApi.getConstraints
+
+        def getConstraints():
+            calls.append(True)
+            return original()
+        self.mockApi.getConstraints = getConstraints
+        self.addCleanup(delattr, self.mockApi, "getConstraints")
+        self.mockApi.constraintsVersion += 1
+        for i in range(0, 3):
+            r = requests.get(self.senderRoot + "/constraints/")
+            self.assertEqual(json.loads(r.text), {"constraints": "constraints"})
+            self.assertEqual(r.headers['content-type'], "application/json")
+        self.assertEqual(len(calls), 1)
+        self.mockApi.constraintsVersion += 1
+        requests.get(self.senderRoot + "/constraints/")
+        self.assertEqual(len(calls), 2)
+
+    def test_staged_conditional_get(self):
+        """Check staged parameters are only resent when they change"""
+        self.dut.activators[self.senderUUID] = self.activator
+        self.check_conditional_get(self.senderRoot + "/staged/", lambda: self.mockApi.setMasterEnable(True))
+
+    def test_receiver_staged_conditional_get(self):
+        """Check a new receiver transport file invalidates staged"""
+        self.dut.activators[self.receiverUUID] = self.activator
+
+        def change():
+            self.sdpManager.stagedVersion += 1
+        self.check_conditional_get(self.receiverRoot + "/staged/", change)
+
+    def test_active_conditional_get(self):
+        """Check active parameters are only resent when an activation happens"""
+        self.dut.activators[self.senderUUID] = self.activator
+
+        def change():
+            self.activator.activeRequestVersion += 1
+        self.check_conditional_get(self.senderRoot + "/active/", change)
+
+    def test_transportfile_conditional_get(self):
+        """Check the transport file is only resent when it changes"""
+        def change():
+            self.mockApi.transportFileVersion += 1
+        self.check_conditional_get(self.senderRoot + "/transportfile/", change)
+
     """Tests for /staged"""
 
     def test_sender_staged_params_json_get(self):
@@ -559,6 +645,118 @@ class TestRoutes(unittest.TestCase):
         )
         self.assertEqual(r.status_code, 200)
 
+    def test_bulk_post_statuses(self):
+        """Check bulk statuses are returned in request order, including repeated IDs"""
+        first = "5c7cfb4a-7a31-4b2c-9b0b-7f3e3a9e9f01"
+        second = "5c7cfb4a-7a31-4b2c-9b0b-7f3e3a9e9f02"
+        self.dut.addSender(self.mockApi, first)
+        self.dut.addSender(self.mockApi, second)
+        data = [
+            {"id": first, "params": {"master_enable": True}},
+            {"id": second, "params": {"master_enable": "invalid"}},
+            {"id": first, "params": {"master_enable": False}}
+        ]
+        r = requests.post(
+            self.deviceRoot + "bulk/senders",
+            headers=HEADERS,
+            data=json.dumps(data)
+        )
+        self.assertEqual(r.status_code, 200)
+        expected = [
+            {"id": first, "code": 200},
+            {"id": second, "code": 400},
+            {"id": first, "code": 200}
+        ]
+        self.assertEqual(json.loads(r.text), expected)
+        self.assertEqual(self.mockApi.masterEnable, False)
+
+    def test_bulk_post_missing_params(self):
+        """Check nothing is staged if any bulk entry is malformed"""
+        senderId = "5c7cfb4a-7a31-4b2c-9b0b-7f3e3a9e9f03"
+        self.dut.addSender(self.mockApi, senderId)
+        self.mockApi.masterEnable = True
+        data = [
+            {"id": senderId, "params": {"master_enable": False}},
+            {"id": senderId}
+        ]
+        r = requests.post(
+            self.deviceRoot + "bulk/senders",
+            headers=HEADERS,
+            data=json.dumps(data)
+        )
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(self.mockApi.masterEnable, True)
+
+    def test_bulk_transport_file(self):
+        """Check one transport file is staged and activated on each receiver,
+        with statuses returned in request order"""
+        unknown = "5c7cfb4a-7a31-4b2c-9b0b-7f3e3a9e9f04"
+        self.dut.activators[self.receiverUUID] = self.activator
+        self.dut.transportManagers[self.receiverUUID] = self.sdpManager
+        self.sdpManager.updated = False
+        self.dut.useValidation = False
+        data = {
+            "transport_file": {"type": "application/sdp", "data": EXAMPLE_SDP},
+            "receiver_ids": [self.receiverUUID, unknown],
+            "activation": {"test": "ok"}
+        }
+        r = requests.post(
+            self.deviceRoot + "bulk/receivers/transport_file",
+            headers=HEADERS,
+            data=json.dumps(data)
+        )
+        self.assertEqual(r.status_code, 200)
+        expected = [
+            {"id": self.receiverUUID, "code": 200},
+            {"id": unknown, "code": 404}
+        ]
+        self.assertEqual(json.loads(r.text), expected)
+        self.assertTrue(self.sdpManager.updated)
+        self.assertEqual(self.sdpManager.parsed["sources"][0]["dest"], "232.25.176.223")
+        self.assertRaises(TypeError, self.sdpManager.stagedFile.__setitem__, "data", "")
+        self.assertTrue(self.activator.updated)
+
+    def test_bulk_transport_file_invalid(self):
+        """Check a bad transport file is rejected before any receiver is staged"""
+        self.dut.activators[self.receiverUUID] = self.activator
+        self.dut.transportManagers[self.receiverUUID] = self.sdpManager
+        self.sdpManager.updated = False
+        data = {
+            "transport_file": {"type": "application/sdp", "data": "v=0\nm=video\n"},
+            "receiver_ids": [self.receiverUUID]
+        }
+        r = requests.post(
+            self.deviceRoot + "bulk/receivers/transport_file",
+            headers=HEADERS,
+            data=json.dumps(data)
+        )
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(self.sdpManager.updated)
+        data["transport_file"]["data"] = None
+        r = requests.post(
+            self.deviceRoot + "bulk/receivers/transport_file",
+            headers=HEADERS,
+            data=json.dumps(data)
+        )
+        self.assertEqual(r.status_code, 400)
+        data["transport_file"]["data"] = EXAMPLE_SDP
+        for receiverIds in [self.receiverUUID, [self.receiverUUID, [self.receiverUUID]], [{}]]:
+            data["receiver_ids"] = receiverIds
+            r = requests.post(
+                self.deviceRoot + "bulk/receivers/transport_file",
+                headers=HEADERS,
+                data=json.dumps(data)
+            )
+            self.assertEqual(r.status_code, 400)
+        self.assertFalse(self.sdpManager.updated)
+        del data["receiver_ids"]
+        r = requests.post(
+            self.deviceRoot + "bulk/receivers/transport_file",
+            headers=HEADERS,
+            data=json.dumps(data)
+        )
+        self.assertEqual(r.status_code, 400)
+
     def loadExample(self, exampleFile):
         """Load in an example request from file"""
         resolvedPath = __location__ + "/" + EXAMPLE_PATH + exampleFile
@@ -600,3 +798,14 @@ class TestRoutes(unittest.TestCase):
             data=json.dumps(data)
         )
         self.assertEqual(r.status_code, 400)
+
+
+EXAMPLE_SDP = """v=0
+o=- 1472821477 1472821477 IN IP4 172.29.226.31
+s=NMOS Stream
+t=0 0
+m=video 5000 RTP/AVP 103
+c=IN IP4 232.25.176.223/32
+a=source-filter: incl IN IP4 232.25.176.223 172.29.226.31
+a=rtpmap:103 raw/90000
+"""
@@ -16,9 +16,11 @@ import json
 import unittest
 import os
 import copy
+from jsonschema import ValidationError
 from nmoscommon.logger import Logger
 
 from nmosconnection.rtpReceiver import RtpReceiver
+from nmosconnection.sdpManager import SdpManager, parseSdp
 from nmosconnection.fieldException import FieldException
 
 SENDER_WS_PORT = 8857
@@ -130,6 +132,20 @@ class TestRtpReceiverBackend(unittest.TestCase):
         self.assertEqual(schema['destination_port']['maximum'], 6000)
         self.assertEqual(schema['destination_port']['minimum'], 5000)
 
+    def test_schema_caching(self):
+        """Checks the schema is only rebuilt when the constraints change"""
+        first = self.dut.getParamsValidator(0)
+        self.assertIs(first, self.dut.getParamsValidator(0))
+        self.dut.addInterface("192.168.0.1")
+        second = self.dut.getParamsValidator(0)
+        self.assertIsNot(first, second)
+        self.assertIn("192.168.0.1", self.dut.getParamsSchema(0)['items']['properties']['interface_ip']['enum'])
+        self.dut.supportRtcp(True)
+        self.assertIs(second, self.dut.getParamsValidator(0))
+        self.dut.supportRtcp(False)
+        self.assertIsNot(second, self.dut.getParamsValidator(0))
+        self.assertNotIn("rtcp_enabled", self.dut.getParamsSchema(0)['items']['properties'])
+
     def test_staged_get_json(self):
         """Test all parameters make it to json object"""
         expected = self._getExampleObject()
@@ -142,13 +158,14 @@ class TestRtpReceiverBackend(unittest.TestCase):
     def test_disable_fec_json(self):
         """Test that disabling fec prevents FEC being returned in JSON"""
         expected = self._getExampleObject(False)
-        self.dut.staged = copy.deepcopy(expected)
+        staged = copy.deepcopy(expected)
         for leg in range(0, 2):
-            self.dut.staged[__tp__][leg]['fec_destination_ip'] = "auto"
-            self.dut.staged[__tp__][leg]['fec_enabled'] = True
-            self.dut.staged[__tp__][leg]['fec_mode'] = "2D"
-            self.dut.staged[__tp__][leg]['fec1D_destination_port'] = 8080
-            self.dut.staged[__tp__][leg]['fec2D_destination_port'] = 8080
+            staged[__tp__][leg]['fec_destination_ip'] = "auto"
+            staged[__tp__][leg]['fec_enabled'] = True
+            staged[__tp__][leg]['fec_mode'] = "2D"
+            staged[__tp__][leg]['fec1D_destination_port'] = 8080
+            staged[__tp__][leg]['fec2D_destination_port'] = 8080
+        self.dut.staged = staged
         self.dut._enableFec = False
         self.dut._enableRtcp = True
         actual = self.dut._assembleJsonDescription(self.dut.staged)
@@ -159,11 +176,12 @@ class TestRtpReceiverBackend(unittest.TestCase):
     def test_disable_rtcp_json(self):
         """Test that disabling rtcp prevents RTCP being returned in JSON"""
         expected = self._getExampleObject(True, False)
-        self.dut.staged = copy.deepcopy(expected)
+        staged = copy.deepcopy(expected)
         for leg in range(0, 2):
-            self.dut.staged[__tp__][leg]['rtcp_enabled'] = True
-            self.dut.staged[__tp__][leg]['rtcp_destination_ip'] = "192.168.0.1"
-            self.dut.staged[__tp__][leg]['rtcp_destination_port'] = 5000
+            staged[__tp__][leg]['rtcp_enabled'] = True
+            staged[__tp__][leg]['rtcp_destination_ip'] = "192.168.0.1"
+            staged[__tp__][leg]['rtcp_destination_port'] = 5000
+        self.dut.staged = staged
         self.dut._enableFec = True
         self.dut._enableRtcp = False
         actual = self.dut._assembleJsonDescription(self.dut.staged)
@@ -354,6 +372,73 @@ class TestRtpReceiverBackend(unittest.TestCase):
         actual = self.dut.resolveParameters(data)
         self.assertEqual(actual, expected)
 
+    def test_transport_file_2022_7(self):
+        """Test an ST 2022-7 transport file stages both legs"""
+        dut = RtpReceiver(self.logger, SdpManager, 2)
+        dut.schemaPath = self.dut.schemaPath
+        with open(os.path.join(__location__, "examples", "st2110-20-2022-7.sdp")) as f:
+            dut.transportManagers[0].update({"type": "application/sdp", "data": f.read()})
+        legs = dut.staged[__tp__]
+        self.assertEqual([leg['multicast_ip'] for leg in legs], ["239.100.9.10", "239.101.9.10"])
+        self.assertEqual([leg['source_ip'] for leg in legs], ["192.168.100.2", "192.168.101.2"])
+        self.assertEqual([leg['destination_port'] for leg in legs], [50000, 50020])
+
+    def test_transport_file_noop(self):
+        """Test activating a transport file equivalent to the active one
+        doesn't call the driver"""
+        dut = RtpReceiver(self.logger, SdpManager, 2)
+        dut.schemaPath = self.dut.schemaPath
+        dut.addInterface("192.168.100.1", 0)
+        dut.addInterface("192.168.101.1", 1)
+        dut.setActivateCallback(self._mockCallback)
+        manager = dut.transportManagers[0]
+        with open(os.path.join(__location__, "examples", "st2110-20-2022-7.sdp")) as f:
+            sdp = f.read()
+        manager.update({"type": "application/sdp", "data": sdp})
+        manager.activateStaged()
+        dut.activateStaged()
+        self.assertTrue(self.hadCallback)
+        self.hadCallback = False
+        stagedVersion = dut.stagedVersion
+        manager.update({"type": "application/sdp", "data": sdp.replace("a=recvonly\n", "a=recvonly\r\n")})
+        manager.activateStaged()
+        dut.activateStaged()
+        self.assertEqual(dut.stagedVersion, stagedVersion)
+        self.assertFalse(self.hadCallback)
+
+    def test_transport_file_new_origin(self):
+        """Test restaging an equivalent transport file with a new origin line
+        reports the new file without patching the receiver again"""
+        dut = RtpReceiver(self.logger, SdpManager, 1)
+        dut.schemaPath = self.dut.schemaPath
+        manager = dut.transportManagers[0]
+        with open(os.path.join(__location__, "examples", "st2110-30.sdp")) as f:
+            sdp = f.read()
+        manager.update({"type": "application/sdp", "data": sdp})
+        staged = dut.staged
+        newer = sdp.replace("o=- 1311738121 1311738121", "o=- 1311738121 1311738122")
+        request = {"type": "application/sdp", "data": newer}
+        self.assertFalse(manager.stageParsed(request, parseSdp(self.logger, newer)))
+        self.assertIs(dut.staged, staged)
+        self.assertEqual(manager.getStagedRequest()['data'], newer)
+        manager.activateStaged()
+        self.assertEqual(manager.getActiveRequest()['data'], newer)
+        self.assertEqual(manager.getActiveSdp(), newer)
+
+    def test_transport_file_retry(self):
+        """Test a transport file the receiver rejects isn't recorded as
+        staged, so sending it again is rejected again"""
+        dut = RtpReceiver(self.logger, SdpManager, 2)
+        dut.schemaPath = self.dut.schemaPath
+        manager = dut.transportManagers[0]
+        staged = manager.getStagedRequest()
+        with open(os.path.join(__location__, "examples", "st2110-20-2022-7.sdp")) as f:
+            request = {"type": "application/sdp", "data": f.read().replace("50020", "70000")}
+        for attempt in range(0, 2):
+            self.assertRaises(ValidationError, manager.update, request)
+            self.assertIs(manager.getStagedRequest(), staged)
+            self.assertIsNone(manager.stagedSemantics)
+
 
 class testFieldException(unittest.TestCase):
 
@@ -0,0 +1,84 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import unittest
+import mock
+
+from nmosconnection import scheduler
+from nmosconnection.scheduler import ActivationScheduler
+
+
+class TestActivationScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = ActivationScheduler()
+        self.calls = []
+
+    def callback(self, name):
+        self.calls.append((name, time.time()))
+
+    def test_runs_in_time_order(self):
+        """Check events run in due order regardless of insertion order"""
+        start = time.time()
+        self.dut.schedule(0.06, self.callback, "c")
+        self.dut.schedule(0.02, self.callback, "a")
+        last = self.dut.schedule(0.04, self.callback, "b")
+        self.dut.schedule(0.1, self.callback, "d").wait(1)
+        self.assertTrue(last.finished)
+        self.assertEqual([call[0] for call in self.calls], ["a", "b", "c", "d"])
+        self.assertAlmostEqual(self.calls[0][1] - start, 0.02, 2)
+
+    def test_cancel(self):
+        """Check cancelled events never run"""
+        event = self.dut.schedule(0.02, self.callback, "a")
+        event.cancel()
+        self.assertTrue(event.wait(0))
+        self.dut.schedule(0.04, self.callback, "b").wait(1)
+        self.assertEqual([call[0] for call in self.calls], ["b"])
+        self.assertEqual(len(self.dut), 0)
+
+    def test_single_dispatcher(self):
+        """Check many pending events share a single dispatcher thread"""
+        threads = threading.active_count()
+        events = [self.dut.schedule(3600 + i, self.callback, i) for i in range(0, 100000)]
+        self.assertEqual(len(self.dut), 100000)
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        for event in events[1:]:
+            event.cancel()
+        self.assertEqual(len(self.dut), 1)
+        self.assertLess(len(self.dut._heap), 100)
+        events[0].cancel()
+        self.assertEqual(len(self.dut), 0)
+
+    def test_blocked_callback(self):
+        """Check a callback that blocks doesn't hold up later events"""
+        release = threading.Event()
+        blocked = self.dut.schedule(0, release.wait, 5)
+        self.dut.schedule(0.02, self.callback, "a").wait(1)
+        self.assertEqual([call[0] for call in self.calls], ["a"])
+        self.assertFalse(blocked.finished)
+        release.set()
+        self.assertTrue(blocked.wait(1))
+
+    def test_callback_exception(self):
+        """Check an exception in one callback doesn't stop the dispatcher"""
+        def fail():
+            raise ValueError("fail")
+        with mock.patch.object(scheduler.logger, "exception") as exception:
+            self.dut.schedule(0, fail)
+            self.dut.schedule(0.01, self.callback, "a").wait(1)
+        self.assertEqual([call[0] for call in self.calls], ["a"])
+        self.assertEqual(exception.call_count, 1)
@@ -0,0 +1,194 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import glob
+import unittest
+from jsonschema import FormatChecker, ValidationError
+from jsonschema.validators import validator_for
+from nmoscommon.logger import Logger
+
+from nmosconnection.schemaCompiler import CompiledValidator, compileValidator
+from nmosconnection.rtpSender import RtpSender
+from nmosconnection.rtpReceiver import RtpReceiver
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+SCHEMA_PATH = "../share/ipp-connectionmanagement/schemas/"
+EXAMPLE_PATH = "examples/"
+
+# Values tried in every position of the documents in the corpus
+SAMPLE_VALUES = [
+    None, True, False, 0, 1, -1, 4, 200, 201, 5004, 65535, 65536, 1.5, "",
+    "auto", "Auto", "192.168.0.1", "300.1.1.1", "232.25.176.223", "::1",
+    "2001:db8::1", "2001:0gb8::1", "1D", "2D", "XOR", "12345:0", "12345",
+    "0a174530-e3cf-11e6-bf01-fe55135034f3", "application/sdp", "activate_immediate",
+    "activate_scheduled_absolute", [], {}, [1], {"a": 1}
+]
+
+
+def loadSchemas():
+    schemas = {}
+    for path in sorted(glob.glob(os.path.join(__location__, SCHEMA_PATH, "*.json"))):
+        with open(path) as f:
+            schemas[os.path.basename(path)] = json.load(f)
+    return schemas
+
+
+def loadExamples():
+    examples = []
+    for path in sorted(glob.glob(os.path.join(__location__, EXAMPLE_PATH, "*.json"))):
+        with open(path) as f:
+            examples.append(json.load(f))
+    return examples
+
+
+def schemaValues(schema, found=None):
+    """Collect enum members from a schema so they are tried in the corpus"""
+    if found is None:
+        found = []
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if key == "enum":
+                found.extend(value)
+            else:
+                schemaValues(value, found)
+    elif isinstance(schema, list):
+        for value in schema:
+            schemaValues(value, found)
+    return found
+
+
+def propertyNames(schema, found=None):
+    if found is None:
+        found = set()
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if key == "properties":
+                found.update(value.keys())
+            propertyNames(value, found)
+    elif isinstance(schema, list):
+        for value in schema:
+            propertyNames(value, found)
+    return found
+
+
+def buildCorpus(schema, examples=()):
+    """Build documents for a schema by placing every sample value in every
+    property, both at the top level and inside transport_params legs"""
+    values = SAMPLE_VALUES + schemaValues(schema)
+    names = sorted(propertyNames(schema)) + ["unknown"]
+    corpus = list(values) + list(examples)
+    for name in names:
+        for value in values:
+            leg = {name: value}
+            corpus.append(leg)
+            corpus.append([leg])
+            corpus.append([{}, leg])
+            corpus.append({"transport_params": [leg]})
+            corpus.append({"transport_params": [{}, leg]})
+            corpus.append({"activation": leg})
+            corpus.append({"transport_file": leg})
+    corpus.append([{}, {}, {}])
+    corpus.append({"transport_params": [{}, {}, {}]})
+    corpus.append({"mode": "activate_scheduled_absolute", "requested_time": "1:0", "activation_time": "1:0"})
+    return corpus
+
+
+class TestSchemaCompiler(unittest.TestCase):
+    """Check generated validators agree with jsonschema"""
+
+    def setUp(self):
+        self.formatChecker = FormatChecker(["ipv4", "ipv6"])
+        self.examples = loadExamples()
+
+    def assertEquivalent(self, schema, corpus):
+        reference = validator_for(schema)(schema, format_checker=self.formatChecker)
+        dut = compileValidator(schema, self.formatChecker)
+        self.assertIsInstance(dut, CompiledValidator)
+        invalid = 0
+        for document in corpus:
+            expected = reference.is_valid(document)
+            self.assertEqual(dut.is_valid(document), expected, "Disagreement on {!r}".format(document))
+            if expected:
+                dut.validate(document)
+                continue
+            invalid += 1
+            try:
+                reference.validate(document)
+            except ValidationError as e:
+                expectedError = e
+            with self.assertRaises(ValidationError) as context:
+                dut.validate(document)
+            actualError = context.exception
+            self.assertEqual(actualError.message, expectedError.message)
+            self.assertEqual(list(actualError.path), list(expectedError.path))
+            self.assertEqual(list(actualError.schema_path), list(expectedError.schema_path))
+        return invalid
+
+    def test_bundled_schemas(self):
+        """Run every bundled schema through both validators"""
+        schemas = loadSchemas()
+        self.assertEqual(len(schemas), 6)
+        for name, schema in schemas.items():
+            corpus = buildCorpus(schema, self.examples)
+            invalid = self.assertEquivalent(schema, corpus)
+            self.assertTrue(0 < invalid < len(corpus), name)
+
+    def test_device_schemas(self):
+        """Check schemas with device constraints merged in"""
+        logger = Logger("Connection Management Tests")
+        sender = RtpSender(logger, 2)
+        receiver = RtpReceiver(logger, lambda logger, receiver: None, 2)
+        for device in [sender, receiver]:
+            device.schemaPath = SCHEMA_PATH
+            device.addInterface("192.168.0.1")
+            device.addInterface("::1", 1)
+            device.constraints[0]['destination_port']['minimum'] = 5000
+            device.constraints[0]['destination_port']['maximum'] = 6000
+            device.supportFec(False)
+            device.constraintsChanged()
+            for leg in range(0, 2):
+                schema = device.getParamsSchema(leg)
+                self.assertEquivalent(schema, buildCorpus(schema))
+
+    def test_error_path(self):
+        """Check the failing field is reported in rejected documents"""
+        schema = loadSchemas()["v1.0_sender_transport_params_rtp.json"]
+        dut = compileValidator(schema, self.formatChecker)
+        with self.assertRaises(ValidationError) as context:
+            dut.validate([{}, {"destination_port": "bad"}])
+        self.assertEqual(list(context.exception.path), [1, "destination_port"])
+
+    def test_unsupported_falls_back(self):
+        """Check schemas using unsupported keywords use jsonschema directly"""
+        schema = {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "type": "array",
+            "uniqueItems": True
+        }
+        dut = compileValidator(schema, self.formatChecker)
+        self.assertNotIsInstance(dut, CompiledValidator)
+        self.assertRaises(ValidationError, dut.validate, [1, 1])
+
+    def test_bool_enum(self):
+        """Check booleans aren't treated as numbers in enums"""
+        schema = {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "enum": [1, [0], {"a": False}]
+        }
+        corpus = [1, 1.0, True, [0], [False], {"a": False}, {"a": 0}]
+        self.assertEquivalent(schema, corpus)
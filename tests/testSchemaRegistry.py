@@ -0,0 +1,76 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from jsonschema import ValidationError
+
+from nmosconnection.schemaRegistry import SchemaRegistry
+
+SCHEMA_PATH = "../share/ipp-connectionmanagement/schemas/"
+STAGE_SCHEMA = "v1.0-sender-stage-schema.json"
+
+
+class TestSchemaRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = SchemaRegistry(SCHEMA_PATH)
+
+    def test_validator_is_cached(self):
+        """Check the same compiled validator is returned on repeat requests"""
+        first = self.dut.getValidator(STAGE_SCHEMA)
+        second = self.dut.getValidator(STAGE_SCHEMA)
+        self.assertIs(first, second)
+
+    def test_keyed_by_api_version(self):
+        """Check each API version gets its own entry"""
+        first = self.dut.getValidator(STAGE_SCHEMA, "v1.0")
+        second = self.dut.getValidator(STAGE_SCHEMA, "v1.1")
+        self.assertIsNot(first, second)
+        self.assertEqual(first.schema, second.schema)
+
+    def test_validate(self):
+        """Check requests are validated including IP formats"""
+        self.dut.validate({"master_enable": True}, STAGE_SCHEMA)
+        self.assertRaises(ValidationError, self.dut.validate, {"master_enable": "yes"}, STAGE_SCHEMA)
+        request = {"transport_params": [{"source_ip": "300.1.1.1"}]}
+        self.assertRaises(ValidationError, self.dut.validate, request, STAGE_SCHEMA)
+
+    def test_missing_schema(self):
+        """Check a sensible error is raised for missing schema files"""
+        self.assertRaises(IOError, self.dut.getValidator, "missing.json")
+
+    def test_preload_skips_missing(self):
+        """Check preloading doesn't fail on missing schemas"""
+        self.dut.preload([STAGE_SCHEMA, "missing.json"], ["v1.0", "v1.1"])
+        self.assertEqual(len(self.dut._entries), 2)
+
+    def test_reload_on_change(self):
+        """Check schemas are re-read when the file on disk changes"""
+        tmpDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpDir)
+        path = os.path.join(tmpDir, "test.json")
+        with open(path, "w") as f:
+            json.dump({"type": "integer"}, f)
+        os.utime(path, (1000, 1000))
+        dut = SchemaRegistry(tmpDir + "/")
+        dut.validate(1, "test.json")
+        self.assertIs(dut.getValidator("test.json"), dut.getValidator("test.json"))
+        with open(path, "w") as f:
+            json.dump({"type": "string"}, f)
+        os.utime(path, (2000, 2000))
+        self.assertRaises(ValidationError, dut.validate, 1, "test.json")
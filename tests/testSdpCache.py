@@ -0,0 +1,57 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from nmosconnection.sdpCache import SdpCache
+
+
+class TestSdpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = SdpCache(2)
+        self.parsed = []
+
+    def parse(self, sdp):
+        self.parsed.append(sdp)
+        if sdp == "bad":
+            raise ValueError(sdp)
+        return [{"sdp": sdp}]
+
+    def test_parse_once(self):
+        """Check identical SDP files are only parsed once and share read only sources"""
+        first = self.dut.get("one", self.parse)
+        second = self.dut.get("one", self.parse)
+        self.assertIs(first, second)
+        self.assertEqual(first, [{"sdp": "one"}])
+        self.assertEqual(self.parsed, ["one"])
+        self.assertRaises(TypeError, first[0].__setitem__, "sdp", "two")
+
+    def test_eviction(self):
+        """Check the least recently used entry is evicted"""
+        self.dut.get("one", self.parse)
+        self.dut.get("two", self.parse)
+        self.dut.get("one", self.parse)
+        self.dut.get("three", self.parse)
+        self.assertEqual(len(self.dut), 2)
+        self.dut.get("one", self.parse)
+        self.dut.get("two", self.parse)
+        self.assertEqual(self.parsed, ["one", "two", "three", "two"])
+
+    def test_errors_not_cached(self):
+        self.assertRaises(ValueError, self.dut.get, "bad", self.parse)
+        self.assertRaises(ValueError, self.dut.get, "bad", self.parse)
+        self.assertEqual(len(self.dut), 0)
+        self.assertEqual(self.parsed, ["bad", "bad"])
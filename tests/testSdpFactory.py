@@ -16,6 +16,7 @@ import unittest
 from mock import MagicMock
 
 from nmosconnection.sdpFactory import senderFileFactory
+from nmosconnection.rtpSender import RtpSender
 
 
 class TestSdpFactory(unittest.TestCase):
@@ -74,6 +75,48 @@ class TestSdpFactory(unittest.TestCase):
         self.assertEqual(expected, actual)
 
 
+class TestSdpTemplates(unittest.TestCase):
+    """Test SDP files made from compiled templates"""
+
+    def setUp(self):
+        self.logger = MagicMock(name='logger')
+
+    def makeSender(self, legs=1, fec=False, destination="232.0.0.1"):
+        sender = RtpSender(self.logger, legs)
+        sender.schemaPath = "../share/ipp-connectionmanagement/schemas/"
+        for leg in range(0, legs):
+            sender.addInterface("192.168.{}.1".format(leg), leg)
+            sender.setStagedParameter(destination, "destination_ip", leg)
+        sender.supportFec(fec)
+        if fec:
+            sender.setStagedParameter(True, "fec_enabled")
+        sender.activateStaged()
+        return sender
+
+    def test_matches_blocks(self):
+        """Check templates give the same SDP as concatenating the blocks"""
+        for legs, fec, destination in [(1, False, "232.0.0.1"), (2, False, "232.0.0.1"),
+                                       (1, True, "232.0.0.1"), (2, False, "10.0.0.5")]:
+            factory = senderFileFactory(self.makeSender(legs, fec, destination))
+            self.assertEqual(factory.generateSDP(), factory.buildSDP())
+        self.assertTrue(factory.checkRedundant())
+        self.assertIn("a=mid:RedundantStream", factory.generateSDP())
+
+    def test_cached(self):
+        """Check the SDP is only rebuilt when a parameter it uses changes"""
+        sender = self.makeSender()
+        factory = senderFileFactory(sender)
+        first = factory.generateSDP()
+        sender.setStagedParameter(6001, "source_port")
+        sender.activateStaged()
+        self.assertIs(factory.generateSDP(), first)
+        sender.setStagedParameter(6000, "destination_port")
+        sender.activateStaged()
+        second = factory.generateSDP()
+        self.assertIsNot(second, first)
+        self.assertIn("m=video 6000 RTP/AVP 103", second)
+
+
 RTP_POST_ADDR = """
 a=ts-refclk:ptp=IEEE1588-2008:08-00-11-ff-fe-21-e1-b0
 a=rtpmap:103 raw/90000
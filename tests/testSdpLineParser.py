@@ -0,0 +1,57 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from nmosconnection.sdpLineParser import parseLine, ConnectionLine, MediaLine, AttributeLine
+from nmosconnection.cmExceptions import SdpParseError
+
+
+class TestSdpLineParser(unittest.TestCase):
+
+    def test_connection_line(self):
+        self.assertEqual(parseLine("c=IN IP4 232.25.176.223/32"),
+                         ConnectionLine("IN", "IP4", "232.25.176.223", 1, "32"))
+        self.assertEqual(parseLine("c=IN IP4 232.25.176.223/32/2"),
+                         ConnectionLine("IN", "IP4", "232.25.176.223", "2", "32"))
+        self.assertEqual(parseLine("c=IN IP4 10.0.0.1"),
+                         ConnectionLine("IN", "IP4", "10.0.0.1", 1, 127))
+        self.assertEqual(parseLine("c=IN IP6 ff15::1"),
+                         ConnectionLine("IN", "IP6", "ff15::1", 1, 1))
+
+    def test_media_line(self):
+        self.assertEqual(parseLine("m=video 5000 RTP/AVP 103"),
+                         MediaLine("video", 5000, 1, "RTP/AVP", "103"))
+        self.assertEqual(parseLine("m=audio 5000/2 RTP/AVP 96 97"),
+                         MediaLine("audio", 5000, 2, "RTP/AVP", "96 97"))
+
+    def test_attribute_line(self):
+        self.assertEqual(parseLine("a=source-filter: incl IN IP4 232.25.176.223 172.29.226.31"),
+                         AttributeLine("IN", "IP4", "232.25.176.223", "172.29.226.31"))
+        self.assertEqual(parseLine("a=source-filter: incl IN IP6 ff15::1 2001:db8::1"),
+                         AttributeLine("IN", "IP6", "ff15::1", "2001:db8::1"))
+        self.assertIsNone(parseLine("a=source-filter: excl IN IP4 232.25.176.223 172.29.226.31"))
+        self.assertIsNone(parseLine("a=rtpmap:103 raw/90000"))
+
+    def test_other_lines(self):
+        self.assertIsNone(parseLine("v=0"))
+        self.assertIsNone(parseLine("s="))
+
+    def test_malformed_lines(self):
+        """Check malformed lines raise SdpParseError rather than failing on a missing match"""
+        for line in ["", "x", "video 5000 RTP/AVP 103", "c=IN IP4", "c=IN IPX 10.0.0.1",
+                     "c=IN IP4 10.0.0.1/x", "m=video", "m=film 5000 RTP/AVP 103",
+                     "m=video port RTP/AVP 103", "a=source-filter: incl IN IP4 232.25.176.223"]:
+            self.assertRaises(SdpParseError, parseLine, line)
@@ -12,21 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import unittest
 import copy
+import mock
 from flask import Response
 
 from nmoscommon.webapi import WebAPI, basic_route
 from nmoscommon.logger import Logger
-from nmosconnection.sdpManager import SdpManager
+from nmosconnection.sdpManager import SdpManager, noopCounts, setSdpLimits, sdpLimits, parseSdp
+from nmosconnection.sdpParser import DEFAULT_MAX_SIZE, DEFAULT_MAX_MEDIA
+from nmosconnection.sdpParser import SdpParser
+from nmosconnection.cmExceptions import SdpParseError
 
 TESTING_HTTP_PORT = 8080
 
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
 
 class MockSenderAPI():
     """Mock up of a sender backend API for testing the sender routes"""
 
-    def __init__(self):
+    def __init__(self, legs=1):
+        self.legs = legs
+        self.patches = []
+        self.staged = {}
         self.locked = False
         self.srcIp = ""
         self.destIp = ""
@@ -51,6 +62,13 @@ class MockSenderAPI():
     def getStagedMulticastIp(self):
         return self.multicastIp
 
+    def patch(self, update):
+        self.patches.append(update)
+        self.staged = {"patch": len(self.patches)}
+        for leg, params in enumerate(update):
+            for field, value in params.items():
+                self._setTp(value, field, leg)
+
     def _setTp(self, value, field, leg):
         if field == "source_ip":
             self.sourceIp = value
@@ -87,6 +105,7 @@ class TestSdpManager(unittest.TestCase):
         testObj["type"] = "application/dash+xml"
         testObj['data'] = "test"
         self.assertRaises(ValueError, self.dut.update, testObj)
+        self.assertRaises(ValueError, self.dut.update, {"type": "application/sdp", "data": None})
 
     def test_activate(self):
         """Test the moving of paramers from staged to active"""
@@ -123,6 +142,102 @@ class TestSdpManager(unittest.TestCase):
             "8080"
         )
 
+    def test_fan_out(self):
+        """Test one SDP staged onto many receivers is only parsed once"""
+        parsed = []
+
+        class CountingParser(SdpParser):
+            def parseFile(self, sdp):
+                parsed.append(sdp)
+                SdpParser.parseFile(self, sdp)
+
+        request = {"type": "application/sdp", "data": EXAMPLE_SDP + "a=x-fan-out\n"}
+        managers = [SdpManager(self.logger, MockSenderAPI()) for i in range(0, 200)]
+        with mock.patch("nmosconnection.sdpManager.SdpParser", CountingParser):
+            for manager in managers:
+                manager.update(request)
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual(managers[-1].receiver.getStagedMulticastIp(), "232.25.176.223")
+        self.assertIs(managers[0].stagedSources, managers[-1].stagedSources)
+        self.assertRaises(TypeError, managers[0].stagedSources[0].__setitem__, "port", 0)
+
+    def test_apply_2022_7(self):
+        """Test both legs of an ST 2022-7 SDP are staged in one patch"""
+        interface = MockSenderAPI(2)
+        dut = SdpManager(self.logger, interface)
+        with open(os.path.join(__location__, "examples", "st2110-20-2022-7.sdp")) as f:
+            dut.update({"type": "application/sdp", "data": f.read()})
+        self.assertEqual(interface.patches, [[
+            {"multicast_ip": "239.100.9.10", "destination_port": 50000,
+             "rtp_enabled": True, "source_ip": "192.168.100.2"},
+            {"multicast_ip": "239.101.9.10", "destination_port": 50020,
+             "rtp_enabled": True, "source_ip": "192.168.101.2"}
+        ]])
+
+    def test_oversized(self):
+        """Test oversized SDP files are rejected before they are parsed"""
+        request = {"type": "application/sdp", "data": EXAMPLE_SDP + "a=x-junk\n" * 10000}
+        self.assertRaises(SdpParseError, self.dut.update, request)
+        self.assertEqual(self.interface.patches, [])
+
+    def test_sdp_limits(self):
+        """Test the limits on SDP files can be configured"""
+        with open(os.path.join(__location__, "examples", "st2110-20-2022-7.sdp")) as f:
+            request = {"type": "application/sdp", "data": f.read()}
+        try:
+            setSdpLimits(maxMedia=1)
+            self.assertEqual(sdpLimits["maxSize"], DEFAULT_MAX_SIZE)
+            self.assertRaises(SdpParseError, self.dut.update, request)
+            setSdpLimits(maxSize=len(request["data"]) - 1, maxMedia=DEFAULT_MAX_MEDIA)
+            self.assertRaises(SdpParseError, self.dut.update, request)
+            setSdpLimits(maxSize=DEFAULT_MAX_SIZE)
+            self.dut.update(request)
+        finally:
+            setSdpLimits(DEFAULT_MAX_SIZE, maxMedia=DEFAULT_MAX_MEDIA)
+        self.assertEqual(len(self.interface.patches), 1)
+
+    def test_noop_update(self):
+        """Test an equivalent SDP isn't applied to the receiver again unless
+        the receiver's staged parameters have changed since the last one,
+        but is still staged"""
+        staged = noopCounts["staged"]
+        request = {"type": "application/sdp", "data": EXAMPLE_SDP}
+        self.dut.update(request)
+        version = self.dut.stagedVersion
+        self.assertFalse(self.dut.stageParsed(dict(request), parseSdp(self.logger, EXAMPLE_SDP)))
+        self.assertEqual(self.dut.stagedVersion, version)
+        equivalent = {"type": "application/sdp", "data": EXAMPLE_SDP.replace("1472821477", "1472821478")}
+        self.dut.update(equivalent)
+        self.assertEqual(len(self.interface.patches), 1)
+        self.assertNotEqual(self.dut.stagedVersion, version)
+        self.assertIs(self.dut.getStagedRequest(), equivalent)
+        self.assertEqual(self.dut.getStagedSdp(), equivalent["data"])
+        self.assertEqual(noopCounts["staged"], staged + 2)
+        self.interface.staged = {}
+        self.dut.update(equivalent)
+        self.assertEqual(len(self.interface.patches), 2)
+
+    def test_noop_activation(self):
+        """Test activating an SDP equivalent to the active one is counted,
+        and keeps the active version unless the file has changed"""
+        activated = noopCounts["activated"]
+        request = {"type": "application/sdp", "data": EXAMPLE_SDP}
+        self.dut.update(request)
+        self.dut.activateStaged()
+        version = self.dut.activeVersion
+        self.dut.update(dict(request))
+        self.dut.lock()
+        self.dut.activateStaged()
+        self.assertFalse(self.dut.stageLocked)
+        self.assertEqual(self.dut.activeVersion, version)
+        equivalent = {"type": "application/sdp", "data": EXAMPLE_SDP.replace("1472821477", "1472821478")}
+        self.dut.update(equivalent)
+        self.dut.activateStaged()
+        self.assertNotEqual(self.dut.activeVersion, version)
+        self.assertIs(self.dut.getActiveRequest(), equivalent)
+        self.assertEqual(self.dut.getActiveSdp(), equivalent["data"])
+        self.assertEqual(noopCounts["activated"], activated + 2)
+
     def test_get_staged(self):
         self.dut.stagedSdp = EXAMPLE_SDP
         self.assertEqual(EXAMPLE_SDP, self.dut.getStagedSdp())
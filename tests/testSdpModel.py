@@ -0,0 +1,82 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import unittest
+
+from nmosconnection.sdpParser import SdpParser
+from nmosconnection.sdpModel import RtpMap, Group
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+
+class TestSdpModel(unittest.TestCase):
+
+    def parse(self, name=None, sdp=None):
+        if name is not None:
+            with open(os.path.join(__location__, "examples", name)) as f:
+                sdp = f.read()
+        parser = SdpParser(None)
+        parser.parseFile(sdp)
+        return parser.session
+
+    def test_session(self):
+        session = self.parse("st2110-20-2022-7.sdp")
+        self.assertEqual(session.version, "0")
+        self.assertEqual(session.name, "st2110 video 1080i59.94 with 2022-7")
+        self.assertEqual(session.groups, [Group("DUP", ["primary", "secondary"])])
+        self.assertIsNone(session.attribute("recvonly"))
+        self.assertRaises(KeyError, session.attribute, "sendonly")
+        self.assertEqual(len(session.media), 2)
+
+    def test_media(self):
+        media = self.parse("st2110-20-2022-7.sdp").media[1]
+        self.assertEqual(media.mid, "secondary")
+        self.assertEqual(media.connection.addr, "239.101.9.10")
+        self.assertEqual(media.sourceFilter.dest, "239.101.9.10")
+        self.assertEqual(media.rtpmap, RtpMap("96", "raw", 90000, None))
+        self.assertEqual(media.fmtp["width"], "1920")
+        self.assertEqual(media.fmtp["exactframerate"], "30000/1001")
+        self.assertIn("interlace", media.fmtp)
+        self.assertIsNone(media.fmtp["interlace"])
+
+    def test_audio(self):
+        media = self.parse("st2110-30.sdp").media[0]
+        self.assertEqual(media.rtpmap, RtpMap("97", "L24", 48000, "8"))
+        self.assertEqual(media.attribute("ptime"), "1")
+
+    def test_dup_leg_order(self):
+        """Check legs follow the order of the DUP group rather than the file"""
+        with open(os.path.join(__location__, "examples", "st2110-20-2022-7.sdp")) as f:
+            sdp = f.read()
+        sdp = sdp.replace("a=group:DUP primary secondary", "a=group:DUP secondary primary")
+        session = self.parse(sdp=sdp)
+        self.assertEqual([media.mid for media in session.legs()], ["secondary", "primary"])
+        self.assertEqual(session.sources()[0]["dest"], "239.101.9.10")
+
+    def test_semantics(self):
+        """Check files that only differ in origin, attribute order or
+        whitespace have the same semantics"""
+        with open(os.path.join(__location__, "examples", "st2110-30.sdp")) as f:
+            sdp = f.read()
+        lines = sdp.splitlines()
+        attributes = [index for index, line in enumerate(lines) if line.startswith("a=")][-2:]
+        lines[attributes[0]], lines[attributes[1]] = lines[attributes[1]], lines[attributes[0]]
+        equivalent = "\r\n".join(lines).replace("o=-", "o=- 1").replace(":97 ", ":97  ")
+        semantics = self.parse(sdp=sdp).semantics()
+        self.assertEqual(self.parse(sdp=equivalent).semantics(), semantics)
+        self.assertEqual(hash(self.parse(sdp=equivalent).semantics()), hash(semantics))
+        self.assertNotEqual(self.parse(sdp=sdp.replace("ptime:1", "ptime:0.125")).semantics(), semantics)
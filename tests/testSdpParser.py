@@ -12,13 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import unittest
 from nmoscommon.logger import Logger
 
 from nmosconnection.sdpParser import SdpParser
+from nmosconnection.cmExceptions import SdpParseError
 
 TESTING_HTTP_PORT = 8080
 
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
 
 class TestSdpParser(unittest.TestCase):
 
@@ -42,6 +47,72 @@ class TestSdpParser(unittest.TestCase):
         self.dut.parseFile(EXAMPLE_SDP_BLANKS)
         self.checkSdpResult(self.dut.sources)
 
+    def test_sdp_parsing_2022_7(self):
+        """Test both legs of an ST 2022-7 SDP are found"""
+        self.dut.parseFile(loadExample("st2110-20-2022-7.sdp"))
+        self.assertEqual(self.dut.sources, [
+            {"port": 50000, "dest": "239.100.9.10", "source": "192.168.100.2"},
+            {"port": 50020, "dest": "239.101.9.10", "source": "192.168.101.2"}
+        ])
+
+    def test_sdp_parsing_session_connection(self):
+        """Test session level connection and source filter apply to the media"""
+        self.dut.parseFile(loadExample("st2110-40.sdp"))
+        self.assertEqual(self.dut.sources, [
+            {"port": 50040, "dest": "239.100.9.20", "source": "192.168.100.2"}
+        ])
+
+    def test_sdp_parsing_malformed(self):
+        """Test malformed lines raise SdpParseError"""
+        self.assertRaises(SdpParseError, self.dut.parseFile, EXAMPLE_SDP.replace("m=video 5000", "m=video"))
+        self.assertRaises(SdpParseError, self.dut.parseFile, EXAMPLE_SDP + "garbage\n")
+
+    def test_sdp_streaming(self):
+        """Test an SDP fed as byte chunks, split mid line, gives the same result"""
+        sdp = loadExample("st2110-20-2022-7.sdp").replace("\n", "\r\n").encode("utf-8")
+        chunks = [sdp[i:i + 7] for i in range(0, len(sdp), 7)]
+        media = []
+        for each in self.dut.iterMedia(chunks):
+            # Each media description is complete when it is handed out
+            self.assertIsNotNone(each.mid)
+            media.append(each)
+        self.assertEqual([each.mid for each in media], ["primary", "secondary"])
+        reference = SdpParser(self.logger)
+        reference.parseFile(loadExample("st2110-20-2022-7.sdp"))
+        self.assertEqual(self.dut.sources, reference.sources)
+
+    def test_sdp_streaming_first_media(self):
+        """Test media descriptions are handed out as soon as the next one starts"""
+        sdp = loadExample("st2110-20-2022-7.sdp")
+        split = sdp.index("m=", sdp.index("m=") + 1) + 2
+        media = self.dut.iterMedia([sdp[:split], sdp[split:]])
+        self.assertEqual(next(media).mid, "primary")
+        self.assertEqual(len(self.dut.session.media), 2)
+        self.assertEqual(next(media).mid, "secondary")
+
+    def test_sdp_limits(self):
+        """Test oversized SDP files are rejected"""
+        dut = SdpParser(self.logger, maxSize=len(EXAMPLE_SDP) - 1)
+        self.assertRaises(SdpParseError, dut.parseFile, EXAMPLE_SDP)
+        dut = SdpParser(self.logger, maxLineLength=80)
+        self.assertRaises(SdpParseError, dut.parseFile, EXAMPLE_SDP)
+        dut = SdpParser(self.logger, maxLineLength=80)
+        self.assertRaises(SdpParseError, dut.feed, "v=0\ns=" + "x" * 100)
+        dut = SdpParser(self.logger, maxMedia=1)
+        self.assertRaises(SdpParseError, dut.parseFile, loadExample("st2110-20-2022-7.sdp"))
+        self.assertRaises(SdpParseError, self.dut.parseFile, b"v=0\ns=\xff\n")
+        # Sizes are in bytes of UTF-8, whether the file is text or bytes
+        named = EXAMPLE_SDP.replace("s=", u"s=\u00e9", 1)
+        dut = SdpParser(self.logger, maxSize=len(named))
+        self.assertRaises(SdpParseError, dut.parseFile, named)
+        dut = SdpParser(self.logger, maxSize=len(named) + 1)
+        dut.parseFile(named)
+
+
+def loadExample(name):
+    with open(os.path.join(__location__, "examples", name)) as f:
+        return f.read()
+
 
 EXAMPLE_SDP = """v=0
 o=- 1472821477 1472821477 IN IP4 172.29.226.31
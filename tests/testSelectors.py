@@ -0,0 +1,65 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+import gevent
+from gevent.event import AsyncResult
+
+from nmosconnection.selectors import Selector, SelectorTimeout
+
+
+def slow(parameterSet, leg):
+    gevent.sleep(1)
+    return "232.0.0.1"
+
+
+def fallback(parameterSet, leg):
+    return "232.0.0.2"
+
+
+def failing(parameterSet, leg):
+    raise ValueError("no address")
+
+
+class TestSelector(unittest.TestCase):
+
+    def test_plain(self):
+        """Check plain selectors are called directly"""
+        dut = Selector(lambda parameterSet, leg: "232.0.0.{}".format(leg))
+        self.assertEqual(dut({}, 3), "232.0.0.3")
+
+    def test_timeout_fallback(self):
+        """Check the fallback is used when a selector takes too long"""
+        dut = Selector(slow, timeout=0.01, fallback=fallback)
+        self.assertEqual(dut({}, 0), "232.0.0.2")
+
+    def test_timeout(self):
+        """Check a timeout without a fallback is an error"""
+        dut = Selector(slow, timeout=0.01)
+        self.assertRaises(SelectorTimeout, dut, {}, 0)
+
+    def test_error_fallback(self):
+        """Check the fallback is used when a selector raises"""
+        self.assertEqual(Selector(failing, fallback=fallback)({}, 0), "232.0.0.2")
+        self.assertRaises(ValueError, Selector(failing), {}, 0)
+
+    def test_async_result(self):
+        """Check selectors may return an AsyncResult to be waited on"""
+        result = AsyncResult()
+        gevent.spawn_later(0.01, result.set, "232.0.0.5")
+        dut = Selector(lambda parameterSet, leg: result, timeout=1)
+        self.assertEqual(dut({}, 0), "232.0.0.5")
+        pending = Selector(lambda parameterSet, leg: AsyncResult(), timeout=0.01, fallback=fallback)
+        self.assertEqual(pending({}, 0), "232.0.0.2")
@@ -0,0 +1,95 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import copy
+import json
+import unittest
+
+from nmosconnection.snapshot import FrozenRecord, freeze, thaw, setIn
+
+
+class Leg(FrozenRecord):
+    __slots__ = ('x', 'y')
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {"a": 1, "legs": [{"x": 1}, {"x": 2}]}
+        self.dut = freeze(self.data)
+
+    def test_reads_as_plain(self):
+        """Check snapshots compare and serialise like the original"""
+        self.assertEqual(self.dut, self.data)
+        self.assertEqual(json.loads(json.dumps(self.dut)), self.data)
+
+    def test_immutable(self):
+        """Check every mutating operation is refused"""
+        self.assertRaises(TypeError, self.dut.__setitem__, "a", 2)
+        self.assertRaises(TypeError, self.dut.pop, "a")
+        self.assertRaises(TypeError, self.dut.update, {})
+        self.assertRaises(TypeError, self.dut["legs"].append, {})
+        self.assertRaises(TypeError, self.dut["legs"][0].__setitem__, "x", 3)
+
+    def test_set_in_shares(self):
+        """Check setIn copies only the path it changes"""
+        updated = setIn(self.dut, ["legs", 1, "x"], 5)
+        self.assertEqual(updated["legs"][1]["x"], 5)
+        self.assertEqual(self.dut["legs"][1]["x"], 2)
+        self.assertIs(updated["legs"][0], self.dut["legs"][0])
+        self.assertIs(freeze(self.dut), self.dut)
+
+    def test_thaw(self):
+        """Check thawed and deep copied snapshots are mutable plain types"""
+        for mutable in (thaw(self.dut), copy.deepcopy(self.dut)):
+            self.assertIs(type(mutable), dict)
+            mutable["legs"][0]["x"] = 3
+            self.assertEqual(self.dut["legs"][0]["x"], 1)
+
+
+class TestFrozenRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = Leg({"x": 1, "y": 2})
+
+    def test_reads_as_mapping(self):
+        """Check records behave like a read only dict"""
+        self.assertEqual(self.dut, {"x": 1, "y": 2})
+        self.assertEqual(list(self.dut), ["x", "y"])
+        self.assertEqual(self.dut["y"], 2)
+        self.assertNotIn("replace", self.dut)
+        self.assertRaises(KeyError, self.dut.__getitem__, "replace")
+        self.assertFalse(hasattr(self.dut, "__dict__"))
+
+    def test_immutable(self):
+        """Check records can't be modified"""
+        self.assertRaises(TypeError, self.dut.__setitem__, "x", 2)
+        self.assertRaises(TypeError, setattr, self.dut, "x", 2)
+
+    def test_from_mapping(self):
+        """Check only mappings with exactly the record's keys become records"""
+        self.assertIs(Leg.fromMapping(self.dut), self.dut)
+        self.assertIsInstance(Leg.fromMapping({"x": 1, "y": 2}), Leg)
+        self.assertNotIsInstance(Leg.fromMapping({"x": 1}), Leg)
+        self.assertRaises(KeyError, Leg, {"x": 1})
+
+    def test_set_in(self):
+        """Check setIn replaces record fields and thaw gives a dict"""
+        snapshot = freeze({"legs": [self.dut]})
+        updated = setIn(snapshot, ["legs", 0, "y"], 3)
+        self.assertIsInstance(updated["legs"][0], Leg)
+        self.assertEqual(updated["legs"][0]["y"], 3)
+        self.assertEqual(self.dut["y"], 2)
+        self.assertEqual(thaw(updated), {"legs": [{"x": 1, "y": 3}]})
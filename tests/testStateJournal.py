@@ -0,0 +1,139 @@
+# Copyright 2017 British Broadcasting Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from nmoscommon.logger import Logger
+from nmosconnection import api
+from nmosconnection.api import ConnectionManagementAPI
+from nmosconnection.rtpSender import RtpSender
+from nmosconnection.stateJournal import StateJournal
+
+SCHEMA_PATH = "../share/ipp-connectionmanagement/schemas/"
+ACTIVATION_SCHEMA_PATH = "share/ipp-connectionmanagement/schemas/"
+SENDER_ID = "8358af5c-6d82-4ef8-b992-13ed40a7246d"
+
+
+class TestStateJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, "state.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def reopen(self, dut, **kwargs):
+        dut.close()
+        return StateJournal(self.path, **kwargs)
+
+    def test_record_take(self):
+        """Check the latest state of each device survives a reopen and is only handed out once"""
+        dut = StateJournal(self.path)
+        dut.record("a", {"value": 1})
+        dut.record("b", {"value": 2})
+        dut.record("a", {"value": 3})
+        dut = self.reopen(dut)
+        self.assertEqual(len(dut), 2)
+        self.assertEqual(dut.take("a"), {"value": 3})
+        self.assertEqual(dut.take("b"), {"value": 2})
+        self.assertIsNone(dut.take("a"))
+        self.assertIsNone(dut.take("c"))
+        dut.close()
+
+    def test_remove(self):
+        """Check removed devices aren't restored"""
+        dut = StateJournal(self.path)
+        dut.record("a", {"value": 1})
+        dut.remove("a")
+        dut = self.reopen(dut)
+        self.assertIsNone(dut.take("a"))
+        dut.close()
+
+    def test_compaction(self):
+        """Check the journal is folded into the snapshot file as it grows"""
+        dut = StateJournal(self.path, compactEvery=3)
+        dut.record("a", {"value": 1})
+        dut.record("b", {"value": 2})
+        dut.remove("b")
+        self.assertEqual(os.path.getsize(self.path), 0)
+        dut.record("a", {"value": 4})
+        dut = self.reopen(dut)
+        self.assertEqual(dut.take("a"), {"value": 4})
+        self.assertIsNone(dut.take("b"))
+        dut.compact()
+        dut = self.reopen(dut)
+        self.assertEqual(len(dut), 1)
+        with open(self.path + ".snapshot", "rb") as f:
+            self.assertEqual(f.read().count(b"\n"), 1)
+        dut.close()
+
+    def test_torn_record(self):
+        """Check a partly written final record is ignored"""
+        dut = StateJournal(self.path)
+        dut.record("a", {"value": 1})
+        dut.close()
+        with open(self.path, "ab") as f:
+            f.write(b'a\t{"val')
+        dut = StateJournal(self.path)
+        self.assertEqual(dut.take("a"), {"value": 1})
+        dut.close()
+
+    def test_api_restore(self):
+        """Check staged and active parameters are restored when a device is
+        added again after a restart"""
+        logger = Logger("conmanage")
+        with mock.patch.dict(api._config, {"state_journal": self.path}):
+            first = ConnectionManagementAPI(logger)
+            first.useValidation = False
+            sender = RtpSender(logger, 2)
+            sender.schemaPath = SCHEMA_PATH
+            sender.addInterface("192.168.0.1", 0)
+            sender.addInterface("192.168.1.1", 1)
+            first.addSender(sender, SENDER_ID).schemaPath = ACTIVATION_SCHEMA_PATH
+            params = {
+                "master_enable": True,
+                "transport_params": [{"destination_ip": "232.0.0.1"}, {}],
+                "activation": {"mode": "activate_immediate"}
+            }
+            first.staged_patch("v1.0", "senders", SENDER_ID, params)
+            first.journal.close()
+
+            second = ConnectionManagementAPI(logger)
+            restarted = RtpSender(logger, 2)
+            restarted.schemaPath = SCHEMA_PATH
+            restarted.addInterface("192.168.0.1", 0)
+            restarted.addInterface("192.168.1.1", 1)
+            second.addSender(restarted, SENDER_ID)
+            self.assertEqual(restarted.active, sender.active)
+            self.assertEqual(restarted.staged, sender.staged)
+            self.assertEqual(restarted.transportFile, sender.transportFile)
+            self.assertEqual(second.activators[SENDER_ID].getActiveRequest(),
+                             first.activators[SENDER_ID].getActiveRequest())
+            self.assertTrue(restarted.active["master_enable"])
+
+            # Restoring doesn't count as a change to record
+            size = os.path.getsize(self.path)
+            second.saveState(SENDER_ID)
+            self.assertEqual(os.path.getsize(self.path), size)
+            second.removeSender(SENDER_ID)
+            second.journal.close()
+            journal = StateJournal(self.path)
+            self.addCleanup(journal.close)
+            self.assertIsNone(journal.take(SENDER_ID))